@@ -0,0 +1,29 @@
+from functools import partial
+
+import pytest
+
+from yt_dlp_plugins.webkit_jsi.lib import sim_objc
+from yt_dlp_plugins.webkit_jsi.lib.api import get_gen
+from yt_dlp_plugins.webkit_jsi.lib.easy import WKJSE_Factory
+from yt_dlp_plugins.webkit_jsi.lib.logging import DefaultLoggerImpl
+from yt_dlp_plugins.webkit_jsi.lib.sim import SIM_ENGINE_TYPE, _default_engine, get_sim_gen
+
+
+@pytest.fixture(params=['sim', 'sim-objc'])
+def factory(request):
+    """
+    Makes a WKJSE_Factory on a simulated backend, `engine` and `latency` are the same as for sim.get_sim_gen.
+    With sim-objc, every object the backend handed out has to be freed by the end of the test
+    """
+    backends: list[sim_objc.SimObjCBackend] = []
+
+    def make(engine: SIM_ENGINE_TYPE = _default_engine, *, latency: float = 0.0, **kwargs) -> WKJSE_Factory:
+        if request.param == 'sim':
+            return WKJSE_Factory(DefaultLoggerImpl(), gen_factory=partial(get_sim_gen, engine=engine, latency=latency), **kwargs)
+        backend = sim_objc.SimObjCBackend(engine=engine, latency=latency)
+        backends.append(backend)
+        return WKJSE_Factory(DefaultLoggerImpl(), gen_factory=partial(get_gen, backend=backend), **kwargs)
+
+    yield make
+    for backend in backends:
+        assert backend.live_objects() == 0
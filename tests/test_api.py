@@ -0,0 +1,52 @@
+import sys
+
+from ctypes import c_char_p, c_ulong
+
+from yt_dlp_plugins.webkit_jsi.lib import sim_objc
+from yt_dlp_plugins.webkit_jsi.lib.api import _utf8_of, str_from_nsstring
+from yt_dlp_plugins.webkit_jsi.lib.easy import WKJSE_Webview
+from yt_dlp_plugins.webkit_jsi.lib.logging import DefaultLoggerImpl
+from yt_dlp_plugins.webkit_jsi.lib.pyneapple_objc import PyNeApple
+
+
+class BindRecordingPyNeApple(PyNeApple):
+    __slots__ = ('binds',)
+
+    def bind_message(self, sel_name: bytes, **kwargs):
+        self.binds.append(sel_name)
+        return super().bind_message(sel_name, **kwargs)
+
+
+def test_scripts_round_trip(factory):
+    with factory(lambda wv, script: script) as send, WKJSE_Webview(send) as wv:
+        for script in ('', 'ascii', 'héllo ✓ wörld 🎉', 'x' * (1 << 20)):
+            assert wv.execute_js(script) == script
+
+
+def test_utf8_of_leaves_no_copy_behind():
+    ascii_str = ''.join(['ascii'] * 1000)
+    data, size = _utf8_of(ascii_str)
+    assert size == len(ascii_str)
+    other = ''.join(['wörld'] * 1000)
+    before = sys.getsizeof(other)
+    data, size = _utf8_of(other)
+    assert data == other.encode() and size == len(data)
+    # PyUnicode_AsUTF8AndSize would have cached the UTF-8 on the string
+    assert sys.getsizeof(other) == before
+
+
+def test_hot_messages_are_bound_once():
+    backend = sim_objc.SimObjCBackend()
+    pa = BindRecordingPyNeApple(DefaultLoggerImpl(), backend=backend)
+    pa.binds = []
+    with pa:
+        pa.binds.clear()
+        NSString = pa.safe_objc_getClass(b'NSString')
+        nsstr = pa.safe_new_object(
+            NSString, b'initWithBytes:length:encoding:', b'abc', 3, 4, argtypes=(c_char_p, c_ulong, c_ulong))
+        for _ in range(3):
+            assert str_from_nsstring(pa, nsstr) == 'abc'
+            assert pa.instanceof(nsstr, NSString)
+        pa.release_obj(nsstr)
+        assert pa.binds == []
+    assert backend.live_objects() == 0
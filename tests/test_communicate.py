@@ -0,0 +1,62 @@
+import pytest
+
+from yt_dlp_plugins.webkit_jsi.lib.api import NullTag, WKJS_LogType, WKJS_UncaughtException
+from yt_dlp_plugins.webkit_jsi.lib.easy import WKJSE_Webview, log_records
+
+
+def engine(wv, script):
+    if script == 'many':
+        return wv.communicate_many(['a', 'b', 'c'])
+    if script == 'none':
+        return wv.communicate_many([])
+    if script.startswith('log '):
+        for arg in script.split()[1:]:
+            wv.log(WKJS_LogType.INFO, arg)
+        return None
+    return wv.communicate(script)
+
+
+def test_communicate(factory):
+    with factory(engine) as send, WKJSE_Webview(send) as wv:
+        with pytest.raises(WKJS_UncaughtException):
+            wv.execute_js('x')
+        wv.on_script_comm(lambda x, reply: reply(None, 'no y') if x == 'y' else reply({'got': x, 'ok': True}, None))
+        assert wv.execute_js('x') == {'got': 'x', 'ok': True}
+        with pytest.raises(WKJS_UncaughtException):
+            wv.execute_js('y')
+
+
+def test_communicate_reply_edges(factory):
+    with factory(engine) as send, WKJSE_Webview(send) as wv:
+        # a result from execute_js can be handed back as is, NullTag included
+        wv.on_script_comm(lambda x, reply: reply([NullTag, -(1 << 63)], None))
+        assert wv.execute_js('x') == [NullTag, -(1 << 63)]
+
+
+def test_communicate_many(factory):
+    with factory(engine) as send, WKJSE_Webview(send) as wv:
+        calls = []
+        wv.on_script_comm(lambda x, reply: (calls.append(x), reply(x * 2, None)))
+        # without a communicateMany handler, each element goes to the communicate one
+        assert wv.execute_js('many') == ['aa', 'bb', 'cc']
+        assert calls == ['a', 'b', 'c']
+        assert wv.execute_js('none') == []
+
+        batches = []
+        wv.on_script_comm_many(lambda xs, reply: (batches.append(xs), reply([len(xs), 'done'], None)))
+        assert wv.execute_js('many') == [3, 'done']
+        assert batches == [['a', 'b', 'c']]
+        assert calls == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('log_batch', [0, 2])
+def test_log_batch(factory, log_batch):
+    with factory(engine, log_batch=log_batch) as send, WKJSE_Webview(send) as wv:
+        msgs = []
+        wv.on_script_log(msgs.append)
+        wv.execute_js('log a b c')
+        assert [record['argsArr'] for msg in msgs for record in log_records(msg)] == [['a'], ['b'], ['c']]
+        # batches are posted once full, and what's left once the script is done
+        assert [len(log_records(msg)) for msg in msgs] == ([1, 1, 1] if not log_batch else [2, 1])
+        if not log_batch:
+            assert all(isinstance(msg, dict) for msg in msgs)
@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from yt_dlp_plugins.webkit_jsi.lib.api import WKJS_Dispatcher, WKJS_LogType, WKJS_Task
+from yt_dlp_plugins.webkit_jsi.lib.easy import WKJSE_Webview
+
+
+def engine(wv, script):
+    if script == 'log':
+        wv.log(WKJS_LogType.INFO, 'from the script')
+    return script
+
+
+def run_workers(dispatcher: WKJS_Dispatcher, n: int, work) -> tuple[list, float]:
+    """
+    Runs `work(webview, i)` on `n` threads, each with its own webview, while this thread serves `dispatcher`.
+    Returns what they returned and the seconds from when they all had their webview until the last one was done
+    """
+    results: list = [None] * n
+    errors: list[BaseException] = []
+    timings: list[float] = []
+    barrier = threading.Barrier(n + 1)
+    done = threading.Barrier(n + 1)
+
+    def worker(i: int):
+        try:
+            with WKJSE_Webview(dispatcher) as wv:
+                barrier.wait()
+                results[i] = work(wv, i)
+                done.wait()
+        except BaseException as e:
+            errors.append(e)
+            barrier.abort()
+            done.abort()
+
+    def timer():
+        try:
+            barrier.wait()
+            start = time.monotonic()
+            done.wait()
+            timings.append(time.monotonic() - start)
+        except threading.BrokenBarrierError:
+            pass
+        finally:
+            for thread in threads:
+                thread.join()
+            dispatcher.close()
+
+    threads = [threading.Thread(target=worker, args=(i, )) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    timer_thread = threading.Thread(target=timer)
+    timer_thread.start()
+    dispatcher.serve()
+    timer_thread.join()
+    if errors:
+        raise errors[0]
+    return results, timings[0]
+
+
+def test_submit_from_threads(factory):
+    with factory(engine, latency=0.05) as send:
+        results, elapsed = run_workers(WKJS_Dispatcher(send), 4, lambda wv, i: wv.execute_js(f'script {i}'))
+    assert results == [f'script {i}' for i in range(4)]
+    # in flight at the same time
+    assert elapsed < 0.15
+
+
+def test_max_inflight(factory):
+    with factory(engine, latency=0.05) as send:
+        _, elapsed = run_workers(
+            WKJS_Dispatcher(send, max_inflight=1), 4, lambda wv, i: wv.execute_js(f'script {i}'))
+    assert elapsed >= 0.19
+
+
+def test_backpressure_and_close(factory):
+    with factory(engine) as send:
+        dispatcher = WKJS_Dispatcher(send, maxsize=1)
+        first = dispatcher.submit(WKJS_Task.NEW_WEBVIEW2, ())
+        with pytest.raises(queue.Full):
+            dispatcher.submit(WKJS_Task.NEW_WEBVIEW2, (), timeout=0.01)
+        with pytest.raises(ValueError):
+            dispatcher.submit(WKJS_Task.SHUTDOWN, ())
+        threading.Thread(target=lambda: (first.result(), dispatcher.close())).start()
+        # the queued task is run before serve() returns
+        dispatcher.serve()
+        wv, _ = first.result()
+        send(WKJS_Task.FREE_WEBVIEW, (wv, ))
+        with pytest.raises(RuntimeError):
+            dispatcher.submit(WKJS_Task.NEW_WEBVIEW2, ())
+
+
+def test_owner_cannot_wait_for_itself(factory):
+    errors: list[BaseException] = []
+    logged: list = []
+
+    def work(wv: WKJSE_Webview, i: int):
+        def on_log(msg):
+            # called on the serving thread
+            logged.append(msg)
+            try:
+                dispatcher.submit(WKJS_Task.NEW_WEBVIEW2, ())
+            except RuntimeError as e:
+                errors.append(e)
+        wv.on_script_log(on_log)
+        return wv.execute_js('log')
+
+    with factory(engine) as send:
+        dispatcher = WKJS_Dispatcher(send)
+        results, _ = run_workers(dispatcher, 1, work)
+    assert results == ['log']
+    assert len(logged) == 1
+    assert len(errors) == 1
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from yt_dlp_plugins.webkit_jsi.lib.api import WKJS_Dispatcher, WKJS_Timeout, WKJS_UncaughtException
+from yt_dlp_plugins.webkit_jsi.lib.easy_async import AsyncWKJSE_Webview
+
+
+def engine(wv, script):
+    if script == 'throw':
+        raise WKJS_UncaughtException(err_at=None, code=0, domain='sim', user_info={})
+    return script
+
+
+def test_concurrent_execute_js(factory):
+    async def main(send):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        tick_task = asyncio.create_task(ticker())
+        async with AsyncWKJSE_Webview(send) as a, AsyncWKJSE_Webview(send) as b, AsyncWKJSE_Webview(send) as c:
+            start = time.monotonic()
+            results = await asyncio.gather(*(wv.execute_js(f'script {i}') for i, wv in enumerate((a, b, c))))
+            elapsed = time.monotonic() - start
+            with pytest.raises(WKJS_UncaughtException):
+                await a.execute_js('throw')
+        tick_task.cancel()
+        return results, elapsed, ticks
+
+    with factory(engine, latency=0.1) as send:
+        results, elapsed, ticks = asyncio.run(main(send))
+    assert results == ['script 0', 'script 1', 'script 2']
+    # each webview runs its script at the same time, and the event loop isn't blocked meanwhile
+    assert elapsed < 0.25
+    assert ticks > 10
+
+
+def test_timeout(factory):
+    async def main(send):
+        async with AsyncWKJSE_Webview(send) as wv:
+            with pytest.raises(WKJS_Timeout):
+                await wv.execute_js('slow', timeout=0.02)
+            return await wv.execute_js('after')
+
+    with factory(engine, latency=0.1) as send:
+        assert asyncio.run(main(send)) == 'after'
+
+
+def test_cancellation(factory):
+    async def main(send):
+        async with AsyncWKJSE_Webview(send) as wv:
+            task = asyncio.create_task(wv.execute_js('cancelled'))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # the webview and the pump are still usable
+            return await wv.execute_js('after')
+
+    with factory(engine, latency=0.05) as send:
+        assert asyncio.run(main(send)) == 'after'
+
+
+def test_over_dispatcher(factory):
+    # the event loop on another thread, through the dispatcher served by the owner of the sendmsg
+    results = []
+    with factory(engine, latency=0.02) as send:
+        dispatcher = WKJS_Dispatcher(send)
+
+        async def main():
+            try:
+                async with AsyncWKJSE_Webview(dispatcher) as wv:
+                    results.append(await wv.execute_js('threaded'))
+            finally:
+                dispatcher.close()
+
+        thread = threading.Thread(target=asyncio.run, args=(main(), ))
+        thread.start()
+        dispatcher.serve()
+        thread.join()
+    assert results == ['threaded']
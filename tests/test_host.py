@@ -0,0 +1,55 @@
+import os
+import tempfile
+import threading
+import time
+
+from functools import partial
+
+from yt_dlp_plugins.webkit_jsi.lib import sim_objc
+from yt_dlp_plugins.webkit_jsi.lib.api import get_gen
+from yt_dlp_plugins.webkit_jsi.lib.easy import WKJSE_Factory, WKJSE_Pool
+from yt_dlp_plugins.webkit_jsi.lib.host import connect_gen, serve
+from yt_dlp_plugins.webkit_jsi.lib.logging import DefaultLoggerImpl
+
+
+def engine(wv, script):
+    if script == 'many':
+        return wv.communicate_many(['a', 'b'])
+    if script == 'comm':
+        return wv.communicate(script)
+    return script
+
+
+def test_host_round_trip():
+    path = os.path.join(tempfile.mkdtemp(), 'host.sock')
+    backend = sim_objc.SimObjCBackend(engine=engine)
+    results = []
+    errors = []
+
+    def client():
+        try:
+            while not os.path.exists(path):
+                time.sleep(0.01)
+            with WKJSE_Factory(DefaultLoggerImpl(), gen_factory=partial(connect_gen, path=path)) as send:
+                # the host doesn't serve SUBMIT
+                with WKJSE_Pool(send, 2, background=False) as pool, pool.acquire() as wv:
+                    results.append(wv.execute_js('script'))
+                    wv.on_script_comm(lambda x, reply: reply(x + '!', None))
+                    results.append(wv.execute_js('comm'))
+                    results.append(wv.execute_js('many'))
+                    wv.on_script_comm_many(lambda xs, reply: reply([len(xs)], None))
+                    results.append(wv.execute_js('many'))
+                    results.append(wv.memory_footprint())
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=client)
+    thread.start()
+    # on the main thread, which runs the run loop
+    serve(path, DefaultLoggerImpl(), gen_factory=partial(get_gen, backend=backend), idle_timeout=0.5)
+    thread.join()
+    assert not errors
+    assert results[:4] == ['script', 'comm!', ['a!', 'b!'], [2]]
+    assert isinstance(results[4], int) and results[4] > 0
+    # the host frees the webviews of the client once it disconnects
+    assert backend.live_objects() == 0
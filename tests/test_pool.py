@@ -0,0 +1,85 @@
+import pytest
+
+from yt_dlp_plugins.webkit_jsi.lib.api import WKJS_Timeout
+from yt_dlp_plugins.webkit_jsi.lib.easy import WKJSE_Pool, WKJSE_RecyclePolicy
+
+
+def recording_engine(ran: list[tuple[int, str]]):
+    def engine(wv, script):
+        ran.append((wv.handle, script))
+        return script
+    return engine
+
+
+def first_scripts(ran: list[tuple[int, str]]) -> dict[int, str]:
+    first: dict[int, str] = {}
+    for handle, script in ran:
+        first.setdefault(handle, script)
+    return first
+
+
+def test_least_loaded_skips_held_webviews(factory):
+    with factory() as send, WKJSE_Pool(send, 3) as pool:
+        with pool.acquire() as a, pool.acquire() as b, pool.acquire() as c:
+            assert len({id(a), id(b), id(c)}) == 3
+            with pool.acquire() as d:
+                # all are loaded the same, so it's the next one in turn
+                assert d is a
+        # each acquire is done with its webview before the next, which must not keep picking the first
+        picks = []
+        for _ in range(6):
+            with pool.acquire() as wv:
+                picks.append(pool.webviews.index(wv))
+        assert sorted(picks[:3]) == [0, 1, 2] and picks[3:] == picks[:3]
+
+
+def test_round_robin_ignores_load(factory):
+    with factory() as send, WKJSE_Pool(send, 2, policy='round-robin') as pool:
+        with pool.acquire() as a, pool.acquire() as b, pool.acquire() as c:
+            assert [pool.webviews.index(wv) for wv in (a, b, c)] == [0, 1, 0]
+
+
+def test_recycle_after_executions(factory):
+    ran: list[tuple[int, str]] = []
+    with factory(recording_engine(ran)) as send:
+        pool = WKJSE_Pool(send, 1, recycle=WKJSE_RecyclePolicy(max_executions=2))
+        pool.prepare_script = 'prepare'
+        with pool:
+            for i in range(8):
+                with pool.acquire() as wv:
+                    assert wv.execute_js(f'script {i}') == f'script {i}'
+    assert pool.recycled.get('executions')
+    first = first_scripts(ran)
+    assert len(first) == 1 + pool.recycled['executions']
+    # the replacements ran the prepare script before anything else
+    assert list(first.values())[1:] == ['prepare'] * pool.recycled['executions']
+
+
+def test_timeout_replaces_the_webview(factory):
+    with factory(recording_engine([]), latency=0.2) as send, WKJSE_Pool(send, 1) as pool:
+        with pool.acquire() as wv:
+            with pytest.raises(WKJS_Timeout):
+                wv.execute_js('slow', timeout=0.05)
+        assert wv.recycle_reason == 'timeout'
+        with pool.acquire() as replacement:
+            assert replacement is not wv
+            assert replacement.execute_js('next') == 'next'
+    assert pool.recycled == {'timeout': 1}
+
+
+def test_start_prepares_before_enter(factory):
+    ran: list[tuple[int, str]] = []
+    with factory(recording_engine(ran)) as send:
+        pool = WKJSE_Pool(send, 2)
+        pool.prepare_script = 'prepare'
+        with pool.start():
+            assert len(pool) == 2
+            with pool.acquire() as wv:
+                wv.execute_js('script')
+        first = first_scripts(ran)
+        assert len(first) == 2 and set(first.values()) == {'prepare'}
+        assert sorted(script for _, script in ran) == ['prepare', 'prepare', 'script']
+
+        # construction that is never waited for is still freed
+        pool = WKJSE_Pool(send, 2)
+        pool.start(prepare=False).__exit__(None, None, None)
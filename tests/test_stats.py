@@ -0,0 +1,85 @@
+from yt_dlp_plugins.webkit_jsi.lib.easy import WKJSE_Webview
+from yt_dlp_plugins.webkit_jsi.lib.stats import NULL_TIMER, LatencyHistogram, WKJS_Stats, timer_of
+
+
+def test_histogram_empty():
+    hist = LatencyHistogram()
+    assert hist.percentiles(50, 99) == (0.0, 0.0)
+    assert hist.percentiles() == ()
+    assert hist.summary() == {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+
+
+def test_histogram_percentiles():
+    hist = LatencyHistogram()
+    for i in range(100, 0, -1):
+        hist.add(i / 1000)
+    assert hist.percentiles(0, 50, 95, 99, 100) == (0.001, 0.051, 0.096, 0.1, 0.1)
+    summary = hist.summary()
+    assert summary['count'] == 100
+    assert abs(summary['mean'] - 0.0505) < 1e-9
+    assert summary['max'] == 0.1
+
+
+def test_histogram_ring_wraparound():
+    hist = LatencyHistogram()
+    assert hist.capacity == 4096
+    for _ in range(4096):
+        hist.add(1.0)
+    # overwrites the oldest samples first, and keeps counting all of them
+    for _ in range(4096 + 10):
+        hist.add(2.0)
+    assert len(hist._samples) == 4096
+    assert hist.count == 2 * 4096 + 10
+    assert hist.total == 4096 * 1.0 + (4096 + 10) * 2.0
+    assert hist.percentiles(0, 100) == (2.0, 2.0)
+    hist.add(3.0)
+    assert hist.summary()['max'] == 3.0
+    assert hist._samples.count(3.0) == 1
+
+
+def test_null_timer():
+    assert timer_of(None, 'task') is NULL_TIMER
+    NULL_TIMER.mark('phase')
+    NULL_TIMER.done()
+    stats = WKJS_Stats()
+    timer = timer_of(stats, 'task')
+    assert timer is not NULL_TIMER
+    timer.mark('first')
+    timer.mark('second')
+    timer.done()
+    summary = stats.summary()
+    assert list(summary) == ['task']
+    assert list(summary['task']) == ['first', 'second', 'total']
+    assert all(s['count'] == 1 for s in summary['task'].values())
+    assert summary['task']['total']['max'] >= summary['task']['second']['max']
+
+
+def test_stats_record_and_format():
+    stats = WKJS_Stats()
+    assert stats.summary() == {}
+    assert stats.format() == ''
+    stats.record('execute_js', 'wait', 0.002)
+    stats.record('execute_js', 'wait', 0.004)
+    stats.record('new_webview', 'total', 0.001)
+    summary = stats.summary()
+    assert summary['execute_js']['wait']['count'] == 2
+    assert summary['execute_js']['wait']['max'] == 0.004
+    lines = stats.format().splitlines()
+    assert lines[0] == 'execute_js:'
+    assert lines[1].split() == ['wait:', 'n=2', 'p50=', '4.000ms', 'p95=', '4.000ms', 'p99=', '4.000ms', 'max=', '4.000ms']
+    assert lines[2] == 'new_webview:'
+
+
+def test_factory_collects_stats(factory):
+    collecting = factory(collect_stats=True)
+    with collecting as send, WKJSE_Webview(send) as wv:
+        wv.execute_js('1')
+    stats = collecting.stats()
+    assert stats['new_webview']['total']['count'] == 1
+    assert stats['execute_js']['total']['count'] == 1
+    assert collecting.format_stats()
+    plain = factory()
+    with plain as send, WKJSE_Webview(send) as wv:
+        wv.execute_js('1')
+    assert plain.stats() is None
+    assert plain.format_stats() is None
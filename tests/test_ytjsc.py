@@ -0,0 +1,194 @@
+import json
+
+from functools import partial
+
+import pytest
+
+from yt_dlp import YoutubeDL
+from yt_dlp.extractor.youtube.jsc._builtin.ejs import Script, ScriptSource, ScriptType, ScriptVariant
+from yt_dlp.extractor.youtube.jsc.provider import (
+    JsChallengeProviderError,
+    JsChallengeProviderRejectedRequest,
+    JsChallengeRequest,
+    JsChallengeType,
+    NChallengeInput,
+    SigChallengeInput,
+)
+from yt_dlp.extractor.youtube.pot._director import YoutubeIEContentProviderLogger
+from yt_dlp.globals import plugin_dirs
+
+from yt_dlp_plugins.extractor._ytjsc_cache import ChallengeResultCache
+from yt_dlp_plugins.extractor.webkit_jsi import _SharedRuntime
+from yt_dlp_plugins.extractor.ytjsc import EJS_INSTALL_SUFFIX, AppleWebKitJCP, _merge_outputs, _split_requests
+from yt_dlp_plugins.webkit_jsi.bench import ReplayEngine
+from yt_dlp_plugins.webkit_jsi.lib.sim import get_sim_gen
+
+
+class ReversingEngine(ReplayEngine):
+    """
+    Answers every challenge with its reverse, and keeps the requests that reached the solver
+    and how many times the solver was installed. With `stuck`, the solver never stays installed
+    """
+    __slots__ = 'installs', 'solved', 'stuck'
+
+    def __init__(self):
+        super().__init__([])
+        self.solved: list[list[dict]] = []
+        self.installs = 0
+        self.stuck = False
+
+    def __call__(self, wv, script):
+        if script.endswith(EJS_INSTALL_SUFFIX):
+            self.installs += 1
+            if self.stuck:
+                return None
+        return super().__call__(wv, script)
+
+    def _respond(self, player_key: str, requests: list[dict]) -> str:
+        self.solved.append(requests)
+        return json.dumps({'type': 'result', 'responses': [
+            {'type': 'result', 'data': {challenge: challenge[::-1] for challenge in request['challenges']}}
+            for request in requests]})
+
+    def evict(self) -> None:
+        """As if every webview lost its globals, e.g. after a crash of the WebContent process"""
+        self._webviews.clear()
+
+    def evict_players(self) -> None:
+        for _, players in self._webviews.values():
+            players.clear()
+
+
+def requests_of(*requests: tuple[str, list[str]]) -> list[JsChallengeRequest]:
+    return [JsChallengeRequest(
+        type=JsChallengeType(ctype),
+        input=(NChallengeInput if ctype == 'n' else SigChallengeInput)('', challenges),
+    ) for ctype, challenges in requests]
+
+
+def expected(*requests: tuple[str, list[str]]) -> list[dict]:
+    return [{'type': 'result', 'data': {c: c[::-1] for c in challenges}} for _, challenges in requests]
+
+
+@pytest.fixture
+def make_provider(tmp_path, monkeypatch):
+    """Makes an AppleWebKitJCP whose runtime is the sim with a ReversingEngine, returns it and the engine"""
+    engine = ReversingEngine()
+    monkeypatch.setattr(_SharedRuntime, 'GEN_FACTORY', partial(get_sim_gen, engine=engine))
+    # the provider is already imported from here
+    monkeypatch.setattr(plugin_dirs, 'value', [])
+    monkeypatch.setattr(AppleWebKitJCP, '_result_cache', ChallengeResultCache(64))
+    providers: list[AppleWebKitJCP] = []
+
+    with YoutubeDL({'quiet': True, 'no_warnings': True, 'cachedir': str(tmp_path)}) as ydl:
+        ie = ydl.get_info_extractor('Youtube')
+
+        def make(**settings: str) -> tuple[AppleWebKitJCP, ReversingEngine]:
+            provider = AppleWebKitJCP(
+                ie, YoutubeIEContentProviderLogger(ie, 'jsc:apple-webkit-jsi', log_level=None),
+                {k: [v] for k, v in settings.items()})
+            providers.append(provider)
+            try:
+                _ = provider._lib_script
+            except JsChallengeProviderRejectedRequest:
+                # yt-dlp only vendors an import-only lib script, which the engine doesn't run anyway
+                provider.__dict__['_lib_script'] = Script(
+                    ScriptType.LIB, ScriptVariant.UNKNOWN, ScriptSource.BUILTIN, AppleWebKitJCP._SCRIPT_VERSION,
+                    'const lib = {};\n')
+            return provider, engine
+
+        yield make
+        for provider in providers:
+            provider.close()
+
+
+def solve(provider: AppleWebKitJCP, player: str, *requests: tuple[str, list[str]]) -> list[dict]:
+    return json.loads(provider._run_js_runtime(provider._construct_stdin(player, False, requests_of(*requests))))['responses']
+
+
+def test_result_cache_lru():
+    cache = ChallengeResultCache(2)
+    cache.put(('p', 'n', 'a'), 'A')
+    cache.put(('p', 'n', 'b'), 'B')
+    assert cache.get(('p', 'n', 'a')) == 'A'
+    # b is now the least recently used
+    cache.put(('p', 'n', 'c'), 'C')
+    assert cache.get(('p', 'n', 'b')) is None
+    assert cache.get(('p', 'n', 'c')) == 'C'
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_result_cache_only_solves_the_unknown(make_provider):
+    provider, engine = make_provider()
+    assert solve(provider, 'player', ('n', ['a', 'b'])) == expected(('n', ['a', 'b']))
+    engine.solved.clear()
+    # repeated within a request, and one request entirely known
+    requests = ('n', ['b', 'c', 'c', 'a']), ('n', ['a', 'a']), ('sig', ['s'])
+    assert solve(provider, 'player', *requests) == expected(*requests)
+    assert engine.solved == [[{'type': 'n', 'challenges': ['c']}, {'type': 'sig', 'challenges': ['s']}]]
+    engine.solved.clear()
+    assert solve(provider, 'player', *requests) == expected(*requests)
+    assert engine.solved == []
+
+
+def test_result_store_across_providers(make_provider):
+    provider, engine = make_provider()
+    solve(provider, 'player', ('n', ['a']))
+    AppleWebKitJCP._result_cache.clear()
+    engine.solved.clear()
+    other, _ = make_provider()
+    assert solve(other, 'player', ('n', ['a'])) == expected(('n', ['a']))
+    assert engine.solved == []
+    assert provider._result_store().hits == 1
+
+
+def test_split_and_merge_keep_the_order():
+    requests = [{'type': 'n', 'challenges': ['a', 'b', 'c']}, {'type': 'sig', 'challenges': ['x', 'y']}]
+    split = _split_requests(requests, 2)
+    assert split == [
+        ([0, 1], [{'type': 'n', 'challenges': ['a', 'c']}, {'type': 'sig', 'challenges': ['y']}]),
+        ([0, 1], [{'type': 'n', 'challenges': ['b']}, {'type': 'sig', 'challenges': ['x']}])]
+    outputs = [json.dumps({'type': 'result', 'responses': [
+        {'type': 'result', 'data': {c: c.upper() for c in request['challenges']}} for request in part]})
+        for _, part in split]
+    assert json.loads(_merge_outputs(requests, split, outputs))['responses'] == [
+        {'type': 'result', 'data': {'a': 'A', 'c': 'C', 'b': 'B'}}, {'type': 'result', 'data': {'y': 'Y', 'x': 'X'}}]
+    # an error in any part is the response of its request
+    error = {'type': 'error', 'error': 'bad x'}
+    outputs[1] = json.dumps({'type': 'result', 'responses': [{'type': 'result', 'data': {'b': 'B'}}, error]})
+    assert json.loads(_merge_outputs(requests, split, outputs))['responses'][1] == error
+    # fewer challenges than parts
+    assert _split_requests([{'type': 'n', 'challenges': ['a']}], 4) == [([0], [{'type': 'n', 'challenges': ['a']}])]
+
+
+def test_pool_solves_in_parts(make_provider):
+    provider, engine = make_provider(pool_size='3', result_cache='false')
+    requests = ('n', ['a', 'b', 'c', 'd']), ('sig', ['x', 'y'])
+    assert solve(provider, 'player', *requests) == expected(*requests)
+    assert sorted(len(part) for part in engine.solved) == [1, 2, 2]
+    assert sorted(c for part in engine.solved for request in part for c in request['challenges']) == list('abcdxy')
+
+
+def test_solver_evicted_is_reinstalled(make_provider):
+    provider, engine = make_provider(result_cache='false')
+    assert solve(provider, 'player', ('n', ['a'])) == expected(('n', ['a']))
+    installs = engine.installs
+    # only the requests are sent while the solver and the player are loaded
+    assert solve(provider, 'player', ('n', ['b'])) == expected(('n', ['b']))
+    assert engine.installs == installs
+    engine.evict_players()
+    assert solve(provider, 'player', ('n', ['c'])) == expected(('n', ['c']))
+    assert engine.installs == installs
+    engine.evict()
+    assert solve(provider, 'player', ('n', ['d'])) == expected(('n', ['d']))
+    assert engine.installs == installs + 1
+
+
+def test_solver_that_does_not_stay_installed(make_provider):
+    provider, engine = make_provider(result_cache='false')
+    engine.stuck = True
+    with pytest.raises(JsChallengeProviderError, match='Failed to load the solver'):
+        solve(provider, 'player', ('n', ['a']))
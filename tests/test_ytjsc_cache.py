@@ -0,0 +1,70 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from yt_dlp import YoutubeDL
+
+from yt_dlp_plugins.extractor._ytjsc_cache import ChallengeResultStore
+
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    """Makes a store on its own YoutubeDL and Cache over the same cache dir, like another process would"""
+    monkeypatch.setattr(ChallengeResultStore, '_LOCK_PATH', str(tmp_path / 'lock'))
+
+    def make(ttl: float = 3600.0) -> ChallengeResultStore:
+        return ChallengeResultStore(YoutubeDL({'cachedir': str(tmp_path / 'cache'), 'quiet': True}).cache, ttl)
+
+    return make
+
+
+def test_store_round_trip(make_store):
+    store = make_store()
+    store.put_many('p1', {('n', 'a'): 'A', ('sig', 'a'): 'SA'})
+    assert make_store().get_many('p1', [('n', 'a'), ('sig', 'a'), ('n', 'b')]) == {('n', 'a'): 'A', ('sig', 'a'): 'SA'}
+    assert make_store().get_many('p2', [('n', 'a')]) == {}
+
+
+def test_store_caps_results_per_player(make_store, monkeypatch):
+    monkeypatch.setattr(ChallengeResultStore, 'MAX_RESULTS', 3)
+    store = make_store()
+    for c in 'abcd':
+        store.put_many('p', {('n', c): c.upper()})
+    # written again, so it is the most recent
+    store.put_many('p', {('n', 'b'): 'B'})
+    store.put_many('p', {('n', 'e'): 'E'})
+    assert store.get_many('p', [('n', c) for c in 'abcde']) == {('n', 'b'): 'B', ('n', 'd'): 'D', ('n', 'e'): 'E'}
+
+
+def test_store_evicts_expired_and_superseded(make_store, monkeypatch):
+    monkeypatch.setattr(ChallengeResultStore, 'MAX_PLAYERS', 2)
+    store = make_store(ttl=60.0)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now - 120.0)
+    store.put_many('old', {('n', 'a'): 'A'})
+    monkeypatch.setattr(time, 'time', lambda: now)
+    assert store.get_many('old', [('n', 'a')]) == {}
+    for player in ('p1', 'p2', 'p3'):
+        store.put_many(player, {('n', 'a'): player})
+    cache = store._cache
+    assert set(cache.load(store.SECTION, 'players')) == {'p2', 'p3'}
+    # emptied, as the cache cannot delete them
+    assert cache.load(store.SECTION, 'old') is None
+    assert cache.load(store.SECTION, 'p1') is None
+    assert store.get_many('p1', [('n', 'a')]) == {}
+    assert store.get_many('p3', [('n', 'a')]) == {('n', 'a'): 'p3'}
+
+
+def test_store_concurrent_writers_keep_all_results(make_store):
+    stores = [make_store() for _ in range(4)]
+
+    def put(k: int) -> None:
+        for i in range(20):
+            stores[k].put_many('p', {('n', f'{k}-{i}'): str(i)})
+
+    with ThreadPoolExecutor(len(stores)) as pool:
+        list(pool.map(put, range(len(stores))))
+    keys = [('n', f'{k}-{i}') for k in range(len(stores)) for i in range(20)]
+    assert len(make_store().get_many('p', keys)) == len(keys)
@@ -0,0 +1,172 @@
+import os
+import tempfile
+import time
+
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager, suppress
+from threading import Lock
+from typing import TYPE_CHECKING, Generator, Optional
+from weakref import WeakKeyDictionary
+
+from yt_dlp.utils import locked_file
+
+if TYPE_CHECKING:
+    from yt_dlp.cache import Cache
+
+
+# (player hash, challenge type, challenge input)
+CHALLENGE_KEY = tuple[str, str, str]
+
+
+class ChallengeResultCache:
+    """Bounded LRU of solved challenges, safe to share between threads"""
+    __slots__ = '_data', '_lock', 'hits', 'maxsize', 'misses'
+
+    def __init__(self, maxsize: int):
+        self._lock = Lock()
+        self._data: OrderedDict[CHALLENGE_KEY, str] = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: CHALLENGE_KEY) -> Optional[str]:
+        with self._lock:
+            res = self._data.get(key)
+            if res is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return res
+
+    def put(self, key: CHALLENGE_KEY, value: str) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(size={len(self)}/{self.maxsize}, hits={self.hits}, misses={self.misses})'
+
+
+class ChallengeResultStore:
+    """
+    Solved challenges persisted in the yt-dlp cache, shared by every process using the same cache.
+    Each player has one entry of up to MAX_RESULTS results, and an index entry has when each player was last used.
+    Players not used for `ttl` seconds, or past the MAX_PLAYERS most recently used, are evicted on the next write.
+    Writes re-read and merge what is stored under a lock file, so that processes don't lose each other's results
+    """
+    __slots__ = '__weakref__', '_cache', '_lock', 'hits', 'misses', 'ttl'
+
+    SECTION = 'apple-webkit-jsi-challenges'
+    MAX_PLAYERS = 8
+    MAX_RESULTS = 1024
+    _INDEX_KEY = 'players'
+    # last_used is only bumped on reads after this many seconds, so that hits don't write every time
+    _TOUCH_INTERVAL = 3600.0
+    _LOCK_PATH = os.path.join(tempfile.gettempdir(), f'yt-dlp-{SECTION}.lock')
+    _instances: 'WeakKeyDictionary[Cache, ChallengeResultStore]' = WeakKeyDictionary()
+    _instances_lock = Lock()
+
+    def __init__(self, cache: 'Cache', ttl: float):
+        self._lock = Lock()
+        self._cache = cache
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls, cache: 'Cache', ttl: float) -> 'ChallengeResultStore':
+        with cls._instances_lock:
+            if (store := cls._instances.get(cache)) is None:
+                store = cls._instances[cache] = cls(cache, ttl)
+            store.ttl = ttl
+            return store
+
+    @classmethod
+    def opened(cls, cache: 'Cache') -> Optional['ChallengeResultStore']:
+        """The store `open` returned for `cache`, if any"""
+        with cls._instances_lock:
+            return cls._instances.get(cache)
+
+    @contextmanager
+    def _locked(self) -> Generator[None, None, None]:
+        with self._lock, ExitStack() as exsk:
+            # without it, still consistent within this process
+            with suppress(OSError):
+                exsk.enter_context(locked_file(self._LOCK_PATH, 'a'))
+            yield
+
+    def _load_index(self) -> dict[str, float]:
+        index = self._cache.load(self.SECTION, self._INDEX_KEY)
+        if not isinstance(index, dict):
+            return {}
+        return {player: last_used for player, last_used in index.items() if isinstance(last_used, (int, float))}
+
+    def _load_results(self, player: str) -> dict[tuple[str, str], str]:
+        entry = self._cache.load(self.SECTION, player)
+        if not isinstance(entry, list):
+            return {}
+        return {
+            (item[0], item[1]): item[2] for item in entry
+            if isinstance(item, list) and len(item) == 3 and all(isinstance(x, str) for x in item)}
+
+    def _is_live(self, index: dict[str, float], player: str, now: float) -> bool:
+        return index.get(player, 0.0) >= now - self.ttl
+
+    def _store_index(self, index: dict[str, float], now: float) -> None:
+        """Stores `index` without the players to evict, whose entries are emptied (the cache has no delete)"""
+        # most recent first, the index is in the order the players were last used so that it breaks ties
+        live = [player for player in reversed(index) if self._is_live(index, player, now)]
+        keep = sorted(live, key=index.__getitem__, reverse=True)[:self.MAX_PLAYERS]
+        for player in set(index).difference(keep):
+            self._cache.store(self.SECTION, player, None)
+        self._cache.store(self.SECTION, self._INDEX_KEY, {player: index[player] for player in reversed(keep)})
+
+    def get_many(self, player: str, keys: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        now = time.time()
+        index = self._load_index()
+        found: dict[tuple[str, str], str] = {}
+        if self._is_live(index, player, now):
+            results = self._load_results(player)
+            found = {key: results[key] for key in keys if key in results}
+        if found and index[player] < now - self._TOUCH_INTERVAL:
+            with self._locked():
+                index = self._load_index()
+                if self._is_live(index, player, now):
+                    index.pop(player)
+                    index[player] = now
+                    self._store_index(index, now)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, player: str, items: dict[tuple[str, str], str]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._locked():
+            # merged with what other processes stored since this one last read
+            index = self._load_index()
+            results = self._load_results(player) if self._is_live(index, player, now) else {}
+            for key, res in items.items():
+                # the most recent go last, so that the cap drops the oldest
+                results.pop(key, None)
+                results[key] = res
+            kept = list(results.items())[-self.MAX_RESULTS:]
+            self._cache.store(self.SECTION, player, [[ctype, challenge, res] for (ctype, challenge), res in kept])
+            index.pop(player, None)
+            index[player] = now
+            self._store_index(index, now)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.SECTION!r}, hits={self.hits}, misses={self.misses})'
@@ -0,0 +1,53 @@
+"""
+The challenges recorded with the record extractor arg, replayed by `python -m yt_dlp_plugins.webkit_jsi.bench`.
+`calls.jsonl` has one solve per line, the players it refers to are in `players/<player_key>.js`.
+"""
+
+import json
+import os
+
+from threading import Lock
+
+
+CALLS_FILE = 'calls.jsonl'
+PLAYERS_DIR = 'players'
+
+# {'player_key', 'preprocessed', 'requests': [{'type', 'challenges'}], 'output': the EJS output (JSON), 'elapsed'}
+CORPUS_CALL = dict
+
+_write_lock = Lock()
+
+
+def record_call(root: str, player: str, call: CORPUS_CALL) -> None:
+    player_path = os.path.join(root, PLAYERS_DIR, f'{call["player_key"]}.js')
+    with _write_lock:
+        if not os.path.exists(player_path):
+            os.makedirs(os.path.dirname(player_path), exist_ok=True)
+            # other processes may be recording into the same directory
+            part = f'{player_path}.{os.getpid()}.part'
+            with open(part, 'w', encoding='utf-8') as f:
+                f.write(player)
+            os.replace(part, player_path)
+        # a single write per line, so that the appends of concurrent processes don't interleave
+        with open(os.path.join(root, CALLS_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(call) + '\n')
+
+
+def load_corpus(root: str) -> tuple[dict[str, str], list[CORPUS_CALL]]:
+    """Returns the players by key and the calls, skipping the calls whose player is missing"""
+    players: dict[str, str] = {}
+    calls: list[CORPUS_CALL] = []
+    with open(os.path.join(root, CALLS_FILE), encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            call = json.loads(line)
+            key = call['player_key']
+            if key not in players:
+                try:
+                    with open(os.path.join(root, PLAYERS_DIR, f'{key}.js'), encoding='utf-8') as pf:
+                        players[key] = pf.read()
+                except FileNotFoundError:
+                    continue
+            calls.append(call)
+    return players, calls
@@ -1,32 +1,102 @@
 import os
+import threading
+import time
 
-from typing import Generic, Optional, Protocol, TypeVar
+from functools import partial
+from typing import Callable, Generator, Generic, Optional, Protocol, TypeVar, cast as py_typecast
 from yt_dlp.extractor.common import InfoExtractor
 from yt_dlp.utils import version_tuple
 
-from ..webkit_jsi.lib.logging import AbstractLogger, DefaultLoggerImpl as Logger
-from ..webkit_jsi.lib.easy import WKJSE_Factory, WKJSE_Webview
-from ..webkit_jsi.lib.api import DarwinMinVer
+from ..webkit_jsi.lib.logging import AbstractLogger
+from ..webkit_jsi.lib.easy import POOL_POLICY, WKJSE_Factory, WKJSE_Pool, WKJSE_RecyclePolicy, WKJSE_Webview
+from ..webkit_jsi.lib import api
+from ..webkit_jsi.lib.api import SENDMSG_CBTYPE, DarwinMinVer
+from ..webkit_jsi.lib.host import connect_gen, default_socket_path
 
 
 __version__ = '0.1.1'
 
 
 FACTORY_CACHE_TYPE = WKJSE_Factory
-WEBVIEW_CACHE_TYPE = Optional[WKJSE_Webview]
+POOL_CACHE_TYPE = Optional[WKJSE_Pool]
+# host socket, pool size, pool policy, stats (false, true or bridge), log batch
+RUNTIME_KEY = tuple[Optional[str], int, str, str, int]
+
+
+class _Prewarm:
+    """Construction started ahead of the first solve, see AppleWebKitMixin._start_prewarm"""
+    __slots__ = 'thread', 'send', 'started', 'pool', 'error', 'elapsed'
+
+    def __init__(self, target: Optional[Callable[['_Prewarm'], None]] = None):
+        self.send: Optional[SENDMSG_CBTYPE] = None
+        # submitted with WKJSE_Pool.start, entered on the first solve
+        self.started: POOL_CACHE_TYPE = None
+        self.pool: POOL_CACHE_TYPE = None
+        self.error: Optional[BaseException] = None
+        # seconds of work done before the first solve
+        self.elapsed = 0.0
+        # only to connect to the webkit host, WebKit itself is set up on the thread of the caller
+        self.thread = None if target is None else threading.Thread(
+            target=target, args=(self, ), name='apple-webkit-jsi-prewarm', daemon=True)
+
+
+class _SharedRuntime:
+    """
+    The factory and the pool, shared by every InfoExtractor in the process that uses the same settings.
+    Borrowed in AppleWebKitMixin._try_init_factory, torn down by the close() of the last borrower.
+    """
+    __slots__ = 'key', 'loggers', 'lock', 'factory', 'send', 'remote', 'pool', 'prewarm'
+
+    # what the in-process factories run, e.g. a simulated backend in webkit_jsi/bench.py
+    GEN_FACTORY: Callable[..., Generator[SENDMSG_CBTYPE, None, None]] = api.get_gen
+    _registry: dict[RUNTIME_KEY, '_SharedRuntime'] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, key: RUNTIME_KEY, logger: AbstractLogger):
+        self.key = key
+        # of the borrowers, one entry per borrow
+        self.loggers: list[AbstractLogger] = []
+        # held while the runtime is used, the factory and the pool are not thread safe
+        self.lock = threading.RLock()
+        self.factory: FACTORY_CACHE_TYPE = WKJSE_Factory(
+            logger, gen_factory=_SharedRuntime.GEN_FACTORY,
+            collect_stats=key[3] in ('true', 'bridge'), count_bridge=key[3] == 'bridge', log_batch=key[4])
+        self.send: Optional[SENDMSG_CBTYPE] = None
+        # whether `send` goes to the webkit host
+        self.remote = False
+        self.pool: POOL_CACHE_TYPE = None
+        self.prewarm: Optional[_Prewarm] = None
+
+    @classmethod
+    def borrow(cls, key: RUNTIME_KEY, logger: AbstractLogger) -> '_SharedRuntime':
+        with cls._registry_lock:
+            if (rt := cls._registry.get(key)) is None:
+                rt = cls._registry[key] = cls(key, logger)
+            rt.loggers.append(logger)
+            return rt
+
+    def release(self, logger: AbstractLogger) -> Optional[AbstractLogger]:
+        """Returns the logger of a remaining borrower, None if the caller was the last one, who has to tear the runtime down"""
+        with _SharedRuntime._registry_lock:
+            self.loggers.remove(logger)
+            if self.loggers:
+                return self.loggers[-1]
+            del _SharedRuntime._registry[self.key]
+            return None
 
 
 class _IEWithAttr(InfoExtractor):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.__yt_dlp_plugin__apple_webkit_jsi__factory: FACTORY_CACHE_TYPE = WKJSE_Factory(Logger())
-        self.__yt_dlp_plugin__apple_webkit_jsi__webview: WEBVIEW_CACHE_TYPE = None
+        self.__yt_dlp_plugin__apple_webkit_jsi__runtime: Optional[_SharedRuntime] = None
 
 
 class _IECP_Proto(Protocol):
     ie: _IEWithAttr
     logger: AbstractLogger
 
+    def _configuration_arg(self, key, default=..., *, casesense=False) -> list[str]: ...
+
 
 _T = TypeVar('_T', bound=_IECP_Proto)
 
@@ -39,41 +109,249 @@ class AppleWebKitMixin(Generic[_T]):
     BUG_REPORT_LOCATION = 'https://github.com/grqz/yt-dlp-apple-webkit-jsi/issues?q='
 
     def _try_init_factory(self: _T):
-        if not hasattr(self.ie, '__yt_dlp_plugin__apple_webkit_jsi__factory'):
-            self.ie.__yt_dlp_plugin__apple_webkit_jsi__factory = WKJSE_Factory(self.logger)
-            self.ie.__yt_dlp_plugin__apple_webkit_jsi__webview = None
+        # one reference per InfoExtractor, shared by its providers
+        try:
+            rt = self.ie.__yt_dlp_plugin__apple_webkit_jsi__runtime
+        except AttributeError:
+            rt = None
+        if rt is None:
+            key = (
+                self._host_socket(),
+                self._int_arg('pool_size', 1, minimum=1),
+                self._configuration_arg('pool_policy', ['least-loaded'])[0],
+                self._configuration_arg('stats', ['false'])[0],
+                self._int_arg('log_batch', 0, minimum=0))
+            self.ie.__yt_dlp_plugin__apple_webkit_jsi__runtime = _SharedRuntime.borrow(key, self.logger)
+
+    def _int_arg(self: _T, key: str, default: int, *, minimum: int) -> int:
+        try:
+            value = int(self._configuration_arg(key, [str(default)])[0])
+        except ValueError as e:
+            self.logger.warning(f'Invalid {key} extractor arg, using {default}: {e}', once=True)
+            return default
+        if value < minimum:
+            self.logger.warning(f'{key} extractor arg must be at least {minimum}, using {minimum}', once=True)
+            return minimum
+        return value
+
+    def _runtime(self: _T) -> _SharedRuntime:
+        rt = self.ie.__yt_dlp_plugin__apple_webkit_jsi__runtime
+        assert rt is not None, 'runtime used after close'
+        return rt
+
+    def _host_socket(self: _T) -> Optional[str]:
+        path = self._configuration_arg('host_socket', [''], casesense=True)[0]
+        if not path:
+            return None
+        return default_socket_path() if path == 'default' else path
+
+    def _connect_host(self: _T) -> Optional[SENDMSG_CBTYPE]:
+        """Returns the sendmsg function of the webkit host of the host_socket extractor arg, None to run in process"""
+        rt = self._runtime()
+        if (path := rt.key[0]) is None:
+            return None
+        factory = WKJSE_Factory(
+            self.logger, gen_factory=partial(connect_gen, path=path), collect_stats=rt.key[3] in ('true', 'bridge'))
+        try:
+            send = factory.__enter__()
+        except OSError as e:
+            self.logger.warning(f'Cannot connect to the webkit host at {path}, running in process: {e}')
+            return None
+        self.logger.debug(f'Connected to the webkit host at {path}')
+        rt.factory = factory
+        rt.remote = True
+        return send
+
+    def _enter_local(self: _T) -> SENDMSG_CBTYPE:
+        # creates WebKit objects, so only on the thread that runs the solves
+        send = self._runtime().factory.__enter__()
+        self.logger.debug(f'WebKit runtime set up {api.SETUP_COUNT} time(s) in this process')
+        return send
+
+    def _enter_factory(self: _T) -> tuple[SENDMSG_CBTYPE, bool]:
+        """Returns the sendmsg function and whether it may be called from any thread (i.e. it's the webkit host)"""
+        if (send := self._connect_host()) is not None:
+            return send, True
+        return self._enter_local(), False
+
+    def _recycle_policy(self: _T) -> WKJSE_RecyclePolicy:
+        try:
+            return WKJSE_RecyclePolicy(
+                max_executions=int(self._configuration_arg('recycle_executions', ['0'])[0]),
+                max_script_bytes=int(float(self._configuration_arg('recycle_script_mb', ['0'])[0]) * (1 << 20)),
+                max_memory=int(float(self._configuration_arg('recycle_memory_mb', ['0'])[0]) * (1 << 20)))
+        except ValueError as e:
+            self.logger.warning(f'Invalid recycle extractor args, not recycling webviews: {e}', once=True)
+            return WKJSE_RecyclePolicy()
+
+    def _timeout(self: _T) -> Optional[float]:
+        # seconds a script may run before it is given up on, and its webview recycled. None to wait forever
+        try:
+            timeout = float(self._configuration_arg('timeout', ['0'])[0])
+        except ValueError as e:
+            self.logger.warning(f'Invalid timeout extractor arg, not timing out: {e}', once=True)
+            return None
+        return timeout if timeout > 0 else None
+
+    def _prepare_script(self: _T) -> Optional[str]:
+        # run in the replacements of recycled webviews and, with prewarm=solver, the first ones, e.g. what _prewarm_webview loads
+        return None
+
+    def _new_pool(self: _T, send: SENDMSG_CBTYPE, *, prewarm: Optional[str] = None) -> WKJSE_Pool:
+        """
+        prewarm: the prewarm extractor arg, to only submit the construction of the webviews (see WKJSE_Pool.start),
+            which also prepares them with 'solver'. The pool is entered by the caller then
+        """
+        rt = self._runtime()
+        _, size, policy, _, _ = rt.key
+        self.logger.info('Constructing webview' if size == 1 else f'Constructing {size} webviews')
+        pool = WKJSE_Pool(
+            send, size, policy=py_typecast(POOL_POLICY, policy), recycle=self._recycle_policy(),
+            background=not rt.remote, stats=rt.factory.recorder)
+        pool.prepare_script = self._prepare_script()
+        if prewarm is not None:
+            return pool.start(prepare=prewarm == 'solver')
+        pool.__enter__()
+        # TODO: this is yt specific, move to somewhere else
+        # pool.navigate_to('https://www.youtube.com/watch?v=yt-dlp-wins', '<!DOCTYPE html><html lang="en"><head><title></title></head><body></body></html>')
+        self.logger.info('Webview constructed')
+        return pool
+
+    def _prewarm_webview(self: _T, webview: WKJSE_Webview) -> None:
+        # e.g. load what the provider runs in every webview
+        ...
+
+    def _start_prewarm(self: _T) -> None:
+        """
+        With the prewarm extractor arg, start constructing everything ahead of the first solve,
+        so that it overlaps with the network requests made before it.
+        In process, WebKit is set up right away on this thread and the construction of the webviews
+        (and with prewarm=solver, loading the solver into them) is submitted to the run loop, which the first solve waits for.
+        With the webkit host, all of it is done on another thread.
+        """
+        mode = self._configuration_arg('prewarm', ['false'])[0]
+        if mode not in ('true', 'solver') or not self.is_available():
+            return
+        rt = self._runtime()
+        with rt.lock:
+            if rt.send is not None or rt.prewarm is not None:
+                return
+            if rt.key[0] is None:
+                self.logger.trace('prewarming on the run loop')
+                start = time.perf_counter()
+                pw = rt.prewarm = _Prewarm()
+                try:
+                    pw.send = self._enter_local()
+                    rt.factory.set_logger(self.logger)
+                    pw.started = self._new_pool(pw.send, prewarm=mode)
+                except Exception as e:
+                    pw.error = e
+                pw.elapsed = time.perf_counter() - start
+                return
+
+            def prewarm(pw: _Prewarm):
+                start = time.perf_counter()
+                try:
+                    # running in process is left to the first solve if the host can't be reached
+                    if (send := self._connect_host()) is not None:
+                        pw.send = send
+                        rt.factory.set_logger(self.logger)
+                        pw.pool = self._new_pool(send)
+                        if mode == 'solver':
+                            for webview in pw.pool.webviews:
+                                self._prewarm_webview(webview)
+                except BaseException as e:
+                    pw.error = e
+                pw.elapsed = time.perf_counter() - start
+
+            self.logger.trace('prewarming in the background')
+            rt.prewarm = _Prewarm(prewarm)
+            py_typecast(threading.Thread, rt.prewarm.thread).start()
+
+    def _join_prewarm(self: _T, rt: _SharedRuntime) -> None:
+        if (pw := rt.prewarm) is None:
+            return
+        rt.prewarm = None
+        start = time.perf_counter()
+        if pw.thread is not None:
+            pw.thread.join()
+            if pw.send is None and pw.error is None:
+                # the webkit host couldn't be reached
+                try:
+                    pw.send = self._enter_local()
+                except Exception as e:
+                    pw.error = e
+        if pw.started is not None:
+            try:
+                pw.pool = pw.started.__enter__()
+            except Exception as e:
+                pw.error = e
+            else:
+                self.logger.info('Webview constructed')
+        waited = time.perf_counter() - start
+        rt.send = pw.send
+        rt.pool = pw.pool
+        if pw.error is not None:
+            self.logger.warning(f'Prewarming failed, constructing on demand: {pw.error!r}')
+        self.logger.debug(
+            f'Prewarming took {pw.elapsed * 1e3:.0f} ms, waited {waited * 1e3:.0f} ms for it, '
+            f'hid {max(pw.elapsed - waited, 0.0) * 1e3:.0f} ms')
 
     def close(self: _T) -> None:
         # on YDL close
-        if self.ie.__yt_dlp_plugin__apple_webkit_jsi__webview is not None:
-            self.logger.trace('ydl died, performing cleanup')
-            self.ie.__yt_dlp_plugin__apple_webkit_jsi__webview.__exit__(None, None, None)
-            self.ie.__yt_dlp_plugin__apple_webkit_jsi__webview = None
-            self.ie.__yt_dlp_plugin__apple_webkit_jsi__factory.__exit__(None, None, None)
-            # the Factory class has assertions, don't have to reset to None
+        try:
+            rt = self.ie.__yt_dlp_plugin__apple_webkit_jsi__runtime
+        except AttributeError:
+            return
+        if rt is None:
+            return
+        self.ie.__yt_dlp_plugin__apple_webkit_jsi__runtime = None
+        if (logger := rt.release(self.logger)) is not None:
+            self.logger.trace(f'runtime still borrowed {len(rt.loggers)} time(s), not cleaning up')
+            with rt.lock:
+                # or the factory keeps logging to this YoutubeDL, which is going away, until the next solve
+                self._join_prewarm(rt)
+                if rt.send is not None:
+                    rt.factory.set_logger(logger)
+            return
+        with rt.lock:
+            self._join_prewarm(rt)
+            if rt.pool is not None:
+                if (recycled := rt.pool.format_recycled()) is not None:
+                    self.logger.debug(f'Webviews recycled: {recycled}')
+                self.logger.trace('ydl died, performing cleanup')
+                rt.pool.__exit__(None, None, None)
+                rt.pool = None
+            if rt.send is not None:
+                rt.send = None
+                if (stats := rt.factory.format_stats()) is not None:
+                    self.logger.debug(f'WebKit task latencies:\n{stats}')
+                if (counts := rt.factory.format_bridge_counts()) is not None:
+                    self.logger.debug(f'ObjC bridge crossings:\n{counts}')
+                rt.factory.set_logger(self.logger)
+                rt.factory.__exit__(None, None, None)
+                # the Factory class has assertions, don't have to reset to None
 
     def is_available(self: _T) -> bool:
         ures = os.uname()
         return AppleWebKitMixin.IS_AVAIL and ures.sysname == 'Darwin' and version_tuple(ures.release) >= DarwinMinVer
 
-    def _get_webview_lazy(self: _T):
-        # TODO: maybe start the construction earlier on a-shell to improve performance?
-        if self.ie.__yt_dlp_plugin__apple_webkit_jsi__webview is None:
-            self.logger.info('Constructing webview')
-            try:
-                send = self.ie.__yt_dlp_plugin__apple_webkit_jsi__factory.__enter__()
-                self.ie.__yt_dlp_plugin__apple_webkit_jsi__factory.set_logger(self.logger)
-                self.ie.__yt_dlp_plugin__apple_webkit_jsi__webview = wv = WKJSE_Webview(send).__enter__()
-                # TODO: this is yt specific, move to somewhere else
-                # wv.navigate_to('https://www.youtube.com/watch?v=yt-dlp-wins', '<!DOCTYPE html><html lang="en"><head><title></title></head><body></body></html>')
-            except Exception:
-                AppleWebKitMixin.IS_AVAIL = False
-                raise
+    def _get_pool_lazy(self: _T) -> WKJSE_Pool:
+        rt = self._runtime()
+        with rt.lock:
+            self._join_prewarm(rt)
+            if rt.pool is None:
+                try:
+                    if rt.send is None:
+                        rt.send, _ = self._enter_factory()
+                    rt.factory.set_logger(self.logger)
+                    rt.pool = self._new_pool(rt.send)
+                except Exception:
+                    AppleWebKitMixin.IS_AVAIL = False
+                    raise
             else:
-                self.logger.info('Webview constructed')
-                return wv
-        else:
-            self.ie.__yt_dlp_plugin__apple_webkit_jsi__factory.set_logger(self.logger)
-            return self.ie.__yt_dlp_plugin__apple_webkit_jsi__webview
+                # the runtime may be shared with another YoutubeDL
+                rt.factory.set_logger(self.logger)
+            return rt.pool
 
 __all__ = []
@@ -1,7 +1,13 @@
-from typing import cast as py_typecast
+import hashlib
+import json
+import time
+
+from contextlib import ExitStack
+from typing import Callable, Optional, cast as py_typecast
 
 from yt_dlp.extractor.youtube.jsc.provider import (
     JsChallengeProviderError,
+    JsChallengeProviderRejectedRequest,
     register_provider,
     register_preference,
     JsChallengeProvider,
@@ -11,53 +17,382 @@ from yt_dlp.extractor.youtube.jsc.provider import (
 # PRIVATE API! Keep an eye on upstream changes
 from yt_dlp.extractor.youtube.jsc._builtin.ejs import EJSBaseJCP
 
+from ._ytjsc_cache import ChallengeResultCache, ChallengeResultStore
+from ._ytjsc_corpus import record_call
 from .webkit_jsi import AppleWebKitMixin, _IEWithAttr
-from ..webkit_jsi.lib.logging import AbstractLogger
-from ..webkit_jsi.lib.api import WKJS_UncaughtException, WKJS_LogType
-from ..webkit_jsi.lib.easy import jsres_to_log
+from ..webkit_jsi.lib.logging import AbstractLogger, trace_enabled
+from ..webkit_jsi.lib.api import DefaultJSResult, WKJS_Timeout, WKJS_UncaughtException, WKJS_LogType
+from ..webkit_jsi.lib.easy import WKJSE_Webview, jsres_to_log, log_records
+
+
+class _EJSStdin(str):
+    """The EJS stdin, plus the parts it was constructed from"""
+    player: str
+    player_key: str
+    preprocessed: bool
+    requests: list[dict]
+
+
+# Installs the solver library into the global scope of the webview, which survives across `execute_js` calls
+EJS_INSTALL_SUFFIX = r'''
+globalThis.__yt_dlp_wkjsi_ejs = {solverKey, jsc, players: new Map()};
+'''
+# Answers the requests with the installed solver, returns the output as JSON
+# or {missing} with the static part that has to be sent first
+EJS_RUN_SCRIPT = r'''
+const ejs = globalThis.__yt_dlp_wkjsi_ejs;
+if (ejs?.solverKey !== solverKey)
+    return {missing: 'solver'};
+let output;
+if (input.type === 'player') {
+    const wanted = input.output_preprocessed;
+    input.output_preprocessed = true;
+    output = ejs.jsc(input);
+    if (output.preprocessed_player !== undefined) {
+        ejs.players.set(playerKey, output.preprocessed_player);
+        if (!wanted)
+            delete output.preprocessed_player;
+    }
+} else {
+    if (input.preprocessed_player === undefined) {
+        const player = ejs.players.get(playerKey);
+        if (player === undefined)
+            return {missing: 'player'};
+        // move to the end so that the least recently used player goes first
+        ejs.players.delete(playerKey);
+        ejs.players.set(playerKey, player);
+        input.preprocessed_player = player;
+    } else {
+        ejs.players.set(playerKey, input.preprocessed_player);
+    }
+    output = ejs.jsc(input);
+}
+while (ejs.players.size > maxPlayers)
+    ejs.players.delete(ejs.players.keys().next().value);
+return JSON.stringify(output);
+'''
+
+
+def _split_requests(requests: list[dict], n: int) -> list[tuple[list[int], list[dict]]]:
+    """The challenges dealt out over at most `n` lists of requests, each with the indices of the requests it is part of"""
+    flat = [(i, challenge) for i, request in enumerate(requests) for challenge in request['challenges']]
+    if min(n, len(flat)) <= 1:
+        return [(list(range(len(requests))), requests)]
+    split = []
+    for k in range(min(n, len(flat))):
+        parts: dict[int, list[str]] = {}
+        for i, challenge in flat[k::n]:
+            parts.setdefault(i, []).append(challenge)
+        split.append((list(parts), [{'type': requests[i]['type'], 'challenges': parts[i]} for i in parts]))
+    return split
+
+
+def _merge_outputs(requests: list[dict], split: list[tuple[list[int], list[dict]]], outputs: list[str]) -> str:
+    """The EJS output for `requests`, from the outputs for the parts of _split_requests"""
+    if len(outputs) == 1:
+        return outputs[0]
+    responses: list[dict] = [{'type': 'result', 'data': {}} for _ in requests]
+    merged: dict = {}
+    for (idxs, _), output in zip(split, outputs):
+        merged = json.loads(output)
+        if merged.get('type') != 'result':
+            return output
+        for i, response in zip(idxs, merged['responses']):
+            if response.get('type') != 'result':
+                responses[i] = response
+            elif responses[i].get('type') == 'result':
+                responses[i]['data'].update(response['data'])
+    return json.dumps({**merged, 'responses': responses})
 
 
 @register_provider
 class AppleWebKitJCP(AppleWebKitMixin['AppleWebKitJCP'], EJSBaseJCP):
     __slots__ = ()
     JS_RUNTIME_NAME = AppleWebKitMixin.PROVIDER_NAME
+    # preprocessed players kept in each webview
+    EJS_MAX_PLAYERS = 4
+    # solved challenges, shared by all instances
+    _result_cache = ChallengeResultCache(4096)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ie = py_typecast(_IEWithAttr, self.ie)
         self.logger = py_typecast(AbstractLogger, self.logger)
         self._try_init_factory()
+        self._start_prewarm()
+
+    def _construct_stdin(self, player: str, preprocessed: bool, requests: list[JsChallengeRequest], /) -> str:
+        stdin = _EJSStdin(super()._construct_stdin(player, preprocessed, requests))
+        stdin.player = player
+        stdin.player_key = hashlib.sha256(player.encode()).hexdigest()
+        stdin.preprocessed = preprocessed
+        stdin.requests = [{
+            'type': request.type.value,
+            'challenges': request.input.challenges,
+        } for request in requests]
+        return stdin
+
+    def _ejs_data(self, stdin: _EJSStdin, requests: list[dict]) -> dict:
+        if stdin.preprocessed:
+            return {'type': 'preprocessed', 'preprocessed_player': stdin.player, 'requests': requests}
+        return {
+            'type': 'player',
+            'player': stdin.player,
+            'requests': requests,
+            # upstream always asks for it, but only keeps it with _ENABLE_PREPROCESSED_PLAYER_CACHE.
+            # It is the size of the player, so it is only sent back from the webview when it is kept
+            'output_preprocessed': self._ENABLE_PREPROCESSED_PLAYER_CACHE,
+        }
+
+    def _run_scripts(self, jobs: list[tuple[WKJSE_Webview, list[str]]], concurrent: bool) -> list[DefaultJSResult]:
+        """
+        Runs the scripts of each job in order on its webview, returns what the last one of each returned.
+        With `concurrent`, the jobs are submitted all at once and only then waited for
+        """
+        timeout = self._timeout()
+        if not concurrent:
+            return [[webview.execute_js(script, timeout=timeout) for script in scripts][-1] for webview, scripts in jobs]
+        futs = [[webview.submit_js(script, timeout=timeout) for script in scripts] for webview, scripts in jobs]
+        return [[fut.result() for fut in job][-1] for job in futs]
+
+    def _run_ejs(
+        self, webviews: list[WKJSE_Webview], stdin: _EJSStdin, parts: list[list[dict]], concurrent: bool,
+    ) -> list[str]:
+        # same as the stdin, but the output is the return value instead of a console.log
+        return py_typecast(list[str], self._run_scripts([(webview, [''.join((
+            self._lib_script.code, '\nObject.assign(globalThis, lib);\n',
+            self._core_script.code, f'\nreturn JSON.stringify(jsc({json.dumps(self._ejs_data(stdin, requests))}));\n',
+        ))]) for webview, requests in zip(webviews, parts)], concurrent))
+
+    def _solver_key(self) -> str:
+        return f'{self._lib_script.hash[:16]}:{self._core_script.hash[:16]}'
+
+    def _install_script(self, solver_key: str) -> str:
+        return ''.join((
+            f'const solverKey = {json.dumps(solver_key)};\n',
+            self._lib_script.code, '\nObject.assign(globalThis, lib);\n',
+            self._core_script.code, EJS_INSTALL_SUFFIX))
+
+    def _install_solver(self, webview: WKJSE_Webview, solver_key: str) -> None:
+        self.logger.trace(f'installing solver {solver_key} into the webview')
+        webview.execute_js(self._install_script(solver_key), timeout=self._timeout())
+
+    def _prewarm_webview(self, webview: WKJSE_Webview) -> None:
+        if self._configuration_arg('solver_cache', ['true'])[0] != 'false':
+            self._install_solver(webview, self._solver_key())
+
+    def _prepare_script(self) -> Optional[str]:
+        if self._configuration_arg('solver_cache', ['true'])[0] == 'false':
+            return None
+        try:
+            return self._install_script(self._solver_key())
+        except JsChallengeProviderRejectedRequest:
+            # the solve that needs it reports it
+            return None
+
+    def _run_ejs_cached(
+        self, webviews: list[WKJSE_Webview], stdin: _EJSStdin, parts: list[list[dict]], concurrent: bool,
+    ) -> list[str]:
+        solver_key = self._solver_key()
+        player_key = stdin.player_key
+
+        def run_script(requests: list[dict], ship_player: bool) -> str:
+            data = self._ejs_data(stdin, requests) if ship_player else {'type': 'preprocessed', 'requests': requests}
+            return (
+                f'const solverKey = {json.dumps(solver_key)}, playerKey = {json.dumps(player_key)}, '
+                f'maxPlayers = {self.EJS_MAX_PLAYERS}, input = {json.dumps(data)};\n{EJS_RUN_SCRIPT}')
+
+        outputs: list[Optional[str]] = [None] * len(parts)
+        shipped = [False] * len(parts)
+        jobs = [[run_script(requests, False)] for requests in parts]
+        for _ in range(3):
+            if not (todo := [k for k, output in enumerate(outputs) if output is None]):
+                break
+            for k, output in zip(todo, self._run_scripts([(webviews[k], jobs[k]) for k in todo], concurrent)):
+                if isinstance(output, str):
+                    outputs[k] = output
+                    continue
+                missing = output.get('missing') if isinstance(output, dict) else output
+                if missing == 'solver':
+                    self.logger.trace(f'installing solver {solver_key} into the webview')
+                    jobs[k] = [self._install_script(solver_key), run_script(parts[k], True)]
+                elif missing == 'player' and not shipped[k]:
+                    self.logger.trace(f'player {player_key} is not loaded in the webview')
+                    jobs[k] = [run_script(parts[k], True)]
+                else:
+                    raise JsChallengeProviderError(f'Failed to load the solver into the webview (got {output!r})')
+                shipped[k] = True
+        if None in outputs:
+            raise JsChallengeProviderError('Failed to load the solver into the webview')
+        return py_typecast(list[str], outputs)
+
+    def _result_store(self) -> Optional[ChallengeResultStore]:
+        if not self.ie.cache.enabled or self._configuration_arg('result_store', ['true'])[0] == 'false':
+            return None
+        try:
+            ttl = float(self._configuration_arg('result_store_ttl', ['7'])[0]) * 86400
+        except ValueError as e:
+            self.logger.warning(f'Invalid result_store_ttl: {e}', once=True)
+            return None
+        return ChallengeResultStore.open(self.ie.cache, ttl)
+
+    def _solve_with_result_cache(self, stdin: _EJSStdin, solve: Callable[[list[dict]], str]) -> str:
+        # only the challenges that were never solved for this player go to the solver
+        cache = self._result_cache
+        store = self._result_store()
+        known: list[dict[str, str]] = []
+        unsolved: dict[tuple[str, str], None] = {}
+        for request in stdin.requests:
+            data = {}
+            for challenge in request['challenges']:
+                if (res := cache.get((stdin.player_key, request['type'], challenge))) is None:
+                    unsolved[request['type'], challenge] = None
+                else:
+                    data[challenge] = res
+            known.append(data)
+        if unsolved and store is not None:
+            stored = store.get_many(stdin.player_key, list(unsolved))
+            for (ctype, challenge), res in stored.items():
+                cache.put((stdin.player_key, ctype, challenge), res)
+                del unsolved[ctype, challenge]
+            for request, data in zip(stdin.requests, known):
+                data.update(
+                    (challenge, stored[request['type'], challenge]) for challenge in request['challenges']
+                    if (request['type'], challenge) in stored)
+
+        # each challenge once, and only the requests with any left
+        unknown = [
+            [challenge for challenge in dict.fromkeys(request['challenges']) if challenge not in data]
+            for request, data in zip(stdin.requests, known)]
+        missing = [
+            {'type': request['type'], 'challenges': challenges}
+            for request, challenges in zip(stdin.requests, unknown) if challenges]
+        if not missing:
+            self.logger.trace(f'all challenges answered from the cache: {cache!r}, {store!r}')
+            return json.dumps({'type': 'result', 'responses': [{'type': 'result', 'data': data} for data in known]})
+
+        output = json.loads(solve(missing))
+        if output.get('type') != 'result':
+            return json.dumps(output)
+        solved = iter(output['responses'])
+        responses = []
+        new_results: dict[tuple[str, str], str] = {}
+        for request, data, challenges in zip(stdin.requests, known, unknown):
+            if not challenges:
+                responses.append({'type': 'result', 'data': data})
+                continue
+            response = next(solved)
+            if response.get('type') == 'result':
+                for challenge, res in response['data'].items():
+                    cache.put((stdin.player_key, request['type'], challenge), res)
+                    new_results[request['type'], challenge] = res
+                response = {**response, 'data': {**data, **response['data']}}
+            responses.append(response)
+        output['responses'] = responses
+        if store is not None:
+            # Cache.store reports its own failures
+            store.put_many(stdin.player_key, new_results)
+        return json.dumps(output)
+
+    def _record(self, stdin: _EJSStdin, output: str, elapsed: float) -> None:
+        root = self._configuration_arg('record', [''], casesense=True)[0]
+        if not root:
+            return
+        try:
+            record_call(root, stdin.player, {
+                'player_key': stdin.player_key,
+                'preprocessed': stdin.preprocessed,
+                'requests': stdin.requests,
+                'output': output,
+                'elapsed': elapsed,
+            })
+        except OSError as e:
+            self.logger.warning(f'Failed to record the challenges into {root}: {e}', once=True)
 
     def _run_js_runtime(self, stdin: str, /) -> str:
-        self.logger.trace(f'solving challenge, script length: {len(stdin)}')
-        result = ''
-        err = ''
+        start = time.perf_counter()
+        trace_on = trace_enabled(self.logger)
+        if trace_on:
+            self.logger.trace(f'solving challenge, script length: {len(stdin)}')
+        # the output is the return value of the script, the logs are only for diagnostics
+        # unless the stdin is not from _construct_stdin, in which case the output is logged
+        structured = isinstance(stdin, _EJSStdin)
+        logged: list[str] = []
+        errs: list[str] = []
 
         def on_log(msg):
-            nonlocal result, err
-            assert isinstance(msg, dict)
-            ltype, args = WKJS_LogType(msg['logType']), msg['argsArr']
-            str_to_log = jsres_to_log(*args)
-            self.logger.trace(f'[JS][{ltype.name}] {str_to_log}')
-            if ltype == WKJS_LogType.ERR:
-                err += str_to_log
-            elif ltype == WKJS_LogType.INFO:
-                result += str_to_log
+            for record in log_records(msg):
+                ltype = WKJS_LogType(record['logType'])
+                is_output = ltype == WKJS_LogType.INFO and not structured
+                if not (trace_on or is_output or ltype == WKJS_LogType.ERR):
+                    continue
+                str_to_log = jsres_to_log(*py_typecast(list, record['argsArr']))
+                if trace_on:
+                    self.logger.trace(f'[JS][{ltype.name}] {str_to_log}')
+                if ltype == WKJS_LogType.ERR:
+                    errs.append(str_to_log)
+                elif is_output:
+                    logged.append(str_to_log)
 
         # the default exception handler doesn't let you see the stacktrace
         # script = 'try{' + stdin + '}catch(e){console.error(e.toString(), e.stack.toString());}'
         script = stdin
-        webview = self._get_webview_lazy()
-        webview.on_script_log(on_log)
+
         try:
-            webview.execute_js(script)
+            if not structured:
+                with self._runtime().lock:
+                    pool = self._get_pool_lazy()
+                    pool.on_script_log(on_log)
+                    with pool.acquire() as webview:
+                        webview.execute_js(script, timeout=self._timeout())
+                result = ''.join(logged)
+            else:
+                ejs_stdin = py_typecast(_EJSStdin, stdin)
+                run_ejs = (
+                    self._run_ejs_cached if self._configuration_arg('solver_cache', ['true'])[0] != 'false'
+                    else self._run_ejs)
+
+                def solve(requests: list[dict]) -> str:
+                    # the runtime may be shared with other threads
+                    rt = self._runtime()
+                    with rt.lock:
+                        pool = self._get_pool_lazy()
+                        pool.on_script_log(on_log)
+                        # the challenges are spread over the webviews and solved at once, where SUBMIT is served
+                        concurrent = not rt.remote and len(pool) > 1
+                        split = _split_requests(requests, len(pool) if concurrent else 1)
+                        with ExitStack() as exsk:
+                            webviews = [exsk.enter_context(pool.acquire()) for _ in split]
+                            outputs = run_ejs(webviews, ejs_stdin, [part for _, part in split], concurrent)
+                    return _merge_outputs(requests, split, outputs)
+
+                if self._configuration_arg('result_cache', ['true'])[0] != 'false':
+                    # repeats are answered without touching the webview
+                    result = self._solve_with_result_cache(ejs_stdin, solve)
+                else:
+                    result = solve(ejs_stdin.requests)
         except WKJS_UncaughtException as e:
             raise JsChallengeProviderError(repr(e), False)
-        self.logger.trace(f'Javascript returned {result=}, {err=}')
+        except WKJS_Timeout as e:
+            # the webview is replaced before the next solve, meanwhile another provider can try
+            raise JsChallengeProviderError(f'Apple WebKit timed out: {e}', False)
+        err = ''.join(errs)
+        if trace_on:
+            self.logger.trace(f'Javascript returned {result=}, {err=}')
         if err:
             raise JsChallengeProviderError(f'Error running Apple WebKit: {err}')
+        if structured:
+            self._record(py_typecast(_EJSStdin, stdin), result, time.perf_counter() - start)
         return result
 
+    def close(self) -> None:
+        if self._result_cache.hits or self._result_cache.misses:
+            self.logger.debug(f'Challenge result cache: {self._result_cache!r}')
+        store = ChallengeResultStore.opened(self.ie.cache)
+        if store is not None and (store.hits or store.misses):
+            self.logger.debug(f'Challenge result store: {store!r}')
+        super().close()
+
 
 @register_preference(AppleWebKitJCP)
 def apple_webkit_jcp_preference(provider: JsChallengeProvider, requests: list[JsChallengeRequest]) -> int:
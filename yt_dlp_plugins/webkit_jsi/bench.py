@@ -0,0 +1,381 @@
+"""
+Replays a corpus recorded with the record extractor arg of AppleWebKitJCP (see README) through the provider,
+and reports the throughput, the latency percentiles, the memory high-water mark and the ObjC bridge crossings of
+- cold: a new runtime for every solve (setting up WebKit, constructing the webview and loading the solver and the player)
+- warm: the solver and the players already loaded in the webview, the result cache disabled
+- cached: every challenge answered from the result cache
+- uncached: (not run by default) the whole solver and player sent for every solve, i.e. solver_cache=false
+
+By default the runtime is sim_objc.py, whose JS engine answers from the corpus, so that the numbers can be compared
+on any platform: everything between the provider and the ObjC bridge is the real code, the JS and WebKit are not.
+`--backend webkit` runs the real solver on macOS, and checks that it still gives the recorded outputs.
+
+    python -m yt_dlp_plugins.webkit_jsi.bench CORPUS_DIR
+    python -m yt_dlp_plugins.webkit_jsi.bench --synthetic
+"""
+
+import hashlib
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from typing import Any, Callable, Generator, Optional, cast as py_typecast
+
+from yt_dlp import YoutubeDL
+from yt_dlp.globals import plugin_dirs
+from yt_dlp.extractor.youtube.jsc.provider import (
+    JsChallengeProviderRejectedRequest,
+    JsChallengeRequest,
+    JsChallengeType,
+    NChallengeInput,
+    SigChallengeInput,
+)
+# PRIVATE API! Keep an eye on upstream changes
+from yt_dlp.extractor.youtube.jsc._builtin.ejs import Script, ScriptSource, ScriptType, ScriptVariant
+from yt_dlp.extractor.youtube.pot._director import YoutubeIEContentProviderLogger
+
+from ..extractor._ytjsc_corpus import CORPUS_CALL, load_corpus
+from ..extractor.webkit_jsi import _SharedRuntime
+from ..extractor.ytjsc import EJS_INSTALL_SUFFIX, AppleWebKitJCP
+from .lib.api import SENDMSG_CBTYPE, DefaultJSResult, get_gen
+from .lib.stats import LatencyHistogram, peak_rss
+
+
+SCENARIOS = 'cold', 'warm', 'cached', 'uncached'
+BACKENDS = 'sim-objc', 'sim', 'webkit'
+_RUN_HEAD = 'const solverKey = '
+_RUN_HEADER_END = ';\n'
+_UNCACHED_HEAD = '\nreturn JSON.stringify(jsc('
+_UNCACHED_TAIL = '));\n'
+
+
+class ReplayEngine:
+    """
+    The JS engine of the simulated backends: answers the scripts of AppleWebKitJCP from the corpus,
+    keeping the solver and the players "loaded" per webview like EJS_INSTALL_SUFFIX and EJS_RUN_SCRIPT do.
+    One per runtime, the handles of the webviews are only unique within a backend.
+    """
+    __slots__ = '_responses', '_results', '_webviews'
+
+    def __init__(self, calls: list[CORPUS_CALL]):
+        # whole requests, for the recorded errors
+        self._responses: dict[tuple[str, str], dict] = {}
+        # (player key, type, challenge): result
+        self._results: dict[tuple[str, str, str], str] = {}
+        # handle: [solver key, {player key: None}]
+        self._webviews: dict[int, list[Any]] = {}
+        for call in calls:
+            output = json.loads(call['output'])
+            if output.get('type') != 'result':
+                continue
+            for request, response in zip(call['requests'], output['responses']):
+                self._responses[call['player_key'], json.dumps(request)] = response
+                if response.get('type') == 'result':
+                    for challenge, res in response['data'].items():
+                        self._results[call['player_key'], request['type'], challenge] = res
+
+    def _respond(self, player_key: str, requests: list[dict]) -> str:
+        responses = []
+        for request in requests:
+            data = {}
+            for challenge in request['challenges']:
+                if (res := self._results.get((player_key, request['type'], challenge))) is None:
+                    break
+                data[challenge] = res
+            else:
+                responses.append({'type': 'result', 'data': data})
+                continue
+            responses.append(self._responses.get((player_key, json.dumps(request))) or {
+                'type': 'error', 'error': f'{request["type"]} challenge not in the corpus'})
+        return json.dumps({'type': 'result', 'responses': responses})
+
+    def __call__(self, wv: Any, script: str) -> DefaultJSResult:
+        state = self._webviews.setdefault(wv.handle, [None, {}])
+        if script.startswith(_RUN_HEAD) and script.endswith(EJS_INSTALL_SUFFIX):
+            state[0] = json.loads(script[len(_RUN_HEAD):script.index(_RUN_HEADER_END)])
+            return None
+        if script.startswith(_RUN_HEAD):
+            # const solverKey = ..., playerKey = ..., maxPlayers = ..., input = ...;
+            header = script[:script.index('\n')]
+            solver_key, rest = header[len(_RUN_HEAD):].split(', playerKey = ', 1)
+            player_key, rest = rest.split(', maxPlayers = ', 1)
+            max_players, data = rest.split(', input = ', 1)
+            if state[0] != json.loads(solver_key):
+                return {'missing': 'solver'}
+            player_key = json.loads(player_key)
+            data = json.loads(data[:-1])
+            players: dict[str, None] = state[1]
+            if data['type'] == 'preprocessed' and 'preprocessed_player' not in data and player_key not in players:
+                return {'missing': 'player'}
+            players.pop(player_key, None)
+            players[player_key] = None
+            while len(players) > int(max_players):
+                del players[next(iter(players))]
+            return self._respond(player_key, data['requests'])
+        if (idx := script.rfind(_UNCACHED_HEAD)) != -1 and script.endswith(_UNCACHED_TAIL):
+            data = json.loads(script[idx + len(_UNCACHED_HEAD):-len(_UNCACHED_TAIL)])
+            player = data['player'] if data['type'] == 'player' else data['preprocessed_player']
+            return self._respond(hashlib.sha256(player.encode()).hexdigest(), data['requests'])
+        return None
+
+
+def synthetic_corpus(
+    n_players: int = 3, n_calls: int = 8, player_size: int = 2 << 20, seed: int = 0,
+) -> tuple[dict[str, str], list[CORPUS_CALL]]:
+    """A corpus of made up players and challenges for when there is no recorded one, the answers are the reverse"""
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_'
+    players: dict[str, str] = {}
+    calls: list[CORPUS_CALL] = []
+    for i in range(n_players):
+        body = ''.join(rng.choices(alphabet, k=4096))
+        player = f'// synthetic player {i}\n' + f'var _ = "{body}";\n' * (player_size // (len(body) + 12))
+        key = hashlib.sha256(player.encode()).hexdigest()
+        players[key] = player
+        for _ in range(n_calls):
+            requests = [
+                {'type': 'n', 'challenges': [''.join(rng.choices(alphabet, k=16))]},
+                {'type': 'sig', 'challenges': [''.join(rng.choices(alphabet, k=100)) for _ in range(2)]},
+            ]
+            calls.append({
+                'player_key': key,
+                'preprocessed': False,
+                'requests': requests,
+                'output': json.dumps({'type': 'result', 'responses': [
+                    {'type': 'result', 'data': {c: c[::-1] for c in request['challenges']}} for request in requests]}),
+                'elapsed': 0.0,
+            })
+    return players, calls
+
+
+def _gen_factory(backend: str, calls: list[CORPUS_CALL], latency: float) -> Callable[..., Generator[SENDMSG_CBTYPE, None, None]]:
+    if backend == 'webkit':
+        return get_gen
+    elif backend == 'sim':
+        from .lib.sim import get_sim_gen
+
+        def sim_gen(logger, **kwargs):
+            return get_sim_gen(logger, engine=ReplayEngine(calls), latency=latency, **kwargs)
+        return sim_gen
+    else:
+        from .lib.sim_objc import get_sim_objc_gen
+
+        def sim_objc_gen(logger, **kwargs):
+            return get_sim_objc_gen(logger, engine=ReplayEngine(calls), latency=latency, **kwargs)
+        return sim_objc_gen
+
+
+def _requests_of(call: CORPUS_CALL) -> list[JsChallengeRequest]:
+    return [JsChallengeRequest(
+        type=JsChallengeType(request['type']),
+        input=(NChallengeInput if request['type'] == 'n' else SigChallengeInput)('', request['challenges']),
+    ) for request in call['requests']]
+
+
+class _Scenario:
+    __slots__ = 'allocs', 'cfunctypes', 'heap_peak', 'hist', 'maxrss', 'messages', 'mismatches', 'name', 'wall'
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hist = LatencyHistogram()
+        self.wall = 0.0
+        self.mismatches = 0
+        self.messages = self.allocs = self.cfunctypes = 0
+        self.maxrss = 0.0
+        self.heap_peak: Optional[float] = None
+
+    def summary(self) -> dict[str, Any]:
+        n = self.hist.count or 1
+        return {
+            **self.hist.summary(),
+            'throughput': self.hist.count / self.wall if self.wall else 0.0,
+            'mismatches': self.mismatches,
+            'messages_per_solve': self.messages / n,
+            'allocs_per_solve': self.allocs / n,
+            'cfunctypes_per_solve': self.cfunctypes / n,
+            'maxrss_mb': self.maxrss,
+            'heap_peak_mb': self.heap_peak,
+        }
+
+
+def _bridge_totals(provider: AppleWebKitJCP) -> tuple[int, int, int]:
+    counts = provider._runtime().factory.bridge_counts() or {}
+    return (
+        sum(sum(py_typecast(dict, d['send_message']).values()) for d in counts.values()),
+        sum(py_typecast(int, d['alloc']) for d in counts.values()),
+        sum(py_typecast(int, d['cfunctype']) for d in counts.values()))
+
+
+class Bench:
+    __slots__ = 'calls', 'ie', 'players', 'stand_in_lib', 'verbose', 'ydl'
+
+    def __init__(self, ydl: YoutubeDL, players: dict[str, str], calls: list[CORPUS_CALL], *, verbose: bool = False):
+        self.ydl = ydl
+        self.ie = ydl.get_info_extractor('Youtube')
+        self.players = players
+        self.calls = calls
+        self.verbose = verbose
+        self.stand_in_lib: Optional[Script] = None
+
+    def use_stand_in_lib(self) -> bool:
+        """
+        yt-dlp only vendors an import-only lib script, the usable one comes from yt-dlp-ejs or the cache.
+        The replay engine doesn't run it, so a placeholder of the same order of size does for the simulated backends
+        """
+        provider = self._provider()
+        try:
+            lib: Optional[Script] = provider._lib_script
+        except JsChallengeProviderRejectedRequest:
+            lib = None
+        finally:
+            provider.close()
+        if lib is not None:
+            return False
+        self.stand_in_lib = Script(
+            ScriptType.LIB, ScriptVariant.UNKNOWN, ScriptSource.BUILTIN, AppleWebKitJCP._SCRIPT_VERSION,
+            '// stand-in for the yt-dlp-ejs lib script\nconst lib = {};\n' + ('//' + '.' * 77 + '\n') * ((96 << 10) // 80))
+        return True
+
+    def _provider(self, **settings: str) -> AppleWebKitJCP:
+        logger = YoutubeIEContentProviderLogger(
+            self.ie, 'jsc:apple-webkit-jsi',
+            log_level=YoutubeIEContentProviderLogger.LogLevel.TRACE if self.verbose else None)
+        provider = AppleWebKitJCP(self.ie, logger, {
+            'stats': ['bridge'], 'result_store': ['false'], **{k: [v] for k, v in settings.items()}})
+        if self.stand_in_lib is not None:
+            # before the cached property is first read
+            provider.__dict__['_lib_script'] = self.stand_in_lib
+        return provider
+
+    def _solve(self, provider: AppleWebKitJCP, call: CORPUS_CALL, sc: Optional[_Scenario]) -> None:
+        start = time.perf_counter()
+        stdin = provider._construct_stdin(self.players[call['player_key']], call['preprocessed'], _requests_of(call))
+        output = provider._run_js_runtime(stdin)
+        elapsed = time.perf_counter() - start
+        if sc is not None:
+            sc.hist.add(elapsed)
+            sc.wall += elapsed
+            if json.loads(output).get('responses') != json.loads(call['output']).get('responses'):
+                sc.mismatches += 1
+
+    def cold(self, runs: int) -> _Scenario:
+        sc = _Scenario('cold')
+        for i in range(runs):
+            provider = self._provider(result_cache='false')
+            try:
+                self._solve(provider, self.calls[i % len(self.calls)], sc)
+                msgs, allocs, cfts = _bridge_totals(provider)
+            finally:
+                provider.close()
+            sc.messages += msgs
+            sc.allocs += allocs
+            sc.cfunctypes += cfts
+        return sc
+
+    def _repeated(self, name: str, repeat: int, **settings: str) -> _Scenario:
+        sc = _Scenario(name)
+        AppleWebKitJCP._result_cache.clear()
+        provider = self._provider(**settings)
+        try:
+            # loads the solver and the players, and fills the result cache
+            for call in self.calls:
+                self._solve(provider, call, None)
+            before = _bridge_totals(provider)
+            for _ in range(repeat):
+                for call in self.calls:
+                    self._solve(provider, call, sc)
+            msgs, allocs, cfts = (after - b for after, b in zip(_bridge_totals(provider), before))
+        finally:
+            provider.close()
+        sc.messages, sc.allocs, sc.cfunctypes = msgs, allocs, cfts
+        return sc
+
+    def run(self, name: str, *, cold_runs: int, repeat: int, trace_heap: bool) -> _Scenario:
+        if trace_heap:
+            tracemalloc.start()
+        try:
+            if name == 'cold':
+                sc = self.cold(cold_runs)
+            elif name == 'warm':
+                sc = self._repeated(name, repeat, result_cache='false')
+            elif name == 'cached':
+                sc = self._repeated(name, repeat)
+            else:
+                sc = self._repeated(name, repeat, result_cache='false', solver_cache='false')
+            if trace_heap:
+                sc.heap_peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        finally:
+            if trace_heap:
+                tracemalloc.stop()
+        sc.maxrss = peak_rss() / (1 << 20)
+        return sc
+
+
+def format_results(scenarios: list[_Scenario]) -> str:
+    lines = [f'{"scenario":<9} {"solves":>6} {"solves/s":>9} {"p50":>9} {"p95":>9} {"p99":>9} {"max":>9} {"msgs/solve":>10} {"allocs":>8} {"cfuncs":>7} {"maxrss":>9} {"heap":>9} mismatches']
+    for sc in scenarios:
+        s = sc.summary()
+        heap = '-' if s['heap_peak_mb'] is None else f'{s["heap_peak_mb"]:.1f}MB'
+        lines.append(
+            f'{sc.name:<9} {s["count"]:>6} {s["throughput"]:>9.1f} {s["p50"] * 1e3:>7.2f}ms {s["p95"] * 1e3:>7.2f}ms '
+            f'{s["p99"] * 1e3:>7.2f}ms {s["max"] * 1e3:>7.2f}ms {s["messages_per_solve"]:>10.1f} '
+            f'{s["allocs_per_solve"]:>8.1f} {s["cfunctypes_per_solve"]:>7.1f} {s["maxrss_mb"]:>7.1f}MB {heap:>9} '
+            f'{s["mismatches"]}')
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description='Replay a recorded challenge corpus through AppleWebKitJCP')
+    parser.add_argument('corpus', nargs='?', help='directory passed to the record extractor arg')
+    parser.add_argument('--synthetic', action='store_true', help='use made up players and challenges instead of a corpus')
+    parser.add_argument('--backend', choices=BACKENDS, default='sim-objc', help='what runs the scripts (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the simulated JS engine takes per script')
+    parser.add_argument('--scenarios', default='cold,warm,cached', help='comma separated, out of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--cold-runs', type=int, default=5, help='solves in the cold scenario (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='passes over the corpus in the other scenarios (default: %(default)s)')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the peak of the Python heap (slows everything down)')
+    parser.add_argument('--json', metavar='PATH', help='write the results as JSON, e.g. to compare two revisions')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the trace messages of the provider')
+    args = parser.parse_args(argv)
+    scenarios = args.scenarios.split(',')
+    if unknown := set(scenarios) - set(SCENARIOS):
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    if args.synthetic:
+        players, calls = synthetic_corpus()
+    elif args.corpus:
+        players, calls = load_corpus(args.corpus)
+    else:
+        parser.error('either a corpus or --synthetic is required')
+    if not calls:
+        parser.error('the corpus is empty')
+    print(
+        f'{len(calls)} solves, {len(players)} players '
+        f'({sum(len(p) for p in players.values()) / (1 << 20):.1f} MB), backend: {args.backend}')
+
+    _SharedRuntime.GEN_FACTORY = _gen_factory(args.backend, calls, args.latency)
+    # the provider is already imported from here, loading the plugins would register a second copy of it
+    plugin_dirs.value = []
+    results = []
+    with YoutubeDL({'quiet': not args.verbose, 'verbose': args.verbose, 'no_warnings': not args.verbose}) as ydl:
+        bench = Bench(ydl, players, calls, verbose=args.verbose)
+        if args.backend != 'webkit' and bench.use_stand_in_lib():
+            print('yt-dlp-ejs is not installed, using a stand-in lib script')
+        for name in scenarios:
+            results.append(bench.run(name, cold_runs=args.cold_runs, repeat=args.repeat, trace_heap=args.tracemalloc))
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'backend': args.backend,
+                'latency': args.latency,
+                'solves': len(calls),
+                'scenarios': {sc.name: sc.summary() for sc in results},
+            }, f, indent=2)
+    return 1 if any(sc.mismatches for sc in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
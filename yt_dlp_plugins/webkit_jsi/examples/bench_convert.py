@@ -0,0 +1,42 @@
+import sys
+import time
+
+from lib.logging import DefaultLoggerImpl
+from lib.easy import WKJSE_Factory, WKJSE_Webview
+
+ROUNDS = 20
+# ~2000 objects, ~6000 bridge-converted nodes per result
+SCRIPT = r'''
+return Array.from({length: 2000}, (_, i) => ({i, s: 'x' + i, a: [i, null]}));
+'''
+
+
+class NullTraceLogger(DefaultLoggerImpl):
+    """Trace is enabled (so every message gets formatted) but nothing is written"""
+    __slots__ = ()
+
+    def trace(self, message: str) -> None:
+        pass
+
+
+def bench(logger: DefaultLoggerImpl) -> float:
+    with WKJSE_Factory(logger) as send, WKJSE_Webview(send) as wv:
+        wv.execute_js(SCRIPT)  # warm up
+        best = float('inf')
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            wv.execute_js(SCRIPT)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+
+def main():
+    t_off = bench(DefaultLoggerImpl(trace=False))
+    t_on = bench(NullTraceLogger(trace=True))
+    print(f'trace off: {t_off * 1e3:8.2f} ms/result')
+    print(f' trace on: {t_on * 1e3:8.2f} ms/result ({t_on / t_off:.2f}x)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
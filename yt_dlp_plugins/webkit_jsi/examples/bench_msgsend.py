@@ -0,0 +1,49 @@
+import sys
+import timeit
+
+from ctypes import c_byte, c_void_p
+
+from lib.logging import DefaultLoggerImpl as Logger
+from lib.pyneapple_objc import PyNeApple
+
+N = 200000
+
+
+def main():
+    logger = Logger()
+    with PyNeApple(logger=logger) as pa:
+        pa.load_framework_from_path('Foundation')
+        NSObject = pa.safe_objc_getClass(b'NSObject')
+        NSString = pa.safe_objc_getClass(b'NSString')
+        obj = pa.safe_alloc_init(NSObject)
+        pa.release_on_exit(obj)
+
+        def uncached():
+            # what send_message did for every message before the caches
+            sel = c_void_p(pa.sel_registerName(b'isKindOfClass:'))
+            return pa.cfn_at(pa.pobjc_msgSend, c_byte, c_void_p, c_void_p, c_void_p)(obj, sel, NSString)
+
+        def cached():
+            return pa.send_message(obj, b'isKindOfClass:', NSString, restype=c_byte, argtypes=(c_void_p, ))
+
+        bound = pa.bind_message(b'isKindOfClass:', restype=c_byte, argtypes=(c_void_p, ))
+
+        def prebound():
+            return bound(obj, NSString)
+
+        fn_raw = pa.msgsend_fn(c_byte, (c_void_p, ))
+        sel_raw = pa.sel_of(b'isKindOfClass:')
+
+        def raw():
+            # lower bound: the ctypes call itself
+            return fn_raw(obj, sel_raw, NSString)
+
+        for name, fn in (('uncached', uncached), ('send_message', cached), ('bind_message', prebound), ('ctypes call', raw)):
+            assert not fn()
+            t = min(timeit.repeat(fn, number=N, repeat=3))
+            print(f'{name:>12}: {t / N * 1e9:8.1f} ns/send')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,7 +3,7 @@ HOST = r'''https://www.youtube.com/robots.txt'''
 SCRIPT = r'''
 try {
 console.log(typeof globalThis.XMLHttpRequest, typeof globalThis.window, typeof URL, typeof globalThis.document, typeof globalThis.navigator, typeof globalThis.self);
-const val = await Promise.all([3, null, true, new Date, false].map(communicate));
+const val = await communicateMany([3, null, true, new Date, false]);
 console.log('started generating pot, communicate result: ', val);
 // pot for browser, navigate to https://www.youtube.com/robots.txt first
 const USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36(KHTML, like Gecko)';
@@ -1,9 +1,11 @@
 import datetime as dt
 import enum
+import json
+import time
 
+from concurrent.futures import CancelledError, Future
 from contextlib import AsyncExitStack, ExitStack
 from ctypes import (
-    CFUNCTYPE,
     POINTER,
     Structure,
     byref,
@@ -11,18 +13,25 @@ from ctypes import (
     c_byte,
     c_char_p,
     c_double,
+    c_int32,
     c_int64,
     c_long,
     c_longlong,
+    c_size_t,
+    c_ssize_t,
     c_uint64,
     c_ulong,
     c_ulonglong,
     c_void_p,
     cast,
+    memmove,
+    py_object,
     string_at,
 )
 from dataclasses import dataclass
-from threading import Condition
+from functools import partial
+from queue import Empty, Queue
+from threading import Condition, get_ident
 from types import CoroutineType
 from typing import (
     Any,
@@ -38,15 +47,19 @@ from typing import (
     overload
 )
 
+from .consts import LOG_BATCH_PHOLDER, SCRIPT_PHOLDER, SCRIPT_PRELUDE, SCRIPT_TEMPL, SCRIPT_TEMPL_JSON
+from .logging import AbstractLogger
 from .pyneapple_objc import (
+    NULLABLE_VOIDP,
+    BridgeCounters,
+    CountingPyNeApple,
     CRet,
     NotNull_VoidP,
-    NULLABLE_VOIDP,
+    ObjCBackend,
     ObjCBlock,
     PyNeApple,
 )
-from .consts import SCRIPT_PHOLDER, SCRIPT_TEMPL
-from .logging import AbstractLogger
+from .stats import NULL_TIMER, WKJS_Stats, peak_rss, timer_of
 
 
 T = TypeVar('T')
@@ -54,41 +67,73 @@ U = TypeVar('U')
 V = TypeVar('V')
 
 
-# TODO: support exceptions
 class CFRL_Future(Awaitable[T]):
-    __slots__ = '_cbs', '_done', '_result'
+    __slots__ = '_cancelled', '_cbs', '_done', '_exc', '_result'
 
     def __init__(self):
         self._cbs: list[Callable[['CFRL_Future[T]'], None]] = []
         self._done = False
         self._result: Optional[T] = None
+        self._exc: Optional[BaseException] = None
+        self._cancelled = False
 
     def result(self) -> T:
         if not self._done:
             raise RuntimeError('result method called upon a future that is not yet resolved')
+        if self._cancelled:
+            raise CancelledError
+        if self._exc is not None:
+            raise self._exc
         return py_typecast(T, self._result)
 
+    def exception(self) -> Optional[BaseException]:
+        if not self._done:
+            raise RuntimeError('exception method called upon a future that is not yet resolved')
+        if self._cancelled:
+            raise CancelledError
+        return self._exc
+
     def add_done_callback(self, cb: Callable[['CFRL_Future[T]'], None]) -> None:
         if not self._done:
             self._cbs.append(cb)
         else:
             cb(self)
 
-    def set_result(self, res: T) -> None:
-        if self._done:
-            raise RuntimeError('double resolve')
-        self._result = res
+    def _resolve(self) -> None:
         self._done = True
         for cb in self._cbs:
             cb(self)
         self._cbs.clear()
 
+    def set_result(self, res: T) -> None:
+        if self._done:
+            raise RuntimeError('double resolve')
+        self._result = res
+        self._resolve()
+
+    def set_exception(self, exc: BaseException) -> None:
+        if self._done:
+            raise RuntimeError('double resolve')
+        self._exc = exc
+        self._resolve()
+
+    def cancel(self) -> bool:
+        """Whatever produces the result keeps running, but the result is discarded"""
+        if self._done:
+            return False
+        self._cancelled = True
+        self._resolve()
+        return True
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
     def done(self) -> bool:
         return self._done
 
     def __await__(self) -> Generator[Any, Any, T]:
         if self._done:
-            return py_typecast(T, self._result)
+            return self.result()
         else:
             return (yield self)
 
@@ -117,6 +162,32 @@ class CGRect(Structure):
 
 NSUTF8StringEncoding = 4
 
+try:
+    from ctypes import pythonapi
+    _PyUnicode_AsUTF8AndSize = pythonapi.PyUnicode_AsUTF8AndSize
+    _PyUnicode_AsUTF8AndSize.restype = c_void_p
+    _PyUnicode_AsUTF8AndSize.argtypes = py_object, POINTER(c_ssize_t)
+except (ImportError, AttributeError):  # not CPython
+    _PyUnicode_AsUTF8AndSize = None
+
+
+def _utf8_of(pystr: str) -> tuple[Union[int, bytes], int]:
+    """
+    The UTF-8 of the string and its size, without copying if it can be helped: the buffer of an ASCII string
+    is its UTF-8 already. Any other string is encoded into a temporary, since PyUnicode_AsUTF8AndSize
+    would keep a UTF-8 copy of it around for as long as the string lives.
+    Only valid while the string (or the returned bytes) is alive
+    """
+    if _PyUnicode_AsUTF8AndSize is None or not pystr.isascii():
+        data = pystr.encode()
+        return data, len(data)
+    size = c_ssize_t()
+    return _PyUnicode_AsUTF8AndSize(pystr, byref(size)), size.value
+
+
+# the size from which the peak RSS is reported after the script is handed to WebKit
+LARGE_SCRIPT = 1 << 20
+
 
 @overload
 def str_from_nsstring(pa: PyNeApple, nsstr: NotNull_VoidP) -> str: ...
@@ -127,12 +198,12 @@ def str_from_nsstring(pa: PyNeApple, nsstr: c_void_p, *, default: T = None) -> U
 def str_from_nsstring(pa: PyNeApple, nsstr: Union[c_void_p, NotNull_VoidP], *, default: T = None) -> Union[str, T]:
     if not nsstr.value:
         return default
-    length = pa.send_message(nsstr, b'lengthOfBytesUsingEncoding:', NSUTF8StringEncoding, restype=c_ulong, argtypes=(c_ulong, ))
+    length = pa.msg_lengthOfBytesUsingEncoding(nsstr, NSUTF8StringEncoding)
     if not length:
         assert pa.send_message(nsstr, b'canBeConvertedToEncoding:', NSUTF8StringEncoding, restype=c_byte, argtypes=(c_ulong, )), (
             'NSString cannot be losslessly converted to UTF-8 (which is impossible)')
         return ''
-    return string_at(py_typecast(int, pa.send_message(nsstr, b'UTF8String', restype=c_void_p)), length).decode()
+    return string_at(py_typecast(int, pa.msg_UTF8String(nsstr)), length).decode()
 
 
 @dataclass
@@ -159,14 +230,23 @@ DefaultJSResult = _JSResultType[None, type[NullTag], _UnknownStructure]
 
 PyResultType = Union[
     None,
+    type[NullTag],  # null, like None
+    bool,
     int,
     float,
     str,
-    dt.datetime
+    bytes,  # Uint8Array
+    dt.datetime,
+    list,  # of PyResultType
+    dict,  # of str to PyResultType
 ]
 
 DarwinMinVer = (20, )
 
+# how many times get_gen loaded the frameworks and set up the handler class in this process
+SETUP_COUNT = 0
+
+
 class WKJS_Task:
     NAVIGATE_TO = 0
     EXECUTE_JS = 1
@@ -176,13 +256,29 @@ class WKJS_Task:
     ON_SCRIPTLOG2 = 5
     ON_SCRIPTCOMM2 = 6
     SET_LOGGER = 7
+    GATHER = 8
+    SUBMIT = 9
+    WAIT = 10
+    PUMP = 11
+    MEMORY_FOOTPRINT = 12
+    ON_SCRIPTCOMM_MANY = 13
+
+    # the tasks that run on the loop, so they can be SUBMITted
+    LOOP_TASKS = frozenset((NAVIGATE_TO, EXECUTE_JS, NEW_WEBVIEW2, FREE_WEBVIEW, GATHER))
+    # indexed by the task, e.g. what the bridge crossings are counted under
+    NAMES = (
+        'navigate_to', 'execute_js', 'shutdown', 'new_webview', 'free_webview', 'on_script_log',
+        'on_script_comm', 'set_logger', 'gather', 'submit', 'wait', 'pump', 'memory_footprint', 'on_script_comm_many')
+    # the names the tasks timed in WKJS_Stats are recorded under
+    STAT_NAMES = {NAVIGATE_TO: 'navigate_to', EXECUTE_JS: 'execute_js', NEW_WEBVIEW2: 'new_webview'}
 
 
 class WKJS_UncaughtException(Exception):
     DOMAIN_DEFAULT = '<unknown>'
     UINFO_DEFAULT = '<no description provided>'
 
-    __slots__ = 'err_at', 'code', 'domain', 'user_info'
+    __slots__ = 'code', 'domain', 'err_at', 'user_info'
+
     def __init__(self, *, err_at: int, code: int, domain: Optional[str], user_info: Optional[str]):
         self.err_at = err_at
         self.code = code
@@ -204,11 +300,33 @@ class WKJS_UncaughtException(Exception):
         s = ', '.join(slst)
         return f'WKJS_UncaughtException({s})'
 
+    def __reduce__(self):
+        # the constructor is keyword only, the default reduce would call it with self.args
+        return _uncaught_exception, (self.err_at, self.code, self.domain, self.user_info)
+
+
+def _uncaught_exception(err_at: int, code: int, domain: Optional[str], user_info: Optional[str]) -> WKJS_UncaughtException:
+    return WKJS_UncaughtException(err_at=err_at, code=code, domain=domain, user_info=user_info)
+
+
+class WKJS_Timeout(TimeoutError):
+    """A task did not finish before its deadline. WebKit may still be working on it, but its result is discarded"""
+    ...
+
+
+# what execute_js returns instead of raising
+WKJS_ScriptError = Union[WKJS_UncaughtException, WKJS_Timeout]
+
 
 class WKJS_SELNoSupportError(RuntimeError):
     ...
 
 
+class WKJS_HostError(RuntimeError):
+    """The webkit host (see host.py) failed to carry out a task, or the connection to it was lost"""
+    ...
+
+
 class WKJS_LogType(enum.Enum):
     TRACE = 0
     DIAG = 1
@@ -219,15 +337,63 @@ class WKJS_LogType(enum.Enum):
 
 
 SENDMSG_CBTYPE = Callable[[int, tuple], any]
+# a record ({logType, argsArr}), or with log_batch (see get_gen), a list of them
 LOG_CBTYPE = Callable[[DefaultJSResult], None]
 COMM_CBTYPE = Callable[
     [DefaultJSResult, Callable[[PyResultType, Optional[str]], None]],
     None,
 ]
+# what communicateMany(list) calls, with the list, and replies once with a list of the same length
+COMM_MANY_CBTYPE = Callable[
+    [list[DefaultJSResult], Callable[[Optional[list[PyResultType]], Optional[str]], None]],
+    None,
+]
 
 
-def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
-    with PyNeApple(logger=_logger) as pa:
+def comm_many_of(cb: COMM_CBTYPE) -> COMM_MANY_CBTYPE:
+    """Answers communicateMany with a COMM_CBTYPE, one call per element, replying once all of them did (or one failed)"""
+    def cb_many(msgs: list[DefaultJSResult], reply: Callable[[Optional[list[PyResultType]], Optional[str]], None]) -> None:
+        results: list[PyResultType] = [None] * len(msgs)
+        left = len(msgs)
+        failed = False
+
+        def reply1(i: int, res: PyResultType, err: Optional[str]) -> None:
+            nonlocal left, failed
+            if failed:
+                return
+            if err is not None:
+                failed = True
+                reply(None, err)
+                return
+            results[i] = res
+            left -= 1
+            if not left:
+                reply(results, None)
+        if not msgs:
+            reply(results, None)
+        for i, msg in enumerate(msgs):
+            cb(msg, partial(reply1, i))
+    return cb_many
+
+
+def get_gen(
+    _logger: AbstractLogger,
+    *,
+    stats: Optional[WKJS_Stats] = None,
+    counters: Optional[BridgeCounters] = None,
+    backend: Optional[ObjCBackend] = None,
+    log_batch: int = 0,
+) -> Generator[SENDMSG_CBTYPE, None, None]:
+    """
+    stats: where to record the latencies of the phases of the tasks
+    counters: where to count the bridge crossings of each task
+    backend: what stands in for libobjc and the frameworks, e.g. sim_objc.SimObjCBackend
+    log_batch: have the page buffer console records, so that the LOG_CBTYPE callbacks get lists of up to this many
+        once the script yields or finishes, instead of a message (and a conversion) per record
+    """
+    global SETUP_COUNT
+    with (PyNeApple(_logger, backend=backend) if counters is None else CountingPyNeApple(_logger, counters, backend=backend)) as pa:
+        SETUP_COUNT += 1
         pa.load_framework_from_path('Foundation')
         cf = pa.load_framework_from_path('CoreFoundation')
         pa.load_framework_from_path('WebKit')
@@ -238,6 +404,7 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
         # pa.call_on_exit(lambda: pa.send_message(pool, b'drain'))
 
         NSArray = pa.safe_objc_getClass(b'NSArray')
+        NSData = pa.safe_objc_getClass(b'NSData')
         NSDate = pa.safe_objc_getClass(b'NSDate')
         NSDictionary = pa.safe_objc_getClass(b'NSDictionary')
         NSString = pa.safe_objc_getClass(b'NSString')
@@ -252,6 +419,8 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
         WKWebView = pa.safe_objc_getClass(b'WKWebView')
         WKWebViewConfiguration = pa.safe_objc_getClass(b'WKWebViewConfiguration')
         WKUserContentController = pa.safe_objc_getClass(b'WKUserContentController')
+        WKUserScript = pa.safe_objc_getClass(b'WKUserScript')
+        WKUserScriptInjectionTimeAtDocumentStart = 0
 
         if not pa.send_message(
             WKUserContentController, b'instancesRespondToSelector:',
@@ -266,13 +435,23 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
 
         CFRunLoopStop = pa.cfn_at(cf(b'CFRunLoopStop').value, None, c_void_p)
         CFRunLoopRun = pa.cfn_at(cf(b'CFRunLoopRun').value, None)
+        CFRunLoopRunInMode = pa.cfn_at(cf(b'CFRunLoopRunInMode').value, c_int32, c_void_p, c_double, c_bool)
         CFRunLoopGetMain = pa.cfn_at(cf(b'CFRunLoopGetMain').value, c_void_p)
         kCFRunLoopDefaultMode = c_void_p.from_address(cf(b'kCFRunLoopDefaultMode').value)
         CFRunLoopPerformBlock = pa.cfn_at(cf(b'CFRunLoopPerformBlock').value, None, c_void_p, c_void_p, POINTER(ObjCBlock))
         CFRunLoopWakeUp = pa.cfn_at(cf(b'CFRunLoopWakeUp').value, None, c_void_p)
-        currloop = c_void_p(pa.cfn_at(cf(b'CFRunLoopGetCurrent').value, c_void_p)())
+        CFRunLoopGetCurrent = pa.cfn_at(cf(b'CFRunLoopGetCurrent').value, c_void_p)
+        CFAbsoluteTimeGetCurrent = pa.cfn_at(cf(b'CFAbsoluteTimeGetCurrent').value, c_double)
+        CFRunLoopTimerCreateWithHandler = pa.cfn_at(
+            cf(b'CFRunLoopTimerCreateWithHandler').value, c_void_p,
+            c_void_p, c_double, c_double, c_ulong, c_long, POINTER(ObjCBlock))
+        CFRunLoopAddTimer = pa.cfn_at(cf(b'CFRunLoopAddTimer').value, None, c_void_p, c_void_p, c_void_p)
+        CFRunLoopTimerInvalidate = pa.cfn_at(cf(b'CFRunLoopTimerInvalidate').value, None, c_void_p)
+        CFRelease = pa.cfn_at(cf(b'CFRelease').value, None, c_void_p)
         mainloop = c_void_p(CFRunLoopGetMain())
-        if currloop.value != mainloop.value:
+        # the factory may be entered on another thread (see AppleWebKitMixin._start_prewarm),
+        # so the loop of the caller is looked up on every call
+        if CFRunLoopGetCurrent() != mainloop.value:
             pa.logger.debug('not running on main thread', once=True)
         CFDateGetAbsoluteTime = pa.cfn_at(cf(b'CFDateGetAbsoluteTime').value, c_double, c_void_p)
         CFNumberGetValue = pa.cfn_at(cf(b'CFNumberGetValue').value, c_bool, c_void_p, c_long, c_void_p)
@@ -281,6 +460,15 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
         CFDictionaryApplyFunction = pa.cfn_at(cf(b'CFDictionaryApplyFunction').value, None, c_void_p, c_void_p, c_void_p)
         CFArrayGetCount = pa.cfn_at(cf(b'CFArrayGetCount').value, c_long, c_void_p)
         CFArrayGetValueAtIndex = pa.cfn_at(cf(b'CFArrayGetValueAtIndex').value, c_void_p, c_void_p, c_long)
+        # the pid of the WebContent process is SPI, without it the footprint is unknown
+        has_webProcessIdentifier = pa.send_message(
+            WKWebView, b'instancesRespondToSelector:', pa.sel_registerName(b'_webProcessIdentifier'),
+            restype=c_byte, argtypes=(c_void_p, ))
+        proc_pid_rusage = pa.cfn_at(pa.dlsym_system(b'proc_pid_rusage').value, c_int32, c_int32, c_int32, c_void_p)
+        RUSAGE_INFO_V0 = 0
+        # struct rusage_info_v0 as uint64s: ri_uuid takes 2, ri_phys_footprint is the 10th
+        rusage_info = (c_uint64 * 12)()
+        RI_PHYS_FOOTPRINT = 9
 
         type_to_largest: dict[bytes, tuple[c_long, Union[type[c_int64], type[c_uint64], type[c_double]]]] = {
             b'c': (kCFNumberLongLongType, c_int64),
@@ -298,16 +486,63 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
         }
 
         kCFBooleanTrue = c_void_p.from_address(cf(b'kCFBooleanTrue').value)
+        kCFBooleanFalse = c_void_p.from_address(cf(b'kCFBooleanFalse').value)
+
+        # frequently sent messages
+        msg_isKindOfClass = pa.msg_isKindOfClass
+        msg_objCType = pa.bind_message(b'objCType', restype=c_char_p)
+        msg_body = pa.bind_message(b'body', restype=c_void_p)
 
         # pa.send_message(NSAutoreleasePool, b'showPools')
 
+        malloc = pa.cfn_at(pa.dlsym_system(b'malloc').value, c_void_p, c_size_t)
+        free = pa.cfn_at(pa.dlsym_system(b'free').value, None, c_void_p)
+        # the UTF-8 the scripts are spliced into, by json_result
+        templ_utf8 = {
+            json_result: py_typecast(tuple[bytes, bytes], tuple(part.encode() for part in templ.split(SCRIPT_PHOLDER)))
+            for json_result, templ in ((False, SCRIPT_TEMPL), (True, SCRIPT_TEMPL_JSON))}
+        assert all(len(parts) == 2 for parts in templ_utf8.values())
+        rss_noted = 0
+
         # RELEASE IT!!!
-        def alloc_nsstring_from_str(pystr: str):
+        def alloc_nsstring_spliced(pystr: str, prefix: bytes = b'', suffix: bytes = b'', timer=NULL_TIMER):
+            # The UTF-8 is copied once, into a buffer the NSString takes over and frees with itself, instead of
+            # by str.replace, str.encode and initWithBytes:length:encoding: each; a multi-MB player is a lot to copy.
+            # Only non-ASCII strings are encoded first, and that temporary is gone once this returns
+            nonlocal rss_noted
+            p_src, n_src = _utf8_of(pystr)
+            n_buf = len(prefix) + n_src + len(suffix)
+            p_buf = malloc(n_buf or 1)
+            if not p_buf:
+                raise MemoryError(f'failed to allocate {n_buf} bytes for a string')
+            memmove(p_buf, prefix, len(prefix))
+            memmove(p_buf + len(prefix), p_src, n_src)
+            memmove(p_buf + len(prefix) + n_src, suffix, len(suffix))
+            timer.mark('encode')
+            try:
+                p_str = pa.safe_new_object(
+                    NSString, b'initWithBytesNoCopy:length:encoding:freeWhenDone:',
+                    c_void_p(p_buf), n_buf, NSUTF8StringEncoding, c_byte(1),
+                    argtypes=(c_void_p, c_ulong, c_ulong, c_byte))
+            except BaseException:
+                # only freed by the string if it was created
+                free(c_void_p(p_buf))
+                raise
+            timer.mark('nsstring')
+            if n_buf >= LARGE_SCRIPT and (rss := peak_rss()) > rss_noted:
+                rss_noted = rss
+                pa.logger.debug(f'peak RSS is {rss / (1 << 20):.1f} MB after a {n_buf / (1 << 20):.1f} MB string')
+            return p_str
+
+        # RELEASE IT!!!
+        def alloc_nsstring_from_str(pystr: str, timer=NULL_TIMER):
             # DO NOT USE b'initWithCharacters:length:'!
             str_utf8 = pystr.encode()
+            timer.mark('encode')
             p_str = pa.safe_new_object(
                 NSString, b'initWithBytes:length:encoding:', str_utf8, len(str_utf8), NSUTF8StringEncoding,
                     argtypes=(c_char_p, c_ulong, c_ulong))
+            timer.mark('nsstring')
             return p_str
 
         def pyobj_from_nsobj_jsresult(
@@ -323,16 +558,15 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                 return undefined
             elif visitedobj := visited.get(jsobj.value):
                 return visitedobj
-            elif pa.instanceof(jsobj, NSNull):
+            elif msg_isKindOfClass(jsobj, NSNull):
                 visited[jsobj.value] = null
                 return null
-            elif pa.instanceof(jsobj, NSString):
+            elif msg_isKindOfClass(jsobj, NSString):
                 s_res = str_from_nsstring(pa, py_typecast(NotNull_VoidP, jsobj))
                 visited[jsobj.value] = s_res
                 return s_res
-            elif pa.instanceof(jsobj, NSNumber):
-                kcf_numtyp, restyp = type_to_largest[py_typecast(bytes, pa.send_message(
-                    jsobj, b'objCType', restype=c_char_p))]
+            elif msg_isKindOfClass(jsobj, NSNumber):
+                kcf_numtyp, restyp = type_to_largest[py_typecast(bytes, msg_objCType(jsobj))]
                 n_res = restyp()
                 if not CFNumberGetValue(jsobj, kcf_numtyp, byref(n_res)):
                     sval = str_from_nsstring(pa, py_typecast(NotNull_VoidP, c_void_p(
@@ -341,16 +575,16 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                 n_resv = n_res.value
                 visited[jsobj.value] = n_resv
                 return n_resv
-            elif pa.instanceof(jsobj, NSDate):
+            elif msg_isKindOfClass(jsobj, NSDate):
                 dte1970 = py_typecast(float, CFDateGetAbsoluteTime(jsobj)) + 978307200.0
                 py_dte = dt.datetime.fromtimestamp(dte1970, dt.timezone.utc)
                 visited[jsobj.value] = py_dte
                 return py_dte
-            elif pa.instanceof(jsobj, NSDictionary):
+            elif msg_isKindOfClass(jsobj, NSDictionary):
                 d = {}
                 visited[jsobj.value] = d
 
-                @CFUNCTYPE(None, c_void_p, c_void_p, c_void_p)
+                @pa.cfunctype(None, c_void_p, c_void_p, c_void_p)
                 def visitor(k: CRet.Py_PVoid, v: CRet.Py_PVoid, userarg: CRet.Py_PVoid):
                     nonlocal d
                     # pa.logger.trace(f'visit s dict@{userarg=}; {k=}; {v=}')
@@ -361,7 +595,7 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
 
                 CFDictionaryApplyFunction(jsobj, visitor, jsobj)
                 return d
-            elif pa.instanceof(jsobj, NSArray):
+            elif msg_isKindOfClass(jsobj, NSArray):
                 larr = CFArrayGetCount(jsobj)
                 arr = []
                 visited[jsobj.value] = arr
@@ -374,7 +608,8 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                 return arr
             else:
                 tn = py_typecast(bytes, pa.class_getName(pa.object_getClass(jsobj))).decode()
-                pa.logger.trace(f'unk@{jsobj.value=}; {tn=}')
+                if pa.trace_on:
+                    pa.logger.trace(f'unk@{jsobj.value=}; {tn=}')
                 unk_res = on_unknown_st(tn)
                 visited[jsobj.value] = unk_res
                 return unk_res
@@ -384,8 +619,11 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
             *,
             pending_free: list[NotNull_VoidP],
         ) -> NotNull_VoidP:
-            if pyres is None:
+            # what is allocated goes to pending_free, to be released once the reply is sent (or failed)
+            if pyres is None or pyres is NullTag:
                 return inst_NSNull
+            elif isinstance(pyres, bool):
+                return py_typecast(NotNull_VoidP, kCFBooleanTrue if pyres else kCFBooleanFalse)
             elif isinstance(pyres, str):
                 p_str = alloc_nsstring_from_str(pyres)
                 pending_free.append(p_str)
@@ -398,7 +636,7 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                     pending_free.append(ull)
                     return ull
                 else:  # use LL
-                    if pyres < -9223372036854775807:
+                    if pyres < -(1 << 63):
                         raise OverflowError('Number does not fit in NSNumber (less than LLONG_MIN)')
                     ll = pa.safe_new_object(NSNumber, b'initWithLongLong:', pyres, argtypes=(c_longlong, ))
                     pending_free.append(ll)
@@ -413,20 +651,71 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                     argtypes=(c_double, ))
                 pending_free.append(nsdt)
                 return nsdt
+            elif isinstance(pyres, bytes):
+                data = pa.safe_new_object(
+                    NSData, b'initWithBytes:length:', pyres, len(pyres),
+                    argtypes=(c_char_p, c_ulong))
+                pending_free.append(data)
+                return data
+            elif isinstance(pyres, list):
+                items = (c_void_p * len(pyres))(*(ns_jsobj_from_pyres(x, pending_free=pending_free).value for x in pyres))
+                # retains the items, which are released with the rest of pending_free
+                arr = pa.safe_new_object(
+                    NSArray, b'initWithObjects:count:', items, len(pyres),
+                    argtypes=(POINTER(c_void_p), c_ulong))
+                pending_free.append(arr)
+                return arr
+            elif isinstance(pyres, dict):
+                keys = (c_void_p * len(pyres))()
+                vals = (c_void_p * len(pyres))()
+                for i, (k, v) in enumerate(pyres.items()):
+                    if not isinstance(k, str):
+                        raise RuntimeError(f'Dictionary keys have to be str, got {type(k)}')
+                    keys[i] = ns_jsobj_from_pyres(k, pending_free=pending_free).value
+                    vals[i] = ns_jsobj_from_pyres(v, pending_free=pending_free).value
+                # copies the keys and retains the values
+                nsdict = pa.safe_new_object(
+                    NSDictionary, b'initWithObjects:forKeys:count:', vals, keys, len(pyres),
+                    argtypes=(POINTER(c_void_p), POINTER(c_void_p), c_ulong))
+                pending_free.append(nsdict)
+                return nsdict
             else:
                 raise RuntimeError(f'Type {type(pyres)} is not (yet) supported')
 
         def schedule_on(loop: c_void_p, pycb: Callable[[], None], *, var_keepalive: set, mode=kCFRunLoopDefaultMode):
             block: ObjCBlock
 
-            def _pycb_real():
-                pycb()
-                var_keepalive.remove(block)
+            if stats is not None:
+                scheduled_at = time.perf_counter()
+
+                def _pycb_real():
+                    stats.record('run_loop', 'schedule', time.perf_counter() - scheduled_at)
+                    pycb()
+                    var_keepalive.remove(block)
+            else:
+                def _pycb_real():
+                    pycb()
+                    var_keepalive.remove(block)
             block = pa.make_block(_pycb_real)
             var_keepalive.add(block)
             CFRunLoopPerformBlock(loop, mode, byref(block))
             CFRunLoopWakeUp(loop)
 
+        def start_deadline(seconds: float, on_fire: Callable[[], None]) -> Callable[[], None]:
+            # Calls on_fire on the current run loop in `seconds`, unless the returned function is called first.
+            # It must be called either way, the timer and its block are freed by it
+            block = pa.make_block(on_fire)
+            timer = c_void_p(CFRunLoopTimerCreateWithHandler(
+                None, CFAbsoluteTimeGetCurrent() + seconds, 0.0, 0, 0, byref(block)))
+            CFRunLoopAddTimer(c_void_p(CFRunLoopGetCurrent()), timer, kCFRunLoopDefaultMode)
+
+            def stop():
+                nonlocal block
+                CFRunLoopTimerInvalidate(timer)
+                CFRelease(timer)
+                del block
+            return stop
+
         def _runcoro_on_loop_base(
             coro: Coroutine[Any, Any, T],
             *,
@@ -434,14 +723,23 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
             loop: c_void_p,
             finish: Callable[[BaseException], None],
             default: U = None,
+            eager: bool = False,
+            label: Optional[str] = None,
         ) -> CFRL_CoroResult[Union[T, U]]:
+            # eager: take the first step right away instead of on the next run loop iteration,
+            # so e.g. the script is handed to WebKit before this returns. Only from the thread of `loop`
             # Default is returned when the coroutine wrongly calls CFRunLoopStop(loop) or its equivalent
+            # label: what the bridge crossings of the steps are counted under
             res = CFRL_CoroResult[Union[T, U]](default)
-            pa.logger.trace(f'_runcoro_on_loop_base: starting coroutine: {coro=}')
+            if pa.trace_on:
+                pa.logger.trace(f'_runcoro_on_loop_base: starting coroutine: {coro=}')
 
             def _coro_step(v: Any = None, *, exc: Optional[BaseException] = None):
                 nonlocal res
-                pa.logger.trace(f'coro step: {v=}; {exc=}')
+                if counters is not None and label is not None:
+                    counters.task = label
+                if pa.trace_on:
+                    pa.logger.trace(f'coro step: {v=}; {exc=}')
                 fut: CFRL_Future
                 try:
                     if exc is not None:
@@ -450,53 +748,68 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                         fut = coro.send(v)
                     # TODO: support awaitables that aren't futures, e.g. coro
                 except StopIteration as si:
-                    pa.logger.trace(f'stopping with return value: {si.value=}')
+                    if pa.trace_on:
+                        pa.logger.trace(f'stopping with return value: {si.value=}')
                     res.ret = si.value
                     finish(si)
                     return
                 except BaseException as e:
-                    pa.logger.trace(f'will throw exc raised from coro: {e=}')
+                    if pa.trace_on:
+                        pa.logger.trace(f'will throw exc raised from coro: {e=}')
                     res.rexc = e
                     finish(e)
                     return
 
                 def _on_fut_done(f: CFRL_Future):
-                    pa.logger.trace(f'fut done: {f=}')
+                    if pa.trace_on:
+                        pa.logger.trace(f'fut done: {f=}')
                     try:
                         fut_res = f.result()
                     except BaseException as fut_err:
-                        pa.logger.trace(f'fut exc: {fut_err=}, scheduling exc callback')
+                        if pa.trace_on:
+                            pa.logger.trace(f'fut exc: {fut_err=}, scheduling exc callback')
 
                         def _exc_cb(fut_err=fut_err):
-                            pa.logger.trace(f'fut exc cb: calling _coro_step with {fut_err=}')
+                            if pa.trace_on:
+                                pa.logger.trace(f'fut exc cb: calling _coro_step with {fut_err=}')
                             _coro_step(exc=fut_err)
                         scheduled = _exc_cb
                     else:
-                        pa.logger.trace(f'fut res: {fut_res=}, scheduling done callback')
+                        if pa.trace_on:
+                            pa.logger.trace(f'fut res: {fut_res=}, scheduling done callback')
 
                         def _normal_cb():
-                            pa.logger.trace(f'fut cb, calling _coro_step with {fut_res=}')
+                            if pa.trace_on:
+                                pa.logger.trace(f'fut cb, calling _coro_step with {fut_res=}')
                             _coro_step(fut_res)
                         scheduled = _normal_cb
                     schedule_on(loop, scheduled, var_keepalive=var_keepalive)
                 fut.add_done_callback(_on_fut_done)
-                pa.logger.trace(f'added done callback {_on_fut_done=} to fut {fut=}')
+                if pa.trace_on:
+                    pa.logger.trace(f'added done callback {_on_fut_done=} to fut {fut=}')
 
-            schedule_on(loop, _coro_step, var_keepalive=var_keepalive)
+            if eager:
+                _coro_step()
+            else:
+                schedule_on(loop, _coro_step, var_keepalive=var_keepalive)
             return res
 
-        def runcoro_on_current(coro: Coroutine[Any, Any, T], *, default: U = None) -> Union[T, U]:
+        def runcoro_on_current(coro: Coroutine[Any, Any, T], *, default: U = None, label: Optional[str] = None) -> Union[T, U]:
+            currloop = c_void_p(CFRunLoopGetCurrent())
             var_keepalive = set()
-            res = _runcoro_on_loop_base(coro, var_keepalive=var_keepalive, loop=currloop, default=default, finish=lambda exc: CFRunLoopStop(currloop))
+            res = _runcoro_on_loop_base(
+                coro, var_keepalive=var_keepalive, loop=currloop, default=default,
+                finish=lambda exc: CFRunLoopStop(currloop), label=label)
             CFRunLoopRun()
-            pa.logger.trace(f'runcoro_on_current done: {res.rexc=}; {res.ret=}')
+            if pa.trace_on:
+                pa.logger.trace(f'runcoro_on_current done: {res.rexc=}; {res.ret=}')
             if res.rexc is not None:
                 raise res.rexc from None
             return res.ret
 
-        def runcoro_on_loop(coro: Coroutine[Any, Any, T], *, loop=mainloop, default: U = None) -> Union[T, U]:
-            if loop.value == currloop.value:
-                return runcoro_on_current(coro, default=default)
+        def runcoro_on_loop(coro: Coroutine[Any, Any, T], *, loop=mainloop, default: U = None, label: Optional[str] = None) -> Union[T, U]:
+            if loop.value == CFRunLoopGetCurrent():
+                return runcoro_on_current(coro, default=default, label=label)
             finished = False
             cv = Condition()
             var_keepalive = set()
@@ -506,30 +819,39 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                 with cv:
                     finished = True
                     cv.notify()
-            res = _runcoro_on_loop_base(coro, var_keepalive=var_keepalive, loop=loop, default=default, finish=finish)
+            res = _runcoro_on_loop_base(coro, var_keepalive=var_keepalive, loop=loop, default=default, finish=finish, label=label)
             with cv:
                 while not finished:
                     cv.wait()
 
-            pa.logger.trace(f'runcoro_on_loop done: {res.rexc=}; {res.ret=}')
+            if pa.trace_on:
+                pa.logger.trace(f'runcoro_on_loop done: {res.rexc=}; {res.ret=}')
             if res.rexc is not None:
                 raise res.rexc from None
             return res.ret
 
         navi_cbdct: dict[int, Callable[[], None]] = {}
+        # the completion handlers of the scripts that timed out, alive until WebKit calls them
+        detached_blocks: set[ObjCBlock] = set()
         usrcontctlr_cbdct: dict[int, LOG_CBTYPE] = {}
         usrcontctlr_commcbdct: dict[int, COMM_CBTYPE] = {}
+        usrcontctlr_commmanycbdct: dict[int, COMM_MANY_CBTYPE] = {}
+        # the handler objects of the wkjs_commany channel, the messages of which are lists for a COMM_MANY_CBTYPE
+        commany_handlers: set[int] = set()
+
         class PFC_WVHandler:
             @staticmethod
             def webView0_didFinishNavigation1(this: CRet.Py_PVoid, sel: CRet.Py_PVoid, rp_webview: CRet.Py_PVoid, rp_navi: CRet.Py_PVoid) -> None:
-                pa.logger.trace(f'Callback: [(PyForeignClass_WebViewHandler){this} webView: {rp_webview} didFinishNavigation: {rp_navi}]')
+                if pa.trace_on:
+                    pa.logger.trace(f'Callback: [(PyForeignClass_WebViewHandler){this} webView: {rp_webview} didFinishNavigation: {rp_navi}]')
                 if cb := navi_cbdct.get(rp_navi or 0):
                     cb()
 
             @staticmethod
             def userContentController0_didReceiveScriptMessage1(this: CRet.Py_PVoid, sel: CRet.Py_PVoid, rp_usrcontctlr: CRet.Py_PVoid, rp_sm: CRet.Py_PVoid) -> None:
-                pa.logger.trace(f'Callback: [(PyForeignClass_WebViewHandler){this} userContentController: {rp_usrcontctlr} didReceiveScriptMessage: {rp_sm}]')
-                rp_msgbody = c_void_p(pa.send_message(c_void_p(rp_sm), b'body', restype=c_void_p))
+                if pa.trace_on:
+                    pa.logger.trace(f'Callback: [(PyForeignClass_WebViewHandler){this} userContentController: {rp_usrcontctlr} didReceiveScriptMessage: {rp_sm}]')
+                rp_msgbody = c_void_p(msg_body(c_void_p(rp_sm)))
                 pyobj = pyobj_from_nsobj_jsresult(pa, rp_msgbody, visited={}, null=NullTag)
                 if cb := usrcontctlr_cbdct.get(rp_usrcontctlr or 0):
                     cb(pyobj)
@@ -540,10 +862,12 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                 rp_usrcontctlr: CRet.Py_PVoid, rp_sm: CRet.Py_PVoid, rp_replyhandler: CRet.Py_PVoid
             ):
                 replyhandler = cast(rp_replyhandler or 0, POINTER(ObjCBlock)).contents
-                pa.logger.trace(
-                        f'Callback: [(PyForeignClass_WebViewHandler){this} userContentController: {rp_usrcontctlr} '
-                    f'didReceiveScriptMessage: {rp_sm} replyHandler: &({replyhandler!r})]')
+                if pa.trace_on:
+                    pa.logger.trace(
+                            f'Callback: [(PyForeignClass_WebViewHandler){this} userContentController: {rp_usrcontctlr} '
+                        f'didReceiveScriptMessage: {rp_sm} replyHandler: &({replyhandler!r})]')
                 res_or_exc = replyhandler.as_pycb(None, c_void_p, c_void_p)
+
                 def return_result(result: PyResultType, err: Optional[str]) -> None:
                     try:
                         if err is not None:
@@ -552,19 +876,26 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                             pa.release_obj(p_errstr)
                         else:
                             pending_free = []
-                            nsobj = ns_jsobj_from_pyres(result, pending_free=pending_free)
-                            assert nsobj
-                            res_or_exc(nsobj, None)
-                            list(map(pa.release_obj, pending_free))
+                            try:
+                                nsobj = ns_jsobj_from_pyres(result, pending_free=pending_free)
+                                assert nsobj
+                                res_or_exc(nsobj, None)
+                            finally:
+                                list(map(pa.release_obj, pending_free))
                     except Exception as e:
                         pa.logger.warning(f'Error sending script message, did the conversion fail? {e!r}')
                         return_result(None, repr(e))
 
                 # TODO(?): expose some CFRL utils to the callback?
                 try:
-                    rp_msgbody = c_void_p(pa.send_message(c_void_p(rp_sm), b'body', restype=c_void_p))
+                    rp_msgbody = c_void_p(msg_body(c_void_p(rp_sm)))
                     pyobj = pyobj_from_nsobj_jsresult(pa, rp_msgbody, visited={}, null=NullTag)
-                    usrcontctlr_commcbdct[rp_usrcontctlr or 0](pyobj, return_result)
+                    if (this or 0) in commany_handlers:
+                        if (cb_many := usrcontctlr_commmanycbdct.get(rp_usrcontctlr or 0)) is None:
+                            cb_many = comm_many_of(usrcontctlr_commcbdct[rp_usrcontctlr or 0])
+                        cb_many(py_typecast(list[DefaultJSResult], pyobj), return_result)
+                    else:
+                        usrcontctlr_commcbdct[rp_usrcontctlr or 0](pyobj, return_result)
                 except BaseException as e:
                     pa.logger.warning(f'Error while handling script message: {e!r}')
                     return_result(None, repr(e))
@@ -572,14 +903,14 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
         meth_list: PyNeApple.METH_LIST_TYPE = (
             (
                 pa.sel_registerName(b'webView:didFinishNavigation:'),
-                CFUNCTYPE(
+                pa.cfunctype(
                     None,
                     c_void_p, c_void_p, c_void_p, c_void_p)(
                         PFC_WVHandler.webView0_didFinishNavigation1),
                 b'v@:@@',
             ), (
                 pa.sel_registerName(b'userContentController:didReceiveScriptMessage:'),
-                CFUNCTYPE(
+                pa.cfunctype(
                     None,
                     c_void_p, c_void_p, c_void_p, c_void_p)(
                         PFC_WVHandler.userContentController0_didReceiveScriptMessage1),
@@ -587,7 +918,7 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
             ),
             (
                 pa.sel_registerName(b'userContentController:didReceiveScriptMessage:replyHandler:'),
-                CFUNCTYPE(
+                pa.cfunctype(
                     None,
                     c_void_p, c_void_p, c_void_p, c_void_p, c_void_p)(
                         PFC_WVHandler.userContentController0_didReceiveScriptMessage1_replyHandler2),
@@ -613,9 +944,24 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
             with ExitStack() as exsk_out:
                 p_wvhandler = pa.safe_alloc_init(Py_WVHandler)
                 exsk_out.callback(pa.release_obj, p_wvhandler)
+                # told apart from p_wvhandler by the `this` of the callback, which saves asking the message for its name
+                p_commanyhandler = pa.safe_alloc_init(Py_WVHandler)
+                exsk_out.callback(pa.release_obj, p_commanyhandler)
+                commany_handlers.add(p_commanyhandler.value)
+                exsk_out.callback(commany_handlers.discard, p_commanyhandler.value)
+                # console and communicate, set up once per document instead of by every script
+                ps_prelude = alloc_nsstring_from_str(SCRIPT_PRELUDE.replace(LOG_BATCH_PHOLDER, str(log_batch)))
+                exsk_out.callback(pa.release_obj, ps_prelude)
+                p_prelude = pa.safe_new_object(
+                    WKUserScript, b'initWithSource:injectionTime:forMainFrameOnly:',
+                    ps_prelude, WKUserScriptInjectionTimeAtDocumentStart, c_byte(1),
+                    argtypes=(c_void_p, c_long, c_byte))
+                exsk_out.callback(pa.release_obj, p_prelude)
                 active = True
 
-                async def new_webview() -> tuple[int, int]:
+                async def new_webview(prepare_script: Optional[str] = None) -> tuple[int, int]:
+                    # prepare_script: run before the webview is handed out, e.g. by a SUBMIT that nothing waits for yet
+                    timer = timer_of(stats, 'new_webview')
                     async with AsyncExitStack() as exsk:
                         p_cfg = pa.safe_alloc_init(WKWebViewConfiguration)
                         exsk.callback(pa.release_obj, p_cfg)
@@ -647,6 +993,7 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
 
                         p_usrcontctlr = pa.safe_alloc_init(WKUserContentController)
                         exsk.callback(pa.release_obj, p_usrcontctlr)
+                        pa.send_message(p_usrcontctlr, b'addUserScript:', p_prelude, argtypes=(c_void_p, ))
 
                         p_handler_name = pa.safe_new_object(
                             NSString, b'initWithUTF8String:', b'wkjs_log',
@@ -672,25 +1019,62 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                             p_wvhandler,rp_pageworld, p_comhandler_name,
                             argtypes=(c_void_p, c_void_p, c_void_p))
 
+                        p_comanyhandler_name = pa.safe_new_object(
+                            NSString, b'initWithUTF8String:', b'wkjs_commany',
+                            argtypes=(c_char_p, ))
+                        exsk.callback(pa.release_obj, p_comanyhandler_name)
+
+                        pa.send_message(
+                            p_usrcontctlr, b'addScriptMessageHandlerWithReply:contentWorld:name:',
+                            p_commanyhandler, rp_pageworld, p_comanyhandler_name,
+                            argtypes=(c_void_p, c_void_p, c_void_p))
+
                         pa.send_message(
                             p_cfg, b'setUserContentController:', p_usrcontctlr,
                             argtypes=(c_void_p, ))
 
+                        timer.mark('config')
                         p_webview = pa.safe_new_object(
                             WKWebView, b'initWithFrame:configuration:',
                             CGRect(), p_cfg,
                             argtypes=(CGRect, c_void_p))
+                        timer.mark('webview')
 
                     pa.send_message(
                         p_webview, b'setNavigationDelegate:',
                         p_wvhandler, argtypes=(c_void_p, ))
+                    # the user script only runs in the documents that are loaded later
+                    coros = [call_async_js(p_webview.value, ps_prelude, False, None, NULL_TIMER)]
+                    if prepare_script is not None:
+                        # handed to the page right behind the prelude instead of once it is done,
+                        # so that both run even while nothing spins the run loop yet
+                        coros.append(execute_js(p_webview.value, prepare_script))
+                    prelude, *prepared = await start_in_order(*coros)
+                    if prelude.rexc is not None or prelude.ret[1] is not None:
+                        pa.release_obj(p_webview)
+                        raise RuntimeError(f'Failed to install the prelude into the webview: {prelude.rexc or prelude.ret[1]}')
+                    timer.mark('prelude')
+                    for res in prepared:
+                        if (exc := res.rexc or res.ret[1]) is not None:
+                            # the user of the webview finds out when it needs what was prepared
+                            pa.logger.trace(f'prepare script failed: {exc}')
                     pa.logger.trace('webview full init')
+                    timer.done()
                     return p_webview.value, p_usrcontctlr.value
 
                 async def free_webview(wv: int) -> None:
                     if wv:
                         pa.release_obj(c_void_p(wv))
 
+                def memory_footprint(webview: int) -> Optional[int]:
+                    # bytes, of the whole WebContent process, which the webviews of a process pool share
+                    if not has_webProcessIdentifier:
+                        return None
+                    pid = pa.send_message(c_void_p(webview), b'_webProcessIdentifier', restype=c_int32)
+                    if pid <= 0 or proc_pid_rusage(pid, RUSAGE_INFO_V0, byref(rusage_info)) != 0:
+                        return None
+                    return rusage_info[RI_PHYS_FOOTPRINT]
+
                 def on_script_log(usrcontctlr: int, cb_new: LOG_CBTYPE) -> Optional[LOG_CBTYPE]:
                     ret = usrcontctlr_cbdct.get(usrcontctlr)
                     usrcontctlr_cbdct[usrcontctlr] = cb_new
@@ -701,10 +1085,17 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                     usrcontctlr_commcbdct[usrcontctlr] = cb_new
                     return ret
 
-                async def navigate_to(webview: int, host: str, html: str) -> None:
-                    fut_navidone: CFRL_Future[None] = CFRL_Future()
+                def on_script_comm_many(usrcontctlr: int, cb_new: COMM_MANY_CBTYPE) -> Optional[COMM_MANY_CBTYPE]:
+                    # without one, communicateMany goes through the on_script_comm callback (see comm_many_of)
+                    ret = usrcontctlr_commmanycbdct.get(usrcontctlr or 0)
+                    usrcontctlr_commmanycbdct[usrcontctlr] = cb_new
+                    return ret
+
+                async def navigate_to(webview: int, host: str, html: str, timeout: Optional[float] = None) -> Optional[WKJS_Timeout]:
+                    fut_navidone: CFRL_Future[Optional[WKJS_Timeout]] = CFRL_Future()
+                    timer = timer_of(stats, 'navigate_to')
                     async with AsyncExitStack() as exsk:
-                        ps_html = alloc_nsstring_from_str(html)
+                        ps_html = alloc_nsstring_spliced(html, timer=timer)
                         exsk.callback(pa.release_obj, ps_html)
                         ps_base_url = alloc_nsstring_from_str(host)
                         exsk.callback(pa.release_obj, ps_base_url)
@@ -716,26 +1107,39 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                         rp_navi = py_typecast(NotNull_VoidP, c_void_p(pa.send_message(
                             c_void_p(webview), b'loadHTMLString:baseURL:', ps_html, purl_base,
                             restype=c_void_p, argtypes=(c_void_p, c_void_p))))
+                        timer.mark('submit')
 
                         def cb_navi_done():
+                            if fut_navidone.done():  # timed out
+                                return
+                            timer.mark('navigation')
                             pa.logger.trace('navigation done, resolving future')
                             fut_navidone.set_result(None)
 
                         navi_cbdct[rp_navi.value] = cb_navi_done
+                        # the navigation object may be reused once it finishes
+                        exsk.callback(navi_cbdct.pop, rp_navi.value, None)
                         pa.logger.trace(f'Navigation started on {host}')
-
-                        await fut_navidone
+                        if timeout is not None:
+                            def on_navi_timeout():
+                                if not fut_navidone.done():
+                                    fut_navidone.set_result(WKJS_Timeout(f'navigation to {host} did not finish within {timeout}s'))
+                            exsk.callback(start_deadline(timeout, on_navi_timeout))
+
+                        # like the errors of execute_js, a timeout is returned, raising here would end the generator
+                        err = await fut_navidone
+                        timer.mark('resume')
                     pa.logger.trace('navigation done')
+                    timer.done()
+                    return err
 
-                async def execute_js(webview: int, script: str) -> tuple[DefaultJSResult, Optional[WKJS_UncaughtException]]:
+                async def call_async_js(
+                    webview: int, ps_script: NotNull_VoidP, json_result: bool, timeout: Optional[float], timer,
+                ) -> tuple[DefaultJSResult, Optional[WKJS_ScriptError]]:
                     fut_jsdone: CFRL_Future[bool] = CFRL_Future()
-                    result_exc: Optional[WKJS_UncaughtException] = None
+                    result_exc: Optional[WKJS_ScriptError] = None
                     result_pyobj: Optional[DefaultJSResult] = None
-                    real_script = SCRIPT_TEMPL.replace(SCRIPT_PHOLDER, script)
                     async with AsyncExitStack() as exsk:
-                        ps_script = alloc_nsstring_from_str(real_script)
-                        exsk.callback(pa.release_obj, ps_script)
-
                         pd_jsargs = pa.safe_alloc_init(NSDictionary)
                         exsk.callback(pa.release_obj, pd_jsargs)
 
@@ -745,6 +1149,11 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
 
                         def completion_handler(self: CRet.Py_PVoid, id_result: CRet.Py_PVoid, err: CRet.Py_PVoid):
                             nonlocal result_exc, result_pyobj
+                            if fut_jsdone.done():
+                                # timed out, WebKit is only now done with the block
+                                detached_blocks.discard(chblock)
+                                return
+                            timer.mark('js')
                             if err:
                                 nserr = c_void_p(err)
                                 code = pa.send_message(nserr, b'code', restype=c_long)
@@ -754,10 +1163,18 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                                     c_void_p(pa.send_message(nserr, b'userInfo', restype=c_void_p)),
                                     b'description', restype=c_void_p)), default=WKJS_UncaughtException.UINFO_DEFAULT)
                                 result_exc = WKJS_UncaughtException(err_at=err, code=code, domain=s_domain, user_info=s_uinfo)
+                                timer.mark('convert')
                                 fut_jsdone.set_result(False)
                                 return
-                            result_pyobj = pyobj_from_nsobj_jsresult(pa, c_void_p(id_result), visited={}, null=NullTag)
-                            pa.logger.trace(f'JS done, resolving future; {id_result=}, {err=}')
+                            if json_result:
+                                # undefined (or anything JSON.stringify skips) comes back as nil
+                                s_result = str_from_nsstring(pa, c_void_p(id_result))
+                                result_pyobj = None if s_result is None else json.loads(s_result)
+                            else:
+                                result_pyobj = pyobj_from_nsobj_jsresult(pa, c_void_p(id_result), visited={}, null=NullTag)
+                            timer.mark('convert')
+                            if pa.trace_on:
+                                pa.logger.trace(f'JS done, resolving future; {id_result=}, {err=}')
                             fut_jsdone.set_result(True)
 
                         chblock = pa.make_block(completion_handler, None, POINTER(ObjCBlock), c_void_p, c_void_p)
@@ -767,27 +1184,238 @@ def get_gen(_logger: AbstractLogger) -> Generator[SENDMSG_CBTYPE, None, None]:
                             c_void_p(webview), b'callAsyncJavaScript:arguments:inFrame:inContentWorld:completionHandler:',
                             ps_script, pd_jsargs, c_void_p(None), rp_pageworld, byref(chblock),
                             argtypes=(c_void_p, c_void_p, c_void_p, c_void_p, POINTER(ObjCBlock)))
+                        timer.mark('submit')
+                        if timeout is not None:
+                            def on_js_timeout():
+                                nonlocal result_exc
+                                if not fut_jsdone.done():
+                                    # WebKit still calls the completion handler when it is done with the script
+                                    detached_blocks.add(chblock)
+                                    result_exc = WKJS_Timeout(f'script did not finish within {timeout}s')
+                                    fut_jsdone.set_result(False)
+                            exsk.callback(start_deadline(timeout, on_js_timeout))
 
                         await fut_jsdone
+                        timer.mark('resume')
 
                         pa.logger.trace('JS execution completed')
-                        return result_pyobj, result_exc
+                    return result_pyobj, result_exc
+
+                async def execute_js(
+                    webview: int, script: str, json_result: bool = False, timeout: Optional[float] = None,
+                ) -> tuple[DefaultJSResult, Optional[WKJS_ScriptError]]:
+                    timer = timer_of(stats, 'execute_js')
+                    # only wrapped in an async function, the prelude installed at NEW_WEBVIEW2 does the rest
+                    ps_script = alloc_nsstring_spliced(script, *templ_utf8[json_result], timer=timer)
+                    try:
+                        ret = await call_async_js(webview, ps_script, json_result, timeout, timer)
+                    finally:
+                        pa.release_obj(ps_script)
+                    timer.done()
+                    return ret
 
                 def shutdown():
                     nonlocal active
                     active = False
 
-                fn_tup = navigate_to, execute_js, shutdown, new_webview, free_webview, on_script_log, on_script_comm, pa.set_logger
-                fn_iscoro = True, True, False, True, True, False, False, False, False
+                async def gather(*tasks: tuple[int, tuple]) -> list[CFRL_CoroResult]:
+                    # Runs the tasks concurrently on the main loop, e.g. to have several scripts in flight at once
+                    var_keepalive = set()
+                    results: list[CFRL_CoroResult] = []
+                    futs: list[CFRL_Future[None]] = []
+                    for fn_id, args in tasks:
+                        assert fn_id != WKJS_Task.SHUTDOWN, 'cannot shutdown in a gather'
+                        res_or_coro = fn_tup[fn_id](*args)
+                        if not fn_iscoro[fn_id]:
+                            results.append(CFRL_CoroResult(res_or_coro))
+                            continue
+                        fut: CFRL_Future[None] = CFRL_Future()
+                        futs.append(fut)
+                        results.append(_runcoro_on_loop_base(
+                            py_typecast(CoroutineType, res_or_coro), var_keepalive=var_keepalive, loop=mainloop,
+                            finish=lambda exc, fut=fut: fut.set_result(None), label=WKJS_Task.NAMES[fn_id]))
+                    for fut in futs:
+                        await fut
+                    return results
+
+                async def start_in_order(*coros: Coroutine[Any, Any, T]) -> list[CFRL_CoroResult[T]]:
+                    # like gather, but each coroutine takes its first step (e.g. hands its script to WebKit)
+                    # before the next one is started, right away when on the main thread
+                    var_keepalive = set()
+                    results: list[CFRL_CoroResult[T]] = []
+                    futs: list[CFRL_Future[None]] = []
+                    eager = CFRunLoopGetCurrent() == mainloop.value
+                    for coro in coros:
+                        fut: CFRL_Future[None] = CFRL_Future()
+                        futs.append(fut)
+                        results.append(_runcoro_on_loop_base(
+                            coro, var_keepalive=var_keepalive, loop=mainloop,
+                            finish=lambda exc, fut=fut: fut.set_result(None), eager=eager))
+                    for fut in futs:
+                        await fut
+                    return results
+
+                # submitted coroutines that haven't finished yet: what their blocks need,
+                # and a future that resolves when they finish, even if the future of the caller was cancelled
+                submitted: dict[int, tuple[set, CFRL_Future[None]]] = {}
+
+                def submit(fn_id: int, args: tuple) -> CFRL_Future:
+                    # Starts the task and returns its future without waiting, the run loop spins
+                    # (and so the future resolves) while another task, e.g. WAIT, is being run
+                    assert fn_iscoro[fn_id] and fn_id not in (WKJS_Task.SUBMIT, WKJS_Task.WAIT), f'cannot submit task {fn_id}'
+                    fut: CFRL_Future = CFRL_Future()
+                    finished: CFRL_Future[None] = CFRL_Future()
+                    var_keepalive = set()
+                    submitted[id(finished)] = var_keepalive, finished
+
+                    def finish(exc: BaseException):
+                        del submitted[id(finished)]
+                        finished.set_result(None)
+                        if fut.done():  # cancelled
+                            return
+                        if isinstance(exc, StopIteration):
+                            fut.set_result(exc.value)
+                        else:
+                            fut.set_exception(exc)
+                    _runcoro_on_loop_base(
+                        py_typecast(CoroutineType, fn_tup[fn_id](*args)), var_keepalive=var_keepalive, loop=mainloop,
+                        finish=finish, eager=CFRunLoopGetCurrent() == mainloop.value, label=WKJS_Task.NAMES[fn_id])
+                    return fut
+
+                async def wait_submitted() -> None:
+                    while submitted:
+                        await next(iter(submitted.values()))[1]
+
+                def pump(timeout: float) -> None:
+                    # Runs the loop for at most `timeout` seconds (0 for only what's ready) to resolve submitted tasks,
+                    # for callers that can't block in WAIT, e.g. an asyncio event loop
+                    if CFRunLoopGetCurrent() == mainloop.value:
+                        CFRunLoopRunInMode(kCFRunLoopDefaultMode, timeout, False)
+
+                async def wait(*futs: CFRL_Future) -> None:
+                    # resolves with the futures, how each of them resolved is up to the caller to check
+                    for fut in futs:
+                        try:
+                            await fut
+                        except BaseException:
+                            pass
+
+                fn_tup = (
+                    navigate_to, execute_js, shutdown, new_webview, free_webview,
+                    on_script_log, on_script_comm, pa.set_logger, gather, submit, wait, pump, memory_footprint,
+                    on_script_comm_many)
+                fn_iscoro = True, True, False, True, True, False, False, False, True, False, True, False, False, False
                 last_res = 0
                 while active:
                     task = yield last_res
                     assert task
                     fn_id, args = task
+                    if counters is not None:
+                        counters.task = WKJS_Task.NAMES[fn_id]
                     res_or_coro = fn_tup[fn_id](*args)
-                    last_res = runcoro_on_loop(py_typecast(CoroutineType, res_or_coro)) if fn_iscoro[fn_id] else res_or_coro
+                    last_res = runcoro_on_loop(
+                        py_typecast(CoroutineType, res_or_coro), label=WKJS_Task.NAMES[fn_id]) if fn_iscoro[fn_id] else res_or_coro
+                if submitted:
+                    # their completion handlers must not outlive the webviews
+                    pa.logger.trace(f'waiting for {len(submitted)} submitted task(s) before shutting down')
+                    runcoro_on_loop(wait_submitted())
 
         gen_run = run()
         assert gen_run.send(None) == 0
         yield lambda *args: gen_run.send(args)
         # pa.send_message(NSAutoreleasePool, b'showPools')
+
+
+class WKJS_Dispatcher:
+    """
+    Lets any thread send tasks to a sendmsg, which is only ever called from the thread in `serve`
+    (the main thread for WebKit). Tasks are started in the order they were queued, up to
+    `max_inflight` loop tasks run at once, and `submit` blocks while `maxsize` tasks are queued.
+    An instance can be used as the sendmsg of the easy API on the other threads.
+    """
+    __slots__ = '__weakref__', '_closed', '_owner', '_queue', '_send', 'max_inflight', 'poll_interval'
+
+    _CLOSE = None
+
+    def __init__(self, sendmsg: SENDMSG_CBTYPE, *, maxsize: int = 64, max_inflight: int = 8, poll_interval: float = 0.001):
+        self._send = sendmsg
+        self._queue: Queue[Optional[tuple[int, tuple, Future]]] = Queue(maxsize)
+        self._closed = False
+        self._owner: Optional[int] = None
+        self.max_inflight = max_inflight
+        self.poll_interval = poll_interval
+
+    def submit(self, fn_id: int, args: tuple, *, timeout: Optional[float] = None) -> Future:
+        """Raises queue.Full if the queue stays full for `timeout` seconds"""
+        if self._closed:
+            raise RuntimeError('dispatcher is closed')
+        if fn_id == WKJS_Task.SHUTDOWN:
+            raise ValueError('shut the sendmsg down from its owner after serve() returns')
+        if self._owner == get_ident():
+            raise RuntimeError('the serving thread would wait for itself, use the sendmsg directly')
+        fut: Future = Future()
+        self._queue.put((fn_id, args, fut), timeout=timeout)
+        if self._closed and self._owner is None:
+            # raced with the end of serve(), which may not have seen it
+            fut.cancel()
+        return fut
+
+    def __call__(self, fn_id: int, args: tuple) -> Any:
+        return self.submit(fn_id, args).result()
+
+    def close(self) -> None:
+        """serve() returns once the queued and running tasks are done"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(WKJS_Dispatcher._CLOSE)
+
+    def serve(self) -> None:
+        self._owner = get_ident()
+        inflight = 0
+
+        def on_done(cfut: CFRL_Future, fut: Future):
+            nonlocal inflight
+            inflight -= 1
+            try:
+                fut.set_result(cfut.result())
+            except BaseException as e:
+                fut.set_exception(e)
+
+        closing = False
+        try:
+            while not closing or inflight:
+                if closing or inflight >= self.max_inflight:
+                    self._send(WKJS_Task.PUMP, (self.poll_interval, ))
+                    continue
+                try:
+                    # with nothing in flight there's nothing to pump for, so block
+                    item = self._queue.get(block=not inflight)
+                except Empty:
+                    self._send(WKJS_Task.PUMP, (self.poll_interval, ))
+                    continue
+                if item is WKJS_Dispatcher._CLOSE:
+                    closing = True
+                    continue
+                fn_id, args, fut = item
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if fn_id in WKJS_Task.LOOP_TASKS:
+                        cfut = py_typecast(CFRL_Future, self._send(WKJS_Task.SUBMIT, (fn_id, args)))
+                        inflight += 1
+                        cfut.add_done_callback(lambda cfut, fut=fut: on_done(cfut, fut))
+                    else:
+                        fut.set_result(self._send(fn_id, args))
+                except BaseException as e:
+                    fut.set_exception(e)
+        finally:
+            self._owner = None
+            self._closed = True
+            # nobody will run these
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except Empty:
+                    break
+                if item is not None:
+                    item[2].cancel()
@@ -1,14 +1,30 @@
 SCRIPT_PHOLDER = r'/*__ACTUAL_SCRIPT_CONTENT_PLACEHOLDER__*/'
-SCRIPT_TEMPL = r'''
+LOG_BATCH_PHOLDER = r'/*__LOG_BATCH__*/0'
+# Run once in every document of a webview (as a WKUserScript, and by NEW_WEBVIEW2 for the initial one):
+# routes console.* to the wkjs_log handler and keeps communicate and communicateMany (one message for an array
+# of requests, answered by an array), hiding window.webkit from the scripts.
+# With a log batch size in place of LOG_BATCH_PHOLDER, the records are posted in arrays of up to that many,
+# once the running script yields to the event loop or finishes
+SCRIPT_PRELUDE = r'''
+(()=>{
+if ('__wkjsi_communicate' in globalThis || !window?.webkit?.messageHandlers) return;
+const LOG_BATCH = /*__LOG_BATCH__*/0;
+let __logbuf = [];
 let __webkit = window.webkit;
-const communicate = (()=>{
-if (!window?.webkit?.messageHandlers) throw new Error('No message handlers set up');
 function __postmsg(x, channel) {
     window.webkit = __webkit;
-    const ret = window.webkit.messageHandlers[channel].postMessage(x);
-    __webkit = window.webkit;
-    window.webkit = undefined;
-    return ret;
+    try {
+        return window.webkit.messageHandlers[channel].postMessage(x);
+    } finally {
+        __webkit = window.webkit;
+        window.webkit = undefined;
+    }
+}
+function __flushlogs() {
+    if (!__logbuf.length) return;
+    const records = __logbuf;
+    __logbuf = [];
+    __postmsg(records, 'wkjs_log');
 }
 Object.entries({
     trace: 0,  // TRACE
@@ -20,13 +36,34 @@ Object.entries({
     error: 5,  // ERR
 }).forEach(([fn, logType])=>{
     console[fn] = function() {
-        __postmsg({logType, argsArr: Array.from(arguments)}, 'wkjs_log');
+        const record = {logType, argsArr: Array.from(arguments)};
+        if (!LOG_BATCH)
+            return void __postmsg(record, 'wkjs_log');
+        if (__logbuf.push(record) === 1)
+            queueMicrotask(__flushlogs);
+        else if (__logbuf.length >= LOG_BATCH)
+            __flushlogs();
     };
 });
 window.webkit = undefined;
-return x=>__postmsg(x, 'wkjs_com');
+Object.defineProperty(globalThis, '__wkjsi_flushlogs', {value: __flushlogs});
+Object.defineProperty(globalThis, '__wkjsi_communicate', {value: x=>__postmsg(x, 'wkjs_com')});
+Object.defineProperty(globalThis, '__wkjsi_communicateMany', {value: xs=>__postmsg(Array.from(xs), 'wkjs_commany')});
 })();
+'''
+# What every script is wrapped in
+SCRIPT_TEMPL = r'''const communicate = globalThis.__wkjsi_communicate;
+const communicateMany = globalThis.__wkjsi_communicateMany;
+if (!communicate) throw new Error('No message handlers set up');
+try {
 return await (async ()=>{
 /*__ACTUAL_SCRIPT_CONTENT_PLACEHOLDER__*/
-})().then(()=>{window.webkit = __webkit;});
+})();
+} finally {
+globalThis.__wkjsi_flushlogs();
+}
 '''
+# Same as SCRIPT_TEMPL, but the result is serialized with JSON.stringify in JS,
+# so that converting it takes a single NSString instead of a walk over the object graph
+SCRIPT_TEMPL_JSON = SCRIPT_TEMPL.replace('return await', 'return JSON.stringify(await').replace('})();\n}', '})());\n}')
+assert SCRIPT_TEMPL_JSON.count('JSON.stringify(') == 1 and '})());' in SCRIPT_TEMPL_JSON
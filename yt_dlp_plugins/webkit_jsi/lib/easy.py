@@ -3,16 +3,53 @@ A MORE PYTHONIC API
 """
 
 import json
-from typing import Optional, cast as py_typecast
+import time
 
+from contextlib import contextmanager
+from typing import Callable, Generator, Literal, NoReturn, Optional, Union, cast as py_typecast
+
+from .api import (
+    COMM_CBTYPE,
+    COMM_MANY_CBTYPE,
+    LOG_CBTYPE,
+    SENDMSG_CBTYPE,
+    CFRL_CoroResult,
+    CFRL_Future,
+    DefaultJSResult,
+    NullTag,
+    WKJS_ScriptError,
+    WKJS_Task,
+    WKJS_Timeout,
+    WKJS_UncaughtException,
+    get_gen,
+)
 from .logging import AbstractLogger
-from .api import COMM_CBTYPE, LOG_CBTYPE, SENDMSG_CBTYPE, DefaultJSResult, NullTag, WKJS_Task, WKJS_UncaughtException, get_gen
+from .pyneapple_objc import BridgeCounters
+from .stats import WKJS_Stats
+
 
 class WKJSE_Factory:
-    __slots__ = '_gen', '_sendmsg'
+    __slots__ = '_counters', '_gen', '_sendmsg', '_stats'
 
-    def __init__(self, logger: AbstractLogger):
-        self._gen = get_gen(logger)
+    def __init__(
+        self, logger: AbstractLogger, *,
+        gen_factory: Callable[..., Generator[SENDMSG_CBTYPE, None, None]] = get_gen,
+        collect_stats: bool = False,
+        count_bridge: bool = False,
+        log_batch: int = 0,
+    ):
+        # gen_factory: e.g. sim.get_sim_gen to run without WebKit
+        # log_batch: see get_gen, the callbacks passed to on_script_log then get lists (see log_records)
+        self._stats = WKJS_Stats() if collect_stats else None
+        self._counters = BridgeCounters() if count_bridge else None
+        kwargs = {}
+        if collect_stats:
+            kwargs['stats'] = self._stats
+        if count_bridge:
+            kwargs['counters'] = self._counters
+        if log_batch:
+            kwargs['log_batch'] = log_batch
+        self._gen = gen_factory(logger, **kwargs)
         self._sendmsg = None
 
     def __enter__(self):
@@ -24,6 +61,25 @@ class WKJSE_Factory:
         assert self._gen is not None and self._sendmsg is not None
         return py_typecast(AbstractLogger, self._sendmsg(WKJS_Task.SET_LOGGER, (new_logger, )))
 
+    def stats(self) -> Optional[dict[str, dict[str, dict[str, float]]]]:
+        """Latency percentiles per task and phase (see WKJS_Stats.summary), None unless collect_stats"""
+        return None if self._stats is None else self._stats.summary()
+
+    def format_stats(self) -> Optional[str]:
+        return None if self._stats is None else self._stats.format()
+
+    @property
+    def recorder(self) -> Optional[WKJS_Stats]:
+        """Where the tasks are timed, for the users of the sendmsg to record their own events, None unless collect_stats"""
+        return self._stats
+
+    def bridge_counts(self) -> Optional[dict[str, dict[str, Union[int, dict[str, int]]]]]:
+        """The bridge crossings per task (see BridgeCounters.summary), None unless count_bridge"""
+        return None if self._counters is None else self._counters.summary()
+
+    def format_bridge_counts(self) -> Optional[str]:
+        return None if self._counters is None else self._counters.format()
+
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         assert self._gen is not None and self._sendmsg is not None
         try:
@@ -44,35 +100,74 @@ class WKJSE_Factory:
 
 
 class WKJSE_Webview:
-    __slots__ = '_send', '_wv', '_ucc'
+    __slots__ = '_send', '_ucc', '_wv', 'executed', 'recycle_reason', 'script_bytes'
 
     def __init__(self, sendmsg: SENDMSG_CBTYPE):
         self._send = sendmsg
         self._wv: Optional[int] = None
         self._ucc: Optional[int] = None
+        # what the page has been given to run, see WKJSE_RecyclePolicy
+        self.executed = 0
+        self.script_bytes = 0
+        # set to have WKJSE_Pool replace the webview
+        self.recycle_reason: Optional[str] = None
 
     def __enter__(self):
         assert self._wv is None
         self._wv, self._ucc = py_typecast(tuple[int, int], self._send(WKJS_Task.NEW_WEBVIEW2, ()))
         return self
 
+    @classmethod
+    def _adopt(cls, sendmsg: SENDMSG_CBTYPE, wv: int, ucc: int) -> 'WKJSE_Webview':
+        # a webview constructed by a submitted NEW_WEBVIEW2, already entered
+        self = cls(sendmsg)
+        self._wv, self._ucc = wv, ucc
+        return self
+
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         assert self._wv is not None
         self._send(WKJS_Task.FREE_WEBVIEW, (self._wv, ))
         self._wv = None
         self._ucc = None
 
-    def navigate_to(self, host: str, html: str) ->  None:
+    def _raise(self, exc: WKJS_ScriptError) -> NoReturn:
+        if isinstance(exc, WKJS_Timeout):
+            # the page may still be busy with it, or stuck for good
+            self.recycle_reason = 'timeout'
+        raise exc
+
+    def navigate_to(self, host: str, html: str, *, timeout: Optional[float] = None) ->  None:
+        """timeout: seconds, after which WKJS_Timeout is raised and the webview is marked for recycling"""
         assert self._wv is not None
-        self._send(WKJS_Task.NAVIGATE_TO, (self._wv, host, html))
+        if (exc := self._send(WKJS_Task.NAVIGATE_TO, (self._wv, host, html, timeout))) is not None:
+            self._raise(exc)
 
-    def execute_js(self, script: str) -> DefaultJSResult:
+    def execute_js(self, script: str, *, json_result: bool = False, timeout: Optional[float] = None) -> DefaultJSResult:
+        """
+        json_result: serialize the result with JSON.stringify in JS and parse it with json.loads.
+        Much cheaper for large results, but null and undefined both become None,
+        and the usual JSON.stringify rules apply (e.g. Date becomes an ISO string)
+        timeout: same as for navigate_to, the script keeps running but its result is dropped
+        """
         assert self._wv is not None
-        res, exc = py_typecast(tuple[DefaultJSResult, Optional[WKJS_UncaughtException]], self._send(WKJS_Task.EXECUTE_JS, (self._wv, script)))
+        self.executed += 1
+        self.script_bytes += len(script)
+        res, exc = py_typecast(tuple[DefaultJSResult, Optional[WKJS_ScriptError]], self._send(WKJS_Task.EXECUTE_JS, (self._wv, script, json_result, timeout)))
         if exc is not None:
-            raise exc
+            self._raise(exc)
         return res
 
+    def submit_js(self, script: str, *, json_result: bool = False, timeout: Optional[float] = None) -> 'WKJSE_Future':
+        """
+        Hands the script to WebKit and returns without waiting for it,
+        so the next script can be prepared (or submitted) while this one runs
+        """
+        assert self._wv is not None
+        self.executed += 1
+        self.script_bytes += len(script)
+        return WKJSE_Future(self._send, py_typecast(CFRL_Future, self._send(
+            WKJS_Task.SUBMIT, (WKJS_Task.EXECUTE_JS, (self._wv, script, json_result, timeout)))), self)
+
     def on_script_log(self, cb: LOG_CBTYPE) -> Optional[LOG_CBTYPE]:
         assert self._wv is not None
         return py_typecast(Optional[LOG_CBTYPE], self._send(WKJS_Task.ON_SCRIPTLOG2, (self._ucc, cb)))
@@ -81,6 +176,385 @@ class WKJSE_Webview:
         assert self._wv is not None
         return py_typecast(Optional[COMM_CBTYPE], self._send(WKJS_Task.ON_SCRIPTCOMM2, (self._ucc, cb)))
 
+    def on_script_comm_many(self, cb: COMM_MANY_CBTYPE) -> Optional[COMM_MANY_CBTYPE]:
+        """What answers communicateMany(list) in one go, otherwise each element goes to the on_script_comm callback"""
+        assert self._wv is not None
+        return py_typecast(Optional[COMM_MANY_CBTYPE], self._send(WKJS_Task.ON_SCRIPTCOMM_MANY, (self._ucc, cb)))
+
+    def memory_footprint(self) -> Optional[int]:
+        """Bytes used by the WebContent process of the webview, None if it can't be measured"""
+        assert self._wv is not None
+        return py_typecast(Optional[int], self._send(WKJS_Task.MEMORY_FOOTPRINT, (self._wv, )))
+
+
+class WKJSE_Future:
+    """The result of WKJSE_Webview.submit_js"""
+    __slots__ = '_fut', '_send', '_webview'
+
+    def __init__(
+        self, sendmsg: SENDMSG_CBTYPE, fut: CFRL_Future[tuple[DefaultJSResult, Optional[WKJS_ScriptError]]],
+        webview: WKJSE_Webview,
+    ):
+        self._send = sendmsg
+        self._fut = fut
+        self._webview = webview
+
+    def done(self) -> bool:
+        return self._fut.done()
+
+    def cancel(self) -> bool:
+        """The script still runs to completion, only its result is dropped"""
+        return self._fut.cancel()
+
+    def cancelled(self) -> bool:
+        return self._fut.cancelled()
+
+    def result(self) -> DefaultJSResult:
+        if not self._fut.done():
+            # spins the run loop, which also resolves the other submitted scripts that are done
+            self._send(WKJS_Task.WAIT, (self._fut, ))
+        res, exc = self._fut.result()
+        if exc is not None:
+            self._webview._raise(exc)
+        return res
+
+
+POOL_POLICY = Literal['round-robin', 'least-loaded']
+
+
+class WKJSE_RecyclePolicy:
+    """
+    When WKJSE_Pool replaces a webview, since the page keeps the globals and the compiled code of every script
+    and the footprint of the WebContent process only grows. Each limit is off when 0:
+    after `max_executions` scripts, after `max_script_bytes` of scripts (counted in characters),
+    or once the footprint is over `max_memory` bytes, which is measured every `memory_interval` scripts
+    """
+    __slots__ = 'max_executions', 'max_memory', 'max_script_bytes', 'memory_interval'
+
+    def __init__(self, *, max_executions: int = 0, max_script_bytes: int = 0, max_memory: int = 0, memory_interval: int = 16):
+        self.max_executions = max_executions
+        self.max_script_bytes = max_script_bytes
+        self.max_memory = max_memory
+        self.memory_interval = memory_interval
+
+    def __bool__(self) -> bool:
+        return bool(self.max_executions or self.max_script_bytes or self.max_memory)
+
+
+class _Replacement:
+    """A webview being constructed (and prepared) to take the place of a retired one"""
+    __slots__ = 'fut', 'prepared', 'reason', 'started', 'webview'
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        self.started = time.perf_counter()
+        self.fut: Optional[CFRL_Future[tuple[int, int]]] = None
+        self.webview: Optional[WKJSE_Webview] = None
+        self.prepared: Optional[WKJSE_Future] = None
+
+
+class WKJSE_Pool:
+    """
+    Keeps `size` warm webviews, each with its own user content controller,
+    so several scripts can be in flight on the run loop at once
+    """
+    __slots__ = (
+        '_commcb', '_commmanycb', '_freeing', '_load', '_logcb', '_measured', '_next', '_replacements', '_send',
+        '_starting', '_wvs', 'background', 'policy', 'prepare_script', 'recycle', 'recycled', 'size', 'stats',
+    )
+
+    def __init__(
+        self, sendmsg: SENDMSG_CBTYPE, size: int = 2, *, policy: POOL_POLICY = 'least-loaded',
+        recycle: Optional[WKJSE_RecyclePolicy] = None, background: bool = True, stats: Optional[WKJS_Stats] = None,
+    ):
+        """
+        recycle: when to replace a webview, which is also done once its recycle_reason is set
+        background: construct the replacements with SUBMIT, so that they are swapped in once ready and no script waits
+            for them. Otherwise (e.g. the webkit host, which doesn't serve SUBMIT) they are constructed in place
+        stats: where the replacements are recorded, as ('recycle', reason) with the time they took to be swapped in
+        """
+        if size < 1:
+            raise ValueError(f'pool size must be positive, got {size}')
+        if policy not in ('round-robin', 'least-loaded'):
+            raise ValueError(f'unknown pool policy {policy!r}')
+        self._send = sendmsg
+        self._wvs: list[WKJSE_Webview] = []
+        self._load: list[int] = []
+        self._next = 0
+        # `executed` of each webview when its footprint was last measured
+        self._measured: list[int] = []
+        self._replacements: list[Optional[_Replacement]] = []
+        # FREE_WEBVIEW of the retired webviews, submitted
+        self._freeing: list[CFRL_Future] = []
+        # NEW_WEBVIEW2 of the webviews constructed by start(), not adopted by __enter__ yet
+        self._starting: list[CFRL_Future[tuple[int, int]]] = []
+        self._logcb: Optional[LOG_CBTYPE] = None
+        self._commcb: Optional[COMM_CBTYPE] = None
+        self._commmanycb: Optional[COMM_MANY_CBTYPE] = None
+        self.policy = policy
+        self.size = size
+        self.recycle = recycle
+        self.background = background
+        # run in the replacements before they are swapped in, e.g. what the user of the pool loads in every webview
+        self.prepare_script: Optional[str] = None
+        self.stats = stats
+        # reason: replacements swapped in
+        self.recycled: dict[str, int] = {}
+
+    def start(self, *, prepare: bool = True) -> 'WKJSE_Pool':
+        """
+        Submits the construction of the webviews, each running prepare_script (if `prepare`) before it resolves,
+        and returns without waiting for it. __enter__ then waits for what isn't done yet. Needs `background`
+        """
+        assert self.background and not self._wvs and not self._starting
+        args = (self.prepare_script if prepare else None, )
+        self._starting = [
+            py_typecast(CFRL_Future, self._send(WKJS_Task.SUBMIT, (WKJS_Task.NEW_WEBVIEW2, args)))
+            for _ in range(self.size)]
+        return self
+
+    def __enter__(self):
+        assert not self._wvs
+        try:
+            if futs := [fut for fut in self._starting if not fut.done()]:
+                self._send(WKJS_Task.WAIT, tuple(futs))
+            for _ in range(self.size):
+                if self._starting:
+                    wv, ucc = self._starting[0].result()
+                    del self._starting[0]
+                    self._wvs.append(WKJSE_Webview._adopt(self._send, wv, ucc))
+                else:
+                    self._wvs.append(WKJSE_Webview(self._send).__enter__())
+                self._load.append(0)
+                self._measured.append(0)
+                self._replacements.append(None)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        pending = [rep for rep in self._replacements if rep is not None]
+        futs = [fut for fut in (*self._freeing, *self._starting) if not fut.done()]
+        for rep in pending:
+            if rep.fut is not None and not rep.fut.done():
+                futs.append(rep.fut)
+            if rep.prepared is not None and not rep.prepared.done():
+                futs.append(rep.prepared._fut)
+        if futs:
+            self._send(WKJS_Task.WAIT, tuple(futs))
+        for fut in self._starting:
+            try:
+                WKJSE_Webview._adopt(self._send, *fut.result()).__exit__(None, None, None)
+            except BaseException:
+                continue
+        self._starting.clear()
+        for rep in pending:
+            if rep.webview is None and rep.fut is not None:
+                try:
+                    rep.webview = WKJSE_Webview._adopt(self._send, *rep.fut.result())
+                except BaseException:
+                    continue
+            if rep.webview is not None:
+                rep.webview.__exit__(None, None, None)
+        while self._wvs:
+            self._wvs.pop().__exit__(None, None, None)
+        self._load.clear()
+        self._measured.clear()
+        self._replacements.clear()
+        self._freeing.clear()
+        self._next = 0
+
+    def _recycle_reason(self, idx: int) -> Optional[str]:
+        wv = self._wvs[idx]
+        if wv.recycle_reason is not None:
+            return wv.recycle_reason
+        if not (p := self.recycle):
+            return None
+        if p.max_executions and wv.executed >= p.max_executions:
+            return 'executions'
+        if p.max_script_bytes and wv.script_bytes >= p.max_script_bytes:
+            return 'script_bytes'
+        if p.max_memory and wv.executed - self._measured[idx] >= p.memory_interval:
+            self._measured[idx] = wv.executed
+            if (footprint := wv.memory_footprint()) is not None and footprint > p.max_memory:
+                return 'memory'
+        return None
+
+    def _start_replacement(self, reason: str) -> _Replacement:
+        rep = _Replacement(reason)
+        if self.background:
+            rep.fut = py_typecast(CFRL_Future, self._send(WKJS_Task.SUBMIT, (WKJS_Task.NEW_WEBVIEW2, ())))
+            return rep
+        rep.webview = WKJSE_Webview(self._send).__enter__()
+        if self.prepare_script is not None:
+            try:
+                rep.webview.execute_js(self.prepare_script)
+            except WKJS_UncaughtException:
+                # the user of the pool finds out when it needs what was prepared
+                pass
+        return rep
+
+    def _ready(self, idx: int, rep: _Replacement) -> bool:
+        if rep.webview is None:
+            assert rep.fut is not None
+            if not rep.fut.done():
+                return False
+            try:
+                wv, ucc = rep.fut.result()
+            except Exception:
+                # started again on the next call
+                self._replacements[idx] = None
+                return False
+            rep.webview = WKJSE_Webview._adopt(self._send, wv, ucc)
+            if self.prepare_script is not None:
+                rep.prepared = rep.webview.submit_js(self.prepare_script)
+        return rep.prepared is None or rep.prepared.done()
+
+    def _wait_ready(self, idx: int, rep: _Replacement) -> bool:
+        while not self._ready(idx, rep):
+            if self._replacements[idx] is not rep:
+                return False
+            fut = rep.fut if rep.prepared is None else rep.prepared._fut
+            self._send(WKJS_Task.WAIT, (fut, ))
+        return True
+
+    def _swap(self, idx: int, rep: _Replacement) -> None:
+        assert rep.webview is not None
+        old, self._wvs[idx] = self._wvs[idx], rep.webview
+        self._replacements[idx] = None
+        self._measured[idx] = 0
+        if self._logcb is not None:
+            rep.webview.on_script_log(self._logcb)
+        if self._commcb is not None:
+            rep.webview.on_script_comm(self._commcb)
+        if self._commmanycb is not None:
+            rep.webview.on_script_comm_many(self._commmanycb)
+        if self.background:
+            self._freeing.append(py_typecast(CFRL_Future, self._send(WKJS_Task.SUBMIT, (WKJS_Task.FREE_WEBVIEW, (old._wv, )))))
+            old._wv = old._ucc = None
+        else:
+            old.__exit__(None, None, None)
+        self.recycled[rep.reason] = self.recycled.get(rep.reason, 0) + 1
+        if self.stats is not None:
+            self.stats.record('recycle', rep.reason, time.perf_counter() - rep.started)
+
+    def _recycle(self) -> None:
+        # swaps in the replacements that are ready, and starts replacing the webviews that are due
+        if self._freeing:
+            self._freeing = [fut for fut in self._freeing if not fut.done()]
+        for idx in range(len(self._wvs)):
+            if (rep := self._replacements[idx]) is None:
+                if (reason := self._recycle_reason(idx)) is None:
+                    continue
+                rep = self._replacements[idx] = self._start_replacement(reason)
+            if self._load[idx]:
+                continue
+            # a webview that timed out may be stuck for good, so the next script waits for its replacement instead
+            if self._wait_ready(idx, rep) if rep.reason == 'timeout' else self._ready(idx, rep):
+                self._swap(idx, rep)
+
+    def format_recycled(self) -> Optional[str]:
+        if not self.recycled:
+            return None
+        return ', '.join(f'{n} for {reason}' for reason, n in self.recycled.items())
+
+    def __len__(self):
+        return len(self._wvs)
+
+    @property
+    def webviews(self) -> tuple[WKJSE_Webview, ...]:
+        return tuple(self._wvs)
+
+    def _pick(self) -> int:
+        assert self._wvs
+        n = len(self._wvs)
+        if self.policy == 'round-robin':
+            idx = self._next
+        else:
+            # ties go round-robin, or a caller that is done with each webview before the next pick only gets the first
+            idx = min(range(n), key=lambda i: (self._load[i], (i - self._next) % n))
+        self._next = (idx + 1) % n
+        return idx
+
+    @contextmanager
+    def acquire(self) -> Generator[WKJSE_Webview, None, None]:
+        """A webview to run scripts on, counted as loaded until the block exits so that the next acquire gets another"""
+        self._recycle()
+        idx = self._pick()
+        self._load[idx] += 1
+        try:
+            yield self._wvs[idx]
+        finally:
+            self._load[idx] -= 1
+
+    def navigate_to(self, host: str, html: str, *, timeout: Optional[float] = None) -> None:
+        for wv in self._wvs:
+            wv.navigate_to(host, html, timeout=timeout)
+
+    def execute_js(self, script: str, *, json_result: bool = False, timeout: Optional[float] = None) -> DefaultJSResult:
+        self._recycle()
+        idx = self._pick()
+        self._load[idx] += 1
+        try:
+            return self._wvs[idx].execute_js(script, json_result=json_result, timeout=timeout)
+        finally:
+            self._load[idx] -= 1
+
+    def execute_js_many(
+        self, scripts: list[str], *, return_exceptions: bool = False, json_result: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[Union[DefaultJSResult, BaseException]]:
+        """
+        Dispatches the scripts over the pool and runs them concurrently.
+        Results are in the order of `scripts`
+        """
+        self._recycle()
+        idxs = []
+        for script in scripts:
+            idx = self._pick()
+            self._load[idx] += 1
+            self._wvs[idx].executed += 1
+            self._wvs[idx].script_bytes += len(script)
+            idxs.append(idx)
+        try:
+            results = py_typecast(list[CFRL_CoroResult], self._send(WKJS_Task.GATHER, tuple(
+                (WKJS_Task.EXECUTE_JS, (self._wvs[idx]._wv, script, json_result, timeout))
+                for idx, script in zip(idxs, scripts))))
+        finally:
+            for idx in idxs:
+                self._load[idx] -= 1
+        ret: list[Union[DefaultJSResult, BaseException]] = []
+        for idx, cres in zip(idxs, results):
+            if cres.rexc is not None:
+                exc = cres.rexc
+            else:
+                res, exc = py_typecast(tuple[DefaultJSResult, Optional[WKJS_ScriptError]], cres.ret)
+                if exc is None:
+                    ret.append(res)
+                    continue
+                if isinstance(exc, WKJS_Timeout):
+                    self._wvs[idx].recycle_reason = 'timeout'
+            if not return_exceptions:
+                raise exc
+            ret.append(exc)
+        return ret
+
+    def on_script_log(self, cb: LOG_CBTYPE) -> None:
+        self._logcb = cb
+        for wv in self._wvs:
+            wv.on_script_log(cb)
+
+    def on_script_comm(self, cb: COMM_CBTYPE) -> None:
+        self._commcb = cb
+        for wv in self._wvs:
+            wv.on_script_comm(cb)
+
+    def on_script_comm_many(self, cb: COMM_MANY_CBTYPE) -> None:
+        self._commmanycb = cb
+        for wv in self._wvs:
+            wv.on_script_comm_many(cb)
+
 
 def jsres_to_json(jsres: DefaultJSResult, **kwargs):
     return json.dumps(None if jsres is NullTag else jsres, **kwargs)
@@ -101,4 +575,9 @@ def jsres_to_log(*jsres: DefaultJSResult):
     return ' '.join(map(jsres_to_log1, jsres)) + '\n'
 
 
+def log_records(msg: DefaultJSResult) -> list[dict[str, DefaultJSResult]]:
+    """The records a LOG_CBTYPE callback got, a list of them with log_batch or just the one"""
+    return py_typecast(list[dict[str, DefaultJSResult]], msg if isinstance(msg, list) else [msg])
+
+
 # TODO(?): container class for log capture
@@ -0,0 +1,136 @@
+"""
+THE EASY API, FOR ASYNCIO
+
+The scripts are submitted without blocking the event loop, and while any of them is in flight,
+the run loop is pumped from the event loop every `pump_interval` seconds to deliver the completions.
+So the event loop must run on the thread that owns the sendmsg (the main thread for WebKit),
+or the sendmsg has to be a WKJS_Dispatcher served by that thread.
+"""
+
+import asyncio
+import weakref
+
+from typing import Any, Optional, cast as py_typecast
+
+from .api import (
+    COMM_CBTYPE,
+    COMM_MANY_CBTYPE,
+    LOG_CBTYPE,
+    SENDMSG_CBTYPE,
+    CFRL_Future,
+    DefaultJSResult,
+    WKJS_ScriptError,
+    WKJS_Task,
+)
+
+
+def _settle(cfut: CFRL_Future, afut: asyncio.Future) -> None:
+    if afut.done():  # cancelled by the awaiting side
+        return
+    if cfut.cancelled():
+        afut.cancel()
+    elif (exc := cfut.exception()) is not None:
+        afut.set_exception(exc)
+    else:
+        afut.set_result(cfut.result())
+
+
+class _AsyncPump:
+    """Pumps the run loop of one sendmsg while it has tasks in flight"""
+    __slots__ = '_inflight', '_send', '_task', 'interval'
+
+    def __init__(self, sendmsg: SENDMSG_CBTYPE, interval: float):
+        self._send = sendmsg
+        self._inflight = 0
+        self._task: Optional[asyncio.Task] = None
+        self.interval = interval
+
+    async def _run(self) -> None:
+        try:
+            while self._inflight:
+                self._send(WKJS_Task.PUMP, (0.0, ))
+                await asyncio.sleep(self.interval)
+        finally:
+            self._task = None
+
+    async def call(self, fn_id: int, args: tuple) -> Any:
+        aloop = asyncio.get_running_loop()
+        afut = aloop.create_future()
+        cfut = py_typecast(CFRL_Future, self._send(WKJS_Task.SUBMIT, (fn_id, args)))
+        if cfut.done():
+            _settle(cfut, afut)
+            return await afut
+        self._inflight += 1
+
+        def on_done(cfut: CFRL_Future):
+            # may be called on another thread by other backends
+            aloop.call_soon_threadsafe(self._on_done, cfut, afut)
+        cfut.add_done_callback(on_done)
+        if self._task is None:
+            self._task = aloop.create_task(self._run())
+        try:
+            return await afut
+        except asyncio.CancelledError:
+            cfut.cancel()
+            raise
+
+    def _on_done(self, cfut: CFRL_Future, afut: asyncio.Future) -> None:
+        self._inflight -= 1
+        _settle(cfut, afut)
+
+
+_pumps: 'weakref.WeakKeyDictionary[SENDMSG_CBTYPE, _AsyncPump]' = weakref.WeakKeyDictionary()
+
+
+def _get_pump(sendmsg: SENDMSG_CBTYPE, interval: float) -> _AsyncPump:
+    # one per sendmsg, shared by its webviews
+    if (pump := _pumps.get(sendmsg)) is None:
+        pump = _pumps[sendmsg] = _AsyncPump(sendmsg, interval)
+    return pump
+
+
+class AsyncWKJSE_Webview:
+    __slots__ = '_pump', '_send', '_ucc', '_wv'
+
+    def __init__(self, sendmsg: SENDMSG_CBTYPE, *, pump_interval: float = 0.001):
+        self._send = sendmsg
+        self._pump = _get_pump(sendmsg, pump_interval)
+        self._wv: Optional[int] = None
+        self._ucc: Optional[int] = None
+
+    async def __aenter__(self):
+        assert self._wv is None
+        self._wv, self._ucc = py_typecast(tuple[int, int], await self._pump.call(WKJS_Task.NEW_WEBVIEW2, ()))
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        assert self._wv is not None
+        wv, self._wv, self._ucc = self._wv, None, None
+        await self._pump.call(WKJS_Task.FREE_WEBVIEW, (wv, ))
+
+    async def navigate_to(self, host: str, html: str, *, timeout: Optional[float] = None) -> None:
+        assert self._wv is not None
+        if (exc := await self._pump.call(WKJS_Task.NAVIGATE_TO, (self._wv, host, html, timeout))) is not None:
+            raise exc
+
+    async def execute_js(self, script: str, *, json_result: bool = False, timeout: Optional[float] = None) -> DefaultJSResult:
+        """Same as WKJSE_Webview.execute_js. Cancelling drops the result, but doesn't stop the script"""
+        assert self._wv is not None
+        res, exc = py_typecast(
+            tuple[DefaultJSResult, Optional[WKJS_ScriptError]],
+            await self._pump.call(WKJS_Task.EXECUTE_JS, (self._wv, script, json_result, timeout)))
+        if exc is not None:
+            raise exc
+        return res
+
+    def on_script_log(self, cb: LOG_CBTYPE) -> Optional[LOG_CBTYPE]:
+        assert self._wv is not None
+        return py_typecast(Optional[LOG_CBTYPE], self._send(WKJS_Task.ON_SCRIPTLOG2, (self._ucc, cb)))
+
+    def on_script_comm(self, cb: COMM_CBTYPE) -> Optional[COMM_CBTYPE]:
+        assert self._wv is not None
+        return py_typecast(Optional[COMM_CBTYPE], self._send(WKJS_Task.ON_SCRIPTCOMM2, (self._ucc, cb)))
+
+    def on_script_comm_many(self, cb: COMM_MANY_CBTYPE) -> Optional[COMM_MANY_CBTYPE]:
+        assert self._wv is not None
+        return py_typecast(Optional[COMM_MANY_CBTYPE], self._send(WKJS_Task.ON_SCRIPTCOMM_MANY, (self._ucc, cb)))
@@ -0,0 +1,399 @@
+"""
+A long-lived process that owns the WebKit runtime and serves the WKJS_Task protocol
+over a Unix domain socket, so that short-lived yt-dlp invocations don't pay for
+loading the frameworks and constructing webviews every time.
+
+Start it with `python -m yt_dlp_plugins.webkit_jsi.lib.host --socket PATH`
+and pass `connect_gen` (bound to the same path) as the `gen_factory` of WKJSE_Factory.
+"""
+
+import datetime as dt
+import io
+import os
+import pickle
+import selectors
+import socket
+import struct
+import time
+
+from contextlib import closing
+from functools import partial
+from typing import Any, Callable, Generator, Optional, cast as py_typecast
+
+from .logging import AbstractLogger, DefaultLoggerImpl, trace_enabled
+from .api import (
+    COMM_CBTYPE,
+    COMM_MANY_CBTYPE,
+    LOG_CBTYPE,
+    SENDMSG_CBTYPE,
+    CFRL_CoroResult,
+    DefaultJSResult,
+    PyResultType,
+    WKJS_HostError,
+    WKJS_Task,
+    WKJS_UncaughtException,
+    comm_many_of,
+    get_gen,
+)
+from .easy import WKJSE_Factory
+from .pyneapple_objc import BridgeCounters
+from .stats import NULL_TIMER, WKJS_Stats, timer_of
+
+
+_HDR = struct.Struct('!I')
+_PICKLE_PROTOCOL = 4
+
+
+# Only the types that make up a DefaultJSResult (and the wrappers around them) can be unpickled,
+# keyed by the last component of the module name so that the two sides may import the package differently
+_UNPICKLE_ALLOWED = {
+    ('datetime', 'datetime'): dt.datetime,
+    ('datetime', 'timezone'): dt.timezone,
+    ('datetime', 'timedelta'): dt.timedelta,
+    ('api', 'NullTag'): None,
+    ('api', '_UnknownStructure'): None,
+    ('api', 'CFRL_CoroResult'): None,
+    ('api', '_uncaught_exception'): None,
+    ('api', 'WKJS_HostError'): None,
+    ('api', 'WKJS_Timeout'): None,
+}
+
+
+class _RestrictedUnpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str) -> Any:
+        key = module.rpartition('.')[2], name
+        if key not in _UNPICKLE_ALLOWED:
+            raise pickle.UnpicklingError(f'refusing to unpickle {module}.{name}')
+        if (obj := _UNPICKLE_ALLOWED[key]) is not None:
+            return obj
+        from . import api
+        return getattr(api, name)
+
+
+def _send_frame(sock: socket.socket, obj: Any) -> None:
+    data = pickle.dumps(obj, protocol=_PICKLE_PROTOCOL)
+    sock.sendall(_HDR.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytearray:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        nread = sock.recv_into(view[got:])
+        if not nread:
+            raise WKJS_HostError('connection closed by peer')
+        got += nread
+    return buf
+
+
+def _recv_frame(sock: socket.socket) -> Any:
+    size, = _HDR.unpack(_recv_exact(sock, _HDR.size))
+    return _RestrictedUnpickler(io.BytesIO(_recv_exact(sock, size))).load()
+
+
+def default_socket_path() -> str:
+    base = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(base, f'yt-dlp-apple-webkit-jsi-{os.getuid()}.sock')
+
+
+class _HostConn:
+    """One client of the host, the webviews it created are freed when it disconnects"""
+    __slots__ = 'sock', 'webviews', 'uccs', 'logger'
+
+    def __init__(self, sock: socket.socket, logger: AbstractLogger):
+        self.sock = sock
+        self.webviews: dict[int, int] = {}
+        self.uccs: set[int] = set()
+        self.logger = logger
+
+    def on_log(self, ucc: int, msg: DefaultJSResult) -> None:
+        try:
+            _send_frame(self.sock, ('log', ucc, msg))
+        except OSError as e:
+            self.logger.trace(f'dropping log message of a disconnected client: {e}')
+
+    def on_comm(
+        self, ucc: int, msg: DefaultJSResult, reply: Callable[[PyResultType, Optional[str]], None], kind: str = 'comm',
+    ) -> None:
+        # the script is waiting for the reply, so wait for the client here. kind: 'comm', or 'comm_many' for communicateMany
+        try:
+            _send_frame(self.sock, (kind, ucc, msg))
+            tag, res, err = _recv_frame(self.sock)
+            assert tag == 'reply', f'expected a reply, got {tag!r}'
+        except (OSError, WKJS_HostError, pickle.UnpicklingError, AssertionError, ValueError) as e:
+            reply(None, f'host: failed to forward the message to the client: {e}')
+        else:
+            reply(res, err)
+
+    def check_wv(self, wv: int) -> None:
+        if wv not in self.webviews:
+            raise WKJS_HostError(f'webview {wv} does not belong to this client')
+
+    def check_ucc(self, ucc: int) -> None:
+        if ucc not in self.uccs:
+            raise WKJS_HostError(f'user content controller {ucc} does not belong to this client')
+
+
+def _host_exc(e: BaseException) -> BaseException:
+    return e if isinstance(e, WKJS_UncaughtException) else WKJS_HostError(repr(e))
+
+
+def _handle_call(send: SENDMSG_CBTYPE, conn: _HostConn, fn_id: int, args: tuple) -> Any:
+    if fn_id in (WKJS_Task.NAVIGATE_TO, WKJS_Task.EXECUTE_JS, WKJS_Task.MEMORY_FOOTPRINT):
+        conn.check_wv(args[0])
+        return send(fn_id, args)
+    elif fn_id == WKJS_Task.NEW_WEBVIEW2:
+        prepare_script, = args or (None, )
+        if prepare_script is not None and not isinstance(prepare_script, str):
+            raise WKJS_HostError(f'prepare script must be a str, got {type(prepare_script).__name__}')
+        wv, ucc = py_typecast(tuple[int, int], send(fn_id, (prepare_script, )))
+        conn.webviews[wv] = ucc
+        conn.uccs.add(ucc)
+        return wv, ucc
+    elif fn_id == WKJS_Task.FREE_WEBVIEW:
+        conn.check_wv(args[0])
+        conn.uccs.discard(conn.webviews.pop(args[0]))
+        return send(fn_id, args)
+    elif fn_id == WKJS_Task.ON_SCRIPTLOG2:
+        ucc, = args
+        conn.check_ucc(ucc)
+        send(fn_id, (ucc, partial(conn.on_log, ucc)))
+        return None
+    elif fn_id in (WKJS_Task.ON_SCRIPTCOMM2, WKJS_Task.ON_SCRIPTCOMM_MANY):
+        ucc, = args
+        conn.check_ucc(ucc)
+        # either way communicateMany takes one round trip, the client falls back to its on_script_comm callback
+        send(WKJS_Task.ON_SCRIPTCOMM2, (ucc, partial(conn.on_comm, ucc)))
+        send(WKJS_Task.ON_SCRIPTCOMM_MANY, (ucc, partial(conn.on_comm, ucc, kind='comm_many')))
+        return None
+    elif fn_id == WKJS_Task.GATHER:
+        for sub_id, sub_args in args:
+            if sub_id not in (WKJS_Task.NAVIGATE_TO, WKJS_Task.EXECUTE_JS):
+                raise WKJS_HostError(f'task {sub_id} cannot be gathered through the host')
+            conn.check_wv(sub_args[0])
+        results = py_typecast(list[CFRL_CoroResult], send(fn_id, args))
+        return [CFRL_CoroResult(r.ret, None if r.rexc is None else _host_exc(r.rexc)) for r in results]
+    raise WKJS_HostError(f'task {fn_id} is not served by the host')
+
+
+def serve(
+    path: str,
+    logger: AbstractLogger,
+    *,
+    gen_factory: Callable[..., Generator[SENDMSG_CBTYPE, None, None]] = get_gen,
+    idle_timeout: Optional[float] = None,
+    collect_stats: bool = False,
+    count_bridge: bool = False,
+) -> None:
+    """
+    Serve until interrupted, or until there has been no client for `idle_timeout` seconds.
+    Requests are handled one at a time on the calling thread, which is also the run loop thread.
+    With `collect_stats`, the latencies of the phases of the tasks are logged on exit,
+    and with `count_bridge`, the bridge crossings of the tasks.
+    """
+    factory = WKJSE_Factory(logger, gen_factory=gen_factory, collect_stats=collect_stats, count_bridge=count_bridge)
+    with factory as send, closing(
+            socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)) as listener, selectors.DefaultSelector() as sel:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        old_umask = os.umask(0o177)
+        try:
+            listener.bind(path)
+        finally:
+            os.umask(old_umask)
+        listener.listen()
+        sel.register(listener, selectors.EVENT_READ)
+        conns: dict[socket.socket, _HostConn] = {}
+        logger.info(f'Serving on {path}')
+
+        def drop(conn: _HostConn):
+            sel.unregister(conn.sock)
+            del conns[conn.sock]
+            for wv in conn.webviews:
+                try:
+                    send(WKJS_Task.FREE_WEBVIEW, (wv, ))
+                except Exception as e:
+                    logger.warning(f'failed to free webview {wv}: {e!r}')
+            conn.sock.close()
+            logger.debug(f'client disconnected, {len(conns)} left')
+
+        idle_since = time.monotonic()
+        try:
+            while True:
+                if conns:
+                    timeout = None
+                elif idle_timeout is not None:
+                    timeout = idle_since + idle_timeout - time.monotonic()
+                    if timeout <= 0:
+                        logger.info('No clients, exiting')
+                        break
+                else:
+                    timeout = None
+                for key, _ in sel.select(timeout):
+                    if key.fileobj is listener:
+                        csock, _ = listener.accept()
+                        conns[csock] = _HostConn(csock, logger)
+                        sel.register(csock, selectors.EVENT_READ)
+                        logger.debug(f'client connected, {len(conns)} in total')
+                        continue
+                    conn = conns[py_typecast(socket.socket, key.fileobj)]
+                    try:
+                        kind, fn_id, args = _recv_frame(conn.sock)
+                        assert kind == 'call', f'expected a call, got {kind!r}'
+                    except (OSError, WKJS_HostError, pickle.UnpicklingError, AssertionError, ValueError) as e:
+                        logger.trace(f'dropping client: {e!r}')
+                        drop(conn)
+                        if not conns:
+                            idle_since = time.monotonic()
+                        continue
+                    if trace_enabled(logger):
+                        logger.trace(f'client task {fn_id}')
+                    try:
+                        res = ('result', _handle_call(send, conn, fn_id, args))
+                    except Exception as e:
+                        res = ('error', _host_exc(e))
+                    try:
+                        _send_frame(conn.sock, res)
+                    except OSError:
+                        drop(conn)
+                        if not conns:
+                            idle_since = time.monotonic()
+        finally:
+            for conn in list(conns.values()):
+                drop(conn)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            if collect_stats:
+                logger.info(f'Task latencies:\n{factory.format_stats()}')
+            if count_bridge:
+                logger.info(f'Bridge crossings:\n{factory.format_bridge_counts()}')
+
+
+def connect_gen(
+    _logger: AbstractLogger, path: str, *,
+    stats: Optional[WKJS_Stats] = None, counters: Optional[BridgeCounters] = None,
+) -> Generator[SENDMSG_CBTYPE, None, None]:
+    """
+    A drop-in for `api.get_gen` that forwards the tasks to a host serving on `path`.
+    The callbacks stay in this process, comm callbacks have to reply synchronously.
+    Only the round trips are recorded in `stats`, the phases are only seen by the host (see serve(collect_stats=)),
+    and so are the bridge crossings, `counters` is left as is.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    with closing(sock):
+        logger = _logger
+        logcbs: dict[int, LOG_CBTYPE] = {}
+        commcbs: dict[int, COMM_CBTYPE] = {}
+        commmanycbs: dict[int, COMM_MANY_CBTYPE] = {}
+        wv_uccs: dict[int, int] = {}
+
+        def on_comm(ucc: int, msg: DefaultJSResult, many: bool):
+            reply: list[tuple[PyResultType, Optional[str]]] = []
+            cb = commcbs.get(ucc)
+            if many and cb is not None:
+                cb = py_typecast(COMM_CBTYPE, commmanycbs.get(ucc) or comm_many_of(cb))
+            elif many:
+                cb = py_typecast(Optional[COMM_CBTYPE], commmanycbs.get(ucc))
+            if cb:
+                cb(msg, lambda res, err: reply.append((res, err)))
+            else:
+                reply.append((None, 'No message handlers set up'))
+            if not reply:
+                reply.append((None, 'the host requires communicate() to be answered synchronously'))
+            _send_frame(sock, ('reply', *reply[0]))
+
+        def call(fn_id: int, args: tuple):
+            _send_frame(sock, ('call', fn_id, args))
+            while True:
+                msg = _recv_frame(sock)
+                if msg[0] == 'result':
+                    return msg[1]
+                elif msg[0] == 'error':
+                    raise msg[1]
+                elif msg[0] == 'log':
+                    if cb := logcbs.get(msg[1]):
+                        cb(msg[2])
+                elif msg[0] in ('comm', 'comm_many'):
+                    on_comm(msg[1], msg[2], msg[0] == 'comm_many')
+                else:
+                    raise WKJS_HostError(f'unexpected message from the host: {msg[0]!r}')
+
+        def run() -> Generator[Any, Optional[tuple[int, tuple]], None]:
+            nonlocal logger
+            last_res = 0
+            while True:
+                task = yield last_res
+                assert task
+                fn_id, args = task
+                if fn_id == WKJS_Task.SHUTDOWN:
+                    break
+                elif fn_id == WKJS_Task.SET_LOGGER:
+                    last_res, logger = logger, args[0]
+                elif fn_id in (WKJS_Task.ON_SCRIPTLOG2, WKJS_Task.ON_SCRIPTCOMM2, WKJS_Task.ON_SCRIPTCOMM_MANY):
+                    ucc, cb_new = args
+                    cbs = {
+                        WKJS_Task.ON_SCRIPTLOG2: logcbs, WKJS_Task.ON_SCRIPTCOMM2: commcbs,
+                        WKJS_Task.ON_SCRIPTCOMM_MANY: commmanycbs}[fn_id]
+                    call(fn_id, (ucc, ))
+                    last_res = cbs.get(ucc)
+                    cbs[ucc] = cb_new
+                else:
+                    timer = timer_of(stats, WKJS_Task.STAT_NAMES[fn_id]) if fn_id in WKJS_Task.STAT_NAMES else NULL_TIMER
+                    last_res = call(fn_id, args)
+                    timer.mark('roundtrip')
+                    if fn_id == WKJS_Task.NEW_WEBVIEW2:
+                        wv, ucc = last_res
+                        wv_uccs[wv] = ucc
+                    elif fn_id == WKJS_Task.FREE_WEBVIEW:
+                        # the host forgets the callbacks together with the webview
+                        ucc = wv_uccs.pop(args[0])
+                        logcbs.pop(ucc, None)
+                        commcbs.pop(ucc, None)
+                        commmanycbs.pop(ucc, None)
+            # the host frees the webviews of this connection once it's closed
+            logger.trace('disconnecting from the webkit host')
+
+        gen_run = run()
+        assert gen_run.send(None) == 0
+        yield py_typecast(SENDMSG_CBTYPE, lambda *args: gen_run.send(args))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve WebKit to yt-dlp-apple-webkit-jsi over a Unix domain socket')
+    parser.add_argument('--socket', default=default_socket_path(), help='path of the socket (default: %(default)s)')
+    parser.add_argument('--idle-timeout', type=float, default=None, help='exit after this many seconds without clients')
+    parser.add_argument('--sim', action='store_true', help='serve the pure Python stand-in instead of WebKit')
+    parser.add_argument('--sim-objc', action='store_true', help='serve WebKit simulated under the ObjC bridge')
+    parser.add_argument('--stats', action='store_true', help='log the latencies of the tasks on exit')
+    parser.add_argument('--count-bridge', action='store_true', help='log the ObjC bridge crossings of the tasks on exit')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print trace messages')
+    args = parser.parse_args(argv)
+    gen_factory = get_gen
+    if args.sim:
+        from .sim import get_sim_gen
+        gen_factory = get_sim_gen
+    elif args.sim_objc:
+        from .sim_objc import get_sim_objc_gen
+        gen_factory = get_sim_objc_gen
+    try:
+        serve(args.socket, DefaultLoggerImpl(trace=args.verbose), gen_factory=gen_factory, idle_timeout=args.idle_timeout,
+              collect_stats=args.stats, count_bridge=args.count_bridge)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -6,6 +6,11 @@ from typing import Literal, Optional, Union
 
 
 class AbstractLogger(abc.ABC):
+    @property
+    def is_trace_enabled(self) -> bool:
+        """Whether trace() outputs anything. Hot paths check this before formatting the message"""
+        return True
+
     @abc.abstractmethod
     def trace(self, message: str) -> None:
         pass
@@ -49,6 +54,10 @@ class DefaultLoggerImpl(AbstractLogger):
         if flush and DefaultLoggerImpl.ST_ISREG[fd]:
             os.fsync(fd)
 
+    @property
+    def is_trace_enabled(self) -> bool:
+        return self._trace
+
     def trace(self, message: str) -> None:
         if not self._trace:
             return
@@ -66,3 +75,12 @@ class DefaultLoggerImpl(AbstractLogger):
     def error(self, message: str, *, cause=None) -> None:
         self._out(message + f' (caused by {cause!r})' if cause is not None else message, flush=False, fd=2)
 # TODO: cause: Optional[Exception], or BaseException?
+
+
+def trace_enabled(logger: AbstractLogger) -> bool:
+    if isinstance(logger, AbstractLogger):
+        return logger.is_trace_enabled
+    # yt-dlp's IEContentProviderLogger, whose TRACE level is 0
+    log_level = getattr(logger, 'log_level', None)
+    return log_level is None or log_level <= 0
+
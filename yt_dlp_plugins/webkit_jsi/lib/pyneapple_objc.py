@@ -2,6 +2,7 @@ import os
 import struct
 import sys
 
+from collections import Counter
 from contextlib import contextmanager, ExitStack
 from ctypes import (
     CDLL,
@@ -29,7 +30,7 @@ from ctypes.util import find_library
 from functools import wraps
 from typing import Any, Callable, Generator, Iterable, Optional, Protocol, TypeVar, Union, overload, cast as py_typecast
 
-from .logging import AbstractLogger
+from .logging import AbstractLogger, trace_enabled
 
 
 T = TypeVar('T')
@@ -118,6 +119,13 @@ def get_dlsym_factory(*, logger: AbstractLogger, ldl_openmode: int = os.RTLD_NOW
     return dlsym_getctxmgr
 
 
+class ObjCBackend(Protocol):
+    """Where PyNeApple gets its symbols from and how it calls them, e.g. sim_objc.SimObjCBackend instead of dlopen"""
+    def dlsym_factory(self, *, logger: AbstractLogger) -> DLSYM_FACT: ...
+
+    def cfn_at(self, addr: int, restype: Optional[type], *argtypes: type) -> Callable: ...
+
+
 class objc_super(Structure):
     _fields_ = (
         ('receiver', c_void_p),
@@ -167,7 +175,7 @@ NULLABLE_VOIDP = Union[NotNull_VoidP, c_void_p]
 
 class PyNeApple:
     __slots__ = (
-        '_stack', 'dlsym_of_lib', '_fwks', '_init', 'logger',
+        '_stack', 'dlsym_of_lib', '_fwks', '_init', 'logger', 'trace_on', '_backend',
         '_objc', '_system',
         'p_NSConcreteMallocBlock',
         'class_addProtocol', 'class_addMethod', 'class_addIvar',
@@ -176,11 +184,13 @@ class PyNeApple:
         'objc_getProtocol',
         'objc_allocateClassPair', 'objc_registerClassPair', 'objc_disposeClassPair',
         'objc_getClass', 'objc_alloc', 'objc_alloc_init', 'objc_release',
-        'pobjc_msgSend', 'pobjc_msgSendSuper',
+        'pobjc_msgSend', 'pobjc_msgSendSuper', 'pobjc_msgSendSuper2',
+        '_sel_cache', '_msgsend_cache', '_bound_cache',
         'object_getClass', 'object_getInstanceVariable', 'object_setInstanceVariable',
         'object_getIvar', 'object_setIvar',
         'method_setImplementation',
         'sel_registerName', 'sel_getName',
+        'msg_isKindOfClass', 'msg_lengthOfBytesUsingEncoding', 'msg_UTF8String',
     )
 
     @staticmethod
@@ -189,18 +199,32 @@ class PyNeApple:
             return find_library(fwk_name)
         return f'/System/Library/Frameworks/{fwk_name}.framework/{fwk_name}'
 
-    def __init__(self, logger: AbstractLogger):
-        if os.uname()[0] != 'Darwin':
+    def __init__(self, logger: AbstractLogger, *, backend: Optional[ObjCBackend] = None):
+        # backend: None for the real libobjc
+        if backend is None and os.uname()[0] != 'Darwin':
             logger.warning('Warning: kernel is not Darwin, PyNeApple might not function correctly', once=True)
+        self._backend = backend
         self._init = False
         self.logger = logger
+        # checked by the hot paths before formatting any trace message
+        self.trace_on = trace_enabled(logger)
+        self._sel_cache: dict[bytes, c_void_p] = {}
+        self._msgsend_cache: dict[tuple[Optional[type], tuple[type, ...], bool], Callable] = {}
+        self._bound_cache: dict[tuple[bytes, Optional[type], tuple[type, ...]], Callable] = {}
 
     def cfn_at(self, addr: int, restype: Optional[type] = None, *argtypes: type) -> Callable:
+        if self._backend is not None:
+            return self._backend.cfn_at(addr, restype, *argtypes)
         return CFUNCTYPE(restype, *argtypes)(addr)
 
+    def cfunctype(self, restype: Optional[type] = None, *argtypes: type) -> Callable[[Callable], Any]:
+        """CFUNCTYPE, for the callbacks passed to C (which are counted by CountingPyNeApple)"""
+        return CFUNCTYPE(restype, *argtypes)
+
     def set_logger(self, new_logger: AbstractLogger):
         old_logger = self.logger
         self.logger = new_logger
+        self.trace_on = trace_enabled(new_logger)
         self.dlsym_of_lib.logger = new_logger
         return old_logger
 
@@ -209,7 +233,10 @@ class PyNeApple:
             raise RuntimeError('instance already initialized, please create a new instance')
         try:
             self._stack = ExitStack()
-            self.dlsym_of_lib = get_dlsym_factory(logger=self.logger)
+            if self._backend is None:
+                self.dlsym_of_lib = get_dlsym_factory(logger=self.logger)
+            else:
+                self.dlsym_of_lib = self._backend.dlsym_factory(logger=self.logger)
             self._fwks: dict[str, DLSYM_FUNC] = {}
             self._init = True
 
@@ -235,6 +262,7 @@ class PyNeApple:
             self.objc_release = self.cfn_at(self._objc(b'objc_release').value, None, c_void_p)
             self.pobjc_msgSend = self._objc(b'objc_msgSend').value
             self.pobjc_msgSendSuper = self._objc(b'objc_msgSendSuper').value
+            self.pobjc_msgSendSuper2 = self._objc(b'objc_msgSendSuper2').value
 
             self.object_getClass = self.cfn_at(self._objc(b'object_getClass').value, c_void_p, c_void_p)
             self.object_getInstanceVariable = self.cfn_at(
@@ -250,6 +278,12 @@ class PyNeApple:
 
             self.sel_registerName = self.cfn_at(self._objc(b'sel_registerName').value, c_void_p, c_char_p)
             self.sel_getName = self.cfn_at(self._objc(b'sel_getName').value, c_char_p, c_void_p)
+
+            # bound once for the hot paths, instanceof and api.str_from_nsstring
+            self.msg_isKindOfClass = self.bind_message(b'isKindOfClass:', restype=c_byte, argtypes=(c_void_p, ))
+            self.msg_lengthOfBytesUsingEncoding = self.bind_message(
+                b'lengthOfBytesUsingEncoding:', restype=c_ulong, argtypes=(c_ulong, ))
+            self.msg_UTF8String = self.bind_message(b'UTF8String', restype=c_void_p)
             return self
         except BaseException:
             if hasattr(self, '_stack'):
@@ -321,24 +355,58 @@ class PyNeApple:
     @overload
     def send_message(self, obj: NULLABLE_VOIDP, sel_name: bytes, *, restype=None, is_super: bool = False) -> None: ...
 
+    def sel_of(self, sel_name: bytes) -> c_void_p:
+        if (sel := self._sel_cache.get(sel_name)) is None:
+            sel = self._sel_cache[sel_name] = c_void_p(self.sel_registerName(sel_name))
+        return sel
+
+    def msgsend_fn(self, restype: Optional[type] = None, argtypes: tuple[type, ...] = (), is_super: bool = False) -> Callable:
+        """objc_msgSend (or objc_msgSendSuper2 if is_super) cast to the given signature, cached per signature"""
+        key = restype, argtypes, is_super
+        if (fn := self._msgsend_cache.get(key)) is None:
+            if restype and issubclass(restype, Structure):
+                raise NotImplementedError
+            if is_super:
+                fn = self.cfn_at(self.pobjc_msgSendSuper2, restype, POINTER(objc_super), c_void_p, *argtypes)
+            else:
+                fn = self.cfn_at(self.pobjc_msgSend, restype, c_void_p, c_void_p, *argtypes)
+            self._msgsend_cache[key] = fn
+        return fn
+
+    def bind_message(self, sel_name: bytes, *, restype: Optional[type] = None, argtypes: tuple[type, ...] = ()) -> Callable[..., Any]:
+        """
+        Pre-binds the selector and the signature, returns `send(obj, *args)`.
+        Store the result somewhere for frequently sent messages
+        """
+        key = sel_name, restype, argtypes
+        if (send := self._bound_cache.get(key)) is None:
+            sel = self.sel_of(sel_name)
+            fn = self.msgsend_fn(restype, argtypes)
+            sel_str = sel_name.decode()
+
+            def send(obj: NULLABLE_VOIDP, *args):
+                if self.trace_on:
+                    self.logger.trace(f'[(id){obj.value} {sel_str}]')
+                return fn(obj, sel, *args)
+            self._bound_cache[key] = send
+        return send
+
     def send_message(self, obj: NULLABLE_VOIDP, sel_name: bytes, *args, restype: Optional[type] = None, argtypes: tuple[type, ...] = (), is_super: bool = False):
-        if restype and issubclass(restype, Structure):
-            raise NotImplementedError
-        sel = c_void_p(self.sel_registerName(sel_name))
+        sel = self.sel_of(sel_name)
         if is_super:
             klass = self.object_getClass(obj)
             if not klass:
                 raise ValueError(f'unexpected nil class of object at {obj.value}')
             receiver = objc_super(receiver=obj, super_class=c_void_p(klass))
-            self.logger.trace(
-                f'[objc_super2{{.receiver={receiver.receiver=}, .class={receiver.super_class=}}} '
-                f'{sel_name.decode()}]')
-            return self.cfn_at(
-                self._objc(b'objc_msgSendSuper2').value, restype,
-                POINTER(objc_super), c_void_p, *argtypes)(byref(receiver), sel, *args)
+            if self.trace_on:
+                self.logger.trace(
+                    f'[objc_super2{{.receiver={receiver.receiver=}, .class={receiver.super_class=}}} '
+                    f'{sel_name.decode()}]')
+            return self.msgsend_fn(restype, argtypes, True)(byref(receiver), sel, *args)
             assert False, 'Guess why I\'m here'
-        self.logger.trace(f'[(id){obj.value} {sel_name.decode()}]')
-        return self.cfn_at(self.pobjc_msgSend, restype, c_void_p, c_void_p, *argtypes)(obj, sel, *args)
+        if self.trace_on:
+            self.logger.trace(f'[(id){obj.value} {sel_name.decode()}]')
+        return self.msgsend_fn(restype, argtypes)(obj, sel, *args)
 
     def safe_alloc_init(self, cls: NULLABLE_VOIDP) -> NotNull_VoidP:
         if obj := self.objc_alloc_init(cls):
@@ -356,7 +424,8 @@ class PyNeApple:
         return py_typecast(NotNull_VoidP, obj)
 
     def release_obj(self, obj: NULLABLE_VOIDP) -> None:
-        self.logger.trace(f'<ABI>[{obj.value} release]')
+        if self.trace_on:
+            self.logger.trace(f'<ABI>[{obj.value} release]')
         self.objc_release(obj)
 
     def release_on_exit(self, obj: NULLABLE_VOIDP):
@@ -419,9 +488,95 @@ class PyNeApple:
                     f'but does not conform to the protocol at {proto.value}')
 
     def instanceof(self, obj: NULLABLE_VOIDP, cls: NULLABLE_VOIDP) -> bool:
-        return bool(self.send_message(
-            obj, b'isKindOfClass:',
-            cls, restype=c_byte, argtypes=(c_void_p, )))
+        return bool(self.msg_isKindOfClass(obj, cls))
+
+
+class BridgeCounters:
+    """
+    How many times Python crossed into the ObjC runtime, per task: messages sent (per selector),
+    objects allocated and released, and C function pointers constructed.
+    `task` is set by the user of the bridge to attribute what follows to it.
+    """
+    __slots__ = 'task', '_counts'
+
+    def __init__(self):
+        self.task = 'setup'
+        self._counts: dict[str, Counter[tuple[str, str]]] = {}
+
+    def count(self, kind: str, name: str = '') -> None:
+        if (c := self._counts.get(self.task)) is None:
+            c = self._counts[self.task] = Counter()
+        c[kind, name] += 1
+
+    def summary(self) -> dict[str, dict[str, Union[int, dict[str, int]]]]:
+        """{task: {'send_message': {selector: n}, 'alloc': n, 'release': n, 'cfunctype': n}}"""
+        ret: dict[str, dict[str, Union[int, dict[str, int]]]] = {}
+        for task, c in list(self._counts.items()):
+            d: dict[str, Union[int, dict[str, int]]] = {'send_message': {}, 'alloc': 0, 'release': 0, 'cfunctype': 0}
+            for (kind, name), n in sorted(c.items()):
+                if kind == 'send_message':
+                    py_typecast(dict, d[kind])[name] = n
+                else:
+                    d[kind] = py_typecast(int, d[kind]) + n
+            ret[task] = d
+        return ret
+
+    def format(self) -> str:
+        lines = []
+        for task, d in self.summary().items():
+            sels = py_typecast(dict, d['send_message'])
+            lines.append(
+                f'{task}: {sum(sels.values())} messages, {d["alloc"]} allocations, '
+                f'{d["release"]} releases, {d["cfunctype"]} CFUNCTYPEs')
+            for sel, n in sorted(sels.items(), key=lambda kv: -kv[1]):
+                lines.append(f'  {n:>8} {sel}')
+        return '\n'.join(lines)
+
+
+class CountingPyNeApple(PyNeApple):
+    """PyNeApple counting its bridge crossings in `counters`, so that PyNeApple itself pays nothing for them"""
+    __slots__ = ('counters',)
+
+    def __init__(self, logger: AbstractLogger, counters: BridgeCounters, *, backend: Optional[ObjCBackend] = None):
+        self.counters = counters
+        super().__init__(logger, backend=backend)
+
+    def cfn_at(self, addr: int, restype: Optional[type] = None, *argtypes: type) -> Callable:
+        self.counters.count('cfunctype')
+        return super().cfn_at(addr, restype, *argtypes)
+
+    def cfunctype(self, restype: Optional[type] = None, *argtypes: type) -> Callable[[Callable], Any]:
+        proto = super().cfunctype(restype, *argtypes)
+
+        def construct(cb: Callable):
+            self.counters.count('cfunctype')
+            return proto(cb)
+        return construct
+
+    def bind_message(self, sel_name: bytes, *, restype: Optional[type] = None, argtypes: tuple[type, ...] = ()) -> Callable[..., Any]:
+        send = super().bind_message(sel_name, restype=restype, argtypes=argtypes)
+        sel_str = sel_name.decode()
+
+        def counted_send(obj: NULLABLE_VOIDP, *args):
+            self.counters.count('send_message', sel_str)
+            return send(obj, *args)
+        return counted_send
+
+    def send_message(self, obj: NULLABLE_VOIDP, sel_name: bytes, *args, restype: Optional[type] = None, argtypes: tuple[type, ...] = (), is_super: bool = False):
+        self.counters.count('send_message', sel_name.decode())
+        return super().send_message(obj, sel_name, *args, restype=restype, argtypes=argtypes, is_super=is_super)
+
+    def safe_alloc_init(self, cls: NULLABLE_VOIDP) -> NotNull_VoidP:
+        self.counters.count('alloc')
+        return super().safe_alloc_init(cls)
+
+    def safe_new_object(self, cls: NULLABLE_VOIDP, init_name: bytes, *args, argtypes: tuple[type, ...] = ()) -> NotNull_VoidP:
+        self.counters.count('alloc')
+        return super().safe_new_object(cls, init_name, *args, argtypes=argtypes)
+
+    def release_obj(self, obj: NULLABLE_VOIDP) -> None:
+        self.counters.count('release')
+        super().release_obj(obj)
 
 
 class ObjCBlockDescBase(Structure):
@@ -458,7 +613,7 @@ class ObjCBlock(Structure):
             self._desc = ObjCBlockDescWithSignature(reserved=0, size=sizeof(ObjCBlock), signature=signature)
         else:
             self._desc = ObjCBlockDescBase(reserved=0, size=sizeof(ObjCBlock))
-        self._invoke = CFUNCTYPE(restype, *argtypes)(cb)
+        self._invoke = pyneapple.cfunctype(restype, *argtypes)(cb)
         super().__init__(
             isa=pyneapple.p_NSConcreteMallocBlock,
             flags=f,
@@ -0,0 +1,343 @@
+"""
+A pure Python stand-in for `api.get_gen` that speaks the same WKJS_Task protocol,
+so the easy API and the providers can be driven without WebKit (e.g. on Linux).
+See sim_objc.py to run `api.get_gen` itself without WebKit.
+"""
+
+import datetime as dt
+import json
+import time
+
+from typing import Any, Callable, Generator, Optional, cast as py_typecast
+
+from .logging import AbstractLogger
+from .api import (
+    COMM_CBTYPE,
+    COMM_MANY_CBTYPE,
+    LOG_CBTYPE,
+    SENDMSG_CBTYPE,
+    CFRL_CoroResult,
+    CFRL_Future,
+    DefaultJSResult,
+    PyResultType,
+    WKJS_LogType,
+    WKJS_Task,
+    WKJS_Timeout,
+    WKJS_UncaughtException,
+    comm_many_of,
+)
+from .pyneapple_objc import BridgeCounters
+from .stats import NULL_TIMER, WKJS_Stats, timer_of
+
+
+# what a WebContent process takes before running anything, the scripts it ran are added to it
+SIM_BASE_FOOTPRINT = 48 << 20
+
+
+REPLY_CBTYPE = Callable[[PyResultType, Optional[str]], None]
+
+
+class SimWebviewBase:
+    """
+    What the simulated JS engine sees of the webview it runs in, the same for both backends,
+    which only differ in how the console and communicate messages reach the callbacks
+    """
+    __slots__ = 'handle', 'ucc', 'host', 'html', 'busy_until', 'n_executed', 'script_bytes', '_logbuf'
+
+    def __init__(self, handle: int, ucc: int):
+        self.handle = handle
+        self.ucc = ucc
+        self.host: Optional[str] = None
+        self.html: Optional[str] = None
+        # scripts on the same webview don't overlap, like on a real WebContent process
+        self.busy_until = 0.0
+        self.n_executed = 0
+        # like the globals and the compiled code a page keeps, and so the footprint only grows
+        self.script_bytes = 0
+        self._logbuf: list[DefaultJSResult] = []
+
+    def occupy(self, latency: float) -> float:
+        """Returns when the webview is done with a task that takes `latency` seconds, queued behind the others"""
+        self.busy_until = max(time.monotonic(), self.busy_until) + latency
+        return self.busy_until
+
+    def run(self, engine: 'SIM_ENGINE_TYPE', script: str) -> DefaultJSResult:
+        self.n_executed += 1
+        self.script_bytes += len(script)
+        try:
+            return engine(self, script)
+        finally:
+            # when the script yields or finishes, there is no telling the two apart here
+            self.flush_logs()
+
+    def footprint(self) -> int:
+        return SIM_BASE_FOOTPRINT + self.script_bytes
+
+    def log(self, ltype: WKJS_LogType, *args: DefaultJSResult) -> None:
+        record = {'logType': ltype.value, 'argsArr': list(args)}
+        if not (log_batch := self._log_batch()):
+            self._post_log(record)
+            return
+        self._logbuf.append(record)
+        if len(self._logbuf) >= log_batch:
+            self.flush_logs()
+
+    def flush_logs(self) -> None:
+        if self._logbuf:
+            records, self._logbuf = self._logbuf, []
+            self._post_log(records)
+
+    def communicate(self, x: DefaultJSResult) -> PyResultType:
+        return self._communicate(False, x)
+
+    def communicate_many(self, xs: list[DefaultJSResult]) -> list[PyResultType]:
+        return py_typecast(list[PyResultType], self._communicate(True, list(xs)))
+
+    def _communicate(self, many: bool, x: DefaultJSResult) -> PyResultType:
+        reply: list[tuple[PyResultType, Optional[str]]] = []
+        if not self._post_comm(many, x, lambda res, err: reply.append((res, err))):
+            raise WKJS_UncaughtException(err_at=0, code=4, domain='WKErrorDomain', user_info='No message handlers set up')
+        if not reply:
+            raise RuntimeError('the simulated backend requires communicate() to be answered synchronously')
+        res, err = reply[0]
+        if err is not None:
+            raise WKJS_UncaughtException(err_at=0, code=4, domain='WKErrorDomain', user_info=err)
+        return res
+
+    def _log_batch(self) -> int:
+        """Console calls posted together, see get_gen(log_batch=)"""
+        raise NotImplementedError
+
+    def _post_log(self, body: DefaultJSResult) -> None:
+        raise NotImplementedError
+
+    def _post_comm(self, many: bool, x: DefaultJSResult, reply: REPLY_CBTYPE) -> bool:
+        """Returns False if there is nothing to answer communicate(), or communicateMany() with `many`"""
+        raise NotImplementedError
+
+
+class SimWebview(SimWebviewBase):
+    """The webview of get_sim_gen, which calls the callbacks directly"""
+    __slots__ = 'log_batch', '_logcbs', '_commcbs', '_commmanycbs'
+
+    def __init__(
+        self, handle: int, ucc: int, logcbs: dict[int, LOG_CBTYPE], commcbs: dict[int, COMM_CBTYPE],
+        commmanycbs: dict[int, COMM_MANY_CBTYPE], log_batch: int = 0,
+    ):
+        super().__init__(handle, ucc)
+        self.log_batch = log_batch
+        self._logcbs = logcbs
+        self._commcbs = commcbs
+        self._commmanycbs = commmanycbs
+
+    def _log_batch(self) -> int:
+        return self.log_batch
+
+    def _post_log(self, body: DefaultJSResult) -> None:
+        if cb := self._logcbs.get(self.ucc):
+            cb(body)
+
+    def _post_comm(self, many: bool, x: DefaultJSResult, reply: REPLY_CBTYPE) -> bool:
+        cb: Optional[COMM_CBTYPE] = self._commcbs.get(self.ucc)
+        if many and (cbm := self._commmanycbs.get(self.ucc)) is not None:
+            cb = py_typecast(COMM_CBTYPE, cbm)
+        elif many and cb is not None:
+            cb = py_typecast(COMM_CBTYPE, comm_many_of(cb))
+        if cb is None:
+            return False
+        cb(x, reply)
+        return True
+
+
+SIM_ENGINE_TYPE = Callable[[SimWebviewBase, str], DefaultJSResult]
+
+
+def _default_engine(wv: SimWebview, script: str) -> DefaultJSResult:
+    return None
+
+
+def get_sim_gen(
+    _logger: AbstractLogger,
+    *,
+    engine: SIM_ENGINE_TYPE = _default_engine,
+    latency: float = 0.0,
+    stats: Optional[WKJS_Stats] = None,
+    counters: Optional[BridgeCounters] = None,
+    log_batch: int = 0,
+) -> Generator[SENDMSG_CBTYPE, None, None]:
+    """
+    `engine(webview, script)` plays the role of the JS engine, its return value is the
+    result of the script and WKJS_UncaughtException raised from it is reported like an uncaught JS exception.
+    Every script and navigation takes `latency` seconds of wall time. `log_batch` is the same as for get_gen.
+    There are no phases to speak of here, so only the totals of the synchronous tasks are recorded in `stats`,
+    and since there is no bridge to cross, nothing is counted in `counters`.
+    """
+    logger = _logger
+    webviews: dict[int, SimWebview] = {}
+    logcbs: dict[int, LOG_CBTYPE] = {}
+    commcbs: dict[int, COMM_CBTYPE] = {}
+    commmanycbs: dict[int, COMM_MANY_CBTYPE] = {}
+    next_handle = 0x1000
+    # submitted tasks: when they finish, their future, and what they resolve to
+    pending: list[tuple[float, CFRL_Future, CFRL_CoroResult]] = []
+
+    def sleep_until(deadline: float):
+        if (delay := deadline - time.monotonic()) > 0:
+            time.sleep(delay)
+
+    def new_webview(prepare_script: Optional[str] = None):
+        nonlocal next_handle
+        wv, ucc = next_handle, next_handle + 8
+        next_handle += 16
+        webviews[wv] = SimWebview(wv, ucc, logcbs, commcbs, commmanycbs, log_batch)
+        logger.trace(f'sim: new webview {wv}, ucc {ucc}')
+        if prepare_script is None:
+            return (wv, ucc), 0.0
+        (_, exc), deadline = execute_js(wv, prepare_script)
+        if exc is not None:
+            logger.trace(f'sim: prepare script failed: {exc}')
+        return (wv, ucc), deadline
+
+    def free_webview(wv: int):
+        if sim_wv := webviews.pop(wv, None):
+            logcbs.pop(sim_wv.ucc, None)
+            commcbs.pop(sim_wv.ucc, None)
+            commmanycbs.pop(sim_wv.ucc, None)
+        return None, 0.0
+
+    def expired(deadline: float, timeout: Optional[float]) -> Optional[float]:
+        # when the caller gives up, the webview stays busy until the deadline regardless
+        if timeout is not None and (expire_at := time.monotonic() + timeout) < deadline:
+            return expire_at
+        return None
+
+    def navigate_to(wv: int, host: str, html: str, timeout: Optional[float] = None):
+        sim_wv = webviews[wv]
+        sim_wv.host, sim_wv.html = host, html
+        deadline = sim_wv.occupy(latency)
+        if (expire_at := expired(deadline, timeout)) is not None:
+            return WKJS_Timeout(f'navigation to {host} did not finish within {timeout}s'), expire_at
+        return None, deadline
+
+    def execute_js(wv: int, script: str, json_result: bool = False, timeout: Optional[float] = None):
+        sim_wv = webviews[wv]
+        deadline = sim_wv.occupy(latency)
+        try:
+            res = sim_wv.run(engine, script)
+        except WKJS_UncaughtException as e:
+            res_exc = e
+        else:
+            res_exc = None
+        if (expire_at := expired(deadline, timeout)) is not None:
+            # the script ran all the same, only its result is lost
+            return (None, WKJS_Timeout(f'script did not finish within {timeout}s')), expire_at
+        if res_exc is not None:
+            return (None, res_exc), deadline
+        if json_result:
+            res = json.loads(json.dumps(
+                res, default=lambda o: o.isoformat() if isinstance(o, dt.datetime) else None))
+        return (res, None), deadline
+
+    def memory_footprint(wv: int):
+        return webviews[wv].footprint(), 0.0
+
+    def on_script_log(ucc: int, cb_new: LOG_CBTYPE):
+        ret = logcbs.get(ucc)
+        logcbs[ucc] = cb_new
+        return ret, 0.0
+
+    def on_script_comm(ucc: int, cb_new: COMM_CBTYPE):
+        ret = commcbs.get(ucc)
+        commcbs[ucc] = cb_new
+        return ret, 0.0
+
+    def on_script_comm_many(ucc: int, cb_new: COMM_MANY_CBTYPE):
+        ret = commmanycbs.get(ucc)
+        commmanycbs[ucc] = cb_new
+        return ret, 0.0
+
+    def set_logger(new_logger: AbstractLogger):
+        nonlocal logger
+        old_logger, logger = logger, new_logger
+        return old_logger, 0.0
+
+    def gather(*tasks: tuple[int, tuple]):
+        results: list[CFRL_CoroResult] = []
+        deadline = 0.0
+        for fn_id, args in tasks:
+            assert fn_id not in (WKJS_Task.SHUTDOWN, WKJS_Task.GATHER)
+            try:
+                res, task_deadline = fn_tup[fn_id](*args)
+            except BaseException as e:
+                results.append(CFRL_CoroResult(None, e))
+            else:
+                results.append(CFRL_CoroResult(res))
+                deadline = max(deadline, task_deadline)
+        return results, deadline
+
+    def settle(now: float):
+        nonlocal pending
+        due = [p for p in pending if p[0] <= now]
+        pending = [p for p in pending if p[0] > now]
+        for _, fut, cres in sorted(due, key=lambda p: p[0]):
+            if fut.done():  # cancelled
+                continue
+            if cres.rexc is not None:
+                fut.set_exception(cres.rexc)
+            else:
+                fut.set_result(cres.ret)
+
+    def submit(fn_id: int, args: tuple):
+        assert fn_id not in (WKJS_Task.SHUTDOWN, WKJS_Task.GATHER, WKJS_Task.SUBMIT, WKJS_Task.WAIT)
+        fut = CFRL_Future()
+        try:
+            res, deadline = fn_tup[fn_id](*args)
+        except BaseException as e:
+            pending.append((time.monotonic(), fut, CFRL_CoroResult(None, e)))
+        else:
+            pending.append((deadline, fut, CFRL_CoroResult(res)))
+        return fut, 0.0
+
+    def wait(*futs: CFRL_Future):
+        return None, max((p[0] for p in pending if p[1] in futs), default=0.0)
+
+    def pump(timeout: float):
+        return None, time.monotonic() + timeout
+
+    fn_tup: dict[int, Callable[..., tuple[Any, float]]] = {
+        WKJS_Task.NAVIGATE_TO: navigate_to,
+        WKJS_Task.EXECUTE_JS: execute_js,
+        WKJS_Task.NEW_WEBVIEW2: new_webview,
+        WKJS_Task.FREE_WEBVIEW: free_webview,
+        WKJS_Task.ON_SCRIPTLOG2: on_script_log,
+        WKJS_Task.ON_SCRIPTCOMM2: on_script_comm,
+        WKJS_Task.SET_LOGGER: set_logger,
+        WKJS_Task.GATHER: gather,
+        WKJS_Task.SUBMIT: submit,
+        WKJS_Task.WAIT: wait,
+        WKJS_Task.PUMP: pump,
+        WKJS_Task.MEMORY_FOOTPRINT: memory_footprint,
+        WKJS_Task.ON_SCRIPTCOMM_MANY: on_script_comm_many,
+    }
+
+    def run() -> Generator[Any, Optional[tuple[int, tuple]], None]:
+        last_res = 0
+        while True:
+            task = yield last_res
+            assert task
+            fn_id, args = task
+            if fn_id == WKJS_Task.SHUTDOWN:
+                break
+            timer = timer_of(stats, WKJS_Task.STAT_NAMES[fn_id]) if fn_id in WKJS_Task.STAT_NAMES else NULL_TIMER
+            last_res, deadline = fn_tup[fn_id](*args)
+            sleep_until(deadline)
+            timer.done()
+            settle(time.monotonic())
+        if pending:
+            sleep_until(max(p[0] for p in pending))
+            settle(time.monotonic())
+        webviews.clear()
+
+    gen_run = run()
+    assert gen_run.send(None) == 0
+    yield py_typecast(SENDMSG_CBTYPE, lambda *args: gen_run.send(args))
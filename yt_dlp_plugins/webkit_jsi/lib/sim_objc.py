@@ -0,0 +1,851 @@
+"""
+A pure Python stand-in for libobjc, CoreFoundation, Foundation and WebKit, plugged in under PyNeApple,
+so that the real `api.get_gen` (the run loop, the futures and the result converters) runs without macOS.
+
+Objects are integer handles into a registry, classes have Python implementations of the selectors
+`get_gen` sends, blocks and the methods of the classes registered from Python are called through their
+real function pointers, and the JS engine is the same stub as in sim.py.
+Unlike sim.py, which replaces `get_gen` as a whole, this exercises everything above the bridge.
+"""
+
+import datetime as dt
+import heapq
+import itertools
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+from ctypes import (
+    CFUNCTYPE,
+    POINTER,
+    _CFuncPtr,
+    _SimpleCData,
+    addressof,
+    byref,
+    c_void_p,
+    cast,
+    create_string_buffer,
+    string_at,
+)
+from typing import Any, Callable, Generator, Optional, Union, cast as py_typecast
+
+from .api import (
+    SENDMSG_CBTYPE,
+    DefaultJSResult,
+    NullTag,
+    PyResultType,
+    WKJS_UncaughtException,
+    get_gen,
+)
+from .consts import LOG_BATCH_PHOLDER, SCRIPT_PHOLDER, SCRIPT_PRELUDE, SCRIPT_TEMPL, SCRIPT_TEMPL_JSON
+from .logging import AbstractLogger
+from .pyneapple_objc import DLSYM_FACT, DLSYM_FUNC, DLError, ObjCBlock
+from .sim import REPLY_CBTYPE, SIM_ENGINE_TYPE, SimWebviewBase, _default_engine
+
+
+# seconds between 1970 and 2001, the epoch of CFAbsoluteTime
+_CF_EPOCH = 978307200.0
+_TEMPLS = SCRIPT_TEMPL.split(SCRIPT_PHOLDER), SCRIPT_TEMPL_JSON.split(SCRIPT_PHOLDER)
+_PRELUDE_HEAD, _PRELUDE_TAIL = SCRIPT_PRELUDE.split(LOG_BATCH_PHOLDER)
+
+kCFRunLoopRunFinished = 1
+kCFRunLoopRunStopped = 2
+kCFRunLoopRunTimedOut = 3
+kCFRunLoopRunHandledSource = 4
+
+
+def _untemplate(script: str) -> tuple[str, bool]:
+    # the script passed to execute_js, and whether the result is serialized with JSON.stringify
+    for json_result, (head, tail) in enumerate(_TEMPLS):
+        if script.startswith(head) and script.endswith(tail):
+            return script[len(head):-len(tail)], bool(json_result)
+    return script, False
+
+
+def _prelude_log_batch(source: str) -> Optional[int]:
+    # the log batch size SCRIPT_PRELUDE was given, None if it is not the prelude
+    if source.startswith(_PRELUDE_HEAD) and source.endswith(_PRELUDE_TAIL):
+        return int(source[len(_PRELUDE_HEAD):-len(_PRELUDE_TAIL)])
+    return None
+
+
+def _arg(a: Any) -> Any:
+    # what the C side would see of a ctypes argument, byref() and structures are passed as is
+    if isinstance(a, _SimpleCData):
+        return a.value
+    return a
+
+
+def _block_of(p: Any) -> ObjCBlock:
+    # a block passed as byref(block) or as its address
+    if hasattr(p, '_obj'):
+        return p._obj
+    return cast(p, POINTER(ObjCBlock)).contents
+
+
+def _invoke_block(block: ObjCBlock, *args: Optional[int]) -> None:
+    # through the real function pointer, like the ObjC runtime would
+    CFUNCTYPE(None, POINTER(ObjCBlock), *(c_void_p for _ in args))(block.invoke)(byref(block), *args)
+
+
+class SimClass:
+    __slots__ = 'cmethods', 'handle', 'methods', 'name', 'superclass'
+
+    def __init__(self, handle: int, name: bytes, superclass: Optional['SimClass']):
+        self.handle = handle
+        self.name = name
+        self.superclass = superclass
+        # selector name -> Python implementation (backend, obj, *args), or the IMP of a class registered from Python
+        self.methods: dict[bytes, Callable] = {}
+        self.cmethods: dict[bytes, Callable] = {}
+
+    def lookup(self, sel: bytes, *, meta: bool = False) -> Optional[Callable]:
+        cls: Optional[SimClass] = self
+        while cls is not None:
+            if (imp := (cls.cmethods if meta else cls.methods).get(sel)) is not None:
+                return imp
+            cls = cls.superclass
+        return None
+
+    def is_subclass_of(self, other: 'SimClass') -> bool:
+        cls: Optional[SimClass] = self
+        while cls is not None:
+            if cls is other:
+                return True
+            cls = cls.superclass
+        return False
+
+
+class SimObject:
+    __slots__ = 'attrs', 'cls', 'handle', 'owned', 'refs', 'value'
+
+    def __init__(self, handle: int, cls: SimClass, value: Any = None):
+        self.handle = handle
+        self.cls = cls
+        self.refs = 1
+        # e.g. the str of an NSString, the handles of an NSArray
+        self.value = value
+        self.attrs: dict[str, Any] = {}
+        # released together with this object
+        self.owned: list[int] = []
+
+
+class SimRunLoop:
+    """A CFRunLoop: blocks to perform in order, and timers"""
+    __slots__ = '_blocks', '_cv', '_seq', '_stop', '_timers', 'handle'
+
+    def __init__(self, handle: int):
+        self.handle = handle
+        self._cv = threading.Condition()
+        self._blocks: list[Callable[[], None]] = []
+        self._timers: list[tuple[float, int, Callable[[], None]]] = []
+        self._seq = itertools.count()
+        self._stop = False
+
+    def perform(self, fn: Callable[[], None]) -> None:
+        with self._cv:
+            self._blocks.append(fn)
+            self._cv.notify()
+
+    def after(self, deadline: float, fn: Callable[[], None]) -> None:
+        with self._cv:
+            heapq.heappush(self._timers, (deadline, next(self._seq), fn))
+            self._cv.notify()
+
+    def stop(self) -> None:
+        with self._cv:
+            self._stop = True
+            self._cv.notify()
+
+    def wake_up(self) -> None:
+        with self._cv:
+            self._cv.notify()
+
+    def _next(self, deadline: Optional[float]) -> Union[int, Callable[[], None]]:
+        with self._cv:
+            while True:
+                if self._stop:
+                    self._stop = False
+                    return kCFRunLoopRunStopped
+                now = time.monotonic()
+                if self._timers and self._timers[0][0] <= now:
+                    return heapq.heappop(self._timers)[2]
+                if self._blocks:
+                    return self._blocks.pop(0)
+                if deadline is not None and now >= deadline:
+                    return kCFRunLoopRunTimedOut
+                wake_at = min(filter(None, (deadline, self._timers[0][0] if self._timers else None)), default=None)
+                self._cv.wait(None if wake_at is None else wake_at - now)
+
+    def run(self, backend: 'SimObjCBackend', seconds: Optional[float] = None, return_after_source: bool = False) -> int:
+        deadline = None if seconds is None else time.monotonic() + seconds
+        while True:
+            fn = self._next(deadline)
+            if isinstance(fn, int):
+                return fn
+            try:
+                fn()
+            finally:
+                backend.drain_autoreleased()
+            if return_after_source:
+                return kCFRunLoopRunHandledSource
+
+
+class SimObjCWebview(SimWebviewBase):
+    """The webview of SimObjCBackend, which posts the messages to the handlers registered on its user content controller"""
+    __slots__ = '_backend', 'prelude'
+
+    def __init__(self, backend: 'SimObjCBackend', handle: int, ucc: int):
+        super().__init__(handle, ucc)
+        self._backend = backend
+        # the log batch size of the SCRIPT_PRELUDE that ran in the current document, without it the scripts throw
+        self.prelude: Optional[int] = None
+
+    def _user_scripts(self) -> list[str]:
+        ucc = self._backend.objects.get(self.ucc)
+        return [] if ucc is None else ucc.attrs['user_scripts']
+
+    def _handler(self, name: str) -> Optional[tuple[int, bool]]:
+        ucc = self._backend.objects.get(self.ucc)
+        return None if ucc is None else ucc.attrs['handlers'].get(name)
+
+    def _log_batch(self) -> int:
+        return self.prelude or 0
+
+    def _post_log(self, body: DefaultJSResult) -> None:
+        b = self._backend
+        if (handler := self._handler('wkjs_log')) is None:
+            return
+        msg = b.new_object(b'WKScriptMessage', autorelease=True)
+        msg.attrs['body'] = b.ns_from_py(body)
+        b.call_imp(handler[0], b'userContentController:didReceiveScriptMessage:', self.ucc, msg.handle)
+
+    def _post_comm(self, many: bool, x: DefaultJSResult, reply: REPLY_CBTYPE) -> bool:
+        b = self._backend
+        handler = self._handler('wkjs_commany' if many else 'wkjs_com')
+        if handler is None or not handler[1]:
+            return False
+        msg = b.new_object(b'WKScriptMessage', autorelease=True)
+        msg.attrs['body'] = b.ns_from_py(x)
+
+        def reply_handler(blk, p_res: Optional[int], p_err: Optional[int]):
+            # the objects are released by the caller once this returns
+            if p_err:
+                reply(None, b.objects[p_err].value)
+            else:
+                reply(b.py_from_ns(p_res or 0), None)
+        block = ObjCBlock(b, reply_handler, None, POINTER(ObjCBlock), c_void_p, c_void_p)
+        b.call_imp(handler[0], b'userContentController:didReceiveScriptMessage:replyHandler:', self.ucc, msg.handle, addressof(block))
+        return True
+
+
+class SimObjCBackend:
+    """
+    An ObjCBackend for PyNeApple. `engine` and `latency` are the same as for sim.get_sim_gen.
+    live_objects() is the number of objects that haven't been released and buffers that haven't been freed, to catch leaks.
+    """
+    __slots__ = (
+        '_autoreleased', '_cells', '_classes_by_name', '_functions', '_heap', '_lock', '_loops', '_next_handle',
+        '_sel_names', '_singletons', '_symbols', 'classes', 'engine', 'latency', 'objects', 'p_NSConcreteMallocBlock',
+        'selectors',
+    )
+
+    def __init__(self, *, engine: SIM_ENGINE_TYPE = _default_engine, latency: float = 0.0):
+        self._lock = threading.RLock()
+        self._next_handle = 0x10000
+        self.objects: dict[int, SimObject] = {}
+        self.classes: dict[int, SimClass] = {}
+        self._classes_by_name: dict[bytes, SimClass] = {}
+        self.selectors: dict[bytes, int] = {}
+        self._sel_names: dict[int, bytes] = {}
+        self._loops: dict[int, SimRunLoop] = {}
+        self._autoreleased: list[int] = []
+        self._singletons: dict[bytes, int] = {}
+        # malloc'ed buffers by address
+        self._heap: dict[int, Any] = {}
+        self.engine = engine
+        self.latency = latency
+        # the data symbols are read from memory (e.g. c_void_p.from_address), so they live in real cells
+        self._cells: dict[bytes, c_void_p] = {}
+        self._symbols: dict[bytes, Callable] = {}
+        self._setup_symbols()
+        # the "addresses" of the functions
+        self._functions = {id(fn): fn for fn in self._symbols.values()}
+        self._setup_classes()
+        self.p_NSConcreteMallocBlock = self._data_symbol(b'_NSConcreteMallocBlock', self._alloc_handle()).value
+
+    # ObjCBackend
+
+    def dlsym_factory(self, *, logger: AbstractLogger) -> DLSYM_FACT:
+        backend = self
+
+        @contextmanager
+        def dlsym_factory(path: bytes, mode: int = 0) -> Generator[DLSYM_FUNC, None, None]:
+            dlsym_factory.logger.trace(f'sim: dlopen {path.decode()}')
+
+            def dlsym(name: bytes) -> c_void_p:
+                if name in backend._cells:
+                    return c_void_p(addressof(backend._cells[name]))
+                if name in backend._symbols:
+                    return c_void_p(id(backend._symbols[name]))
+                raise DLError(b'dlsym', name.decode(), b'symbol not simulated')
+            yield py_typecast(DLSYM_FUNC, dlsym)
+        factory = py_typecast(DLSYM_FACT, dlsym_factory)
+        factory.logger = logger
+        return factory
+
+    def cfn_at(self, addr: int, restype: Optional[type], *argtypes: type) -> Callable:
+        fn = self._functions.get(addr)
+        if fn is None:
+            raise DLError(b'call', hex(addr), b'not a simulated function')
+        if restype is c_void_p:
+            return lambda *args: fn(*map(_arg, args)) or None
+        return lambda *args: fn(*map(_arg, args))
+
+    @staticmethod
+    def cfunctype(restype: Optional[type] = None, *argtypes: type) -> Callable[[Callable], Any]:
+        # so that the backend can make its own blocks (see SimObjCWebview.communicate)
+        return CFUNCTYPE(restype, *argtypes)
+
+    # object model
+
+    def _alloc_handle(self) -> int:
+        with self._lock:
+            h = self._next_handle
+            self._next_handle += 16
+            return h
+
+    def _data_symbol(self, name: bytes, value: int) -> c_void_p:
+        cell = self._cells[name] = c_void_p(value)
+        return c_void_p(addressof(cell))
+
+    def new_class(self, name: bytes, superclass: Optional[SimClass]) -> SimClass:
+        cls = SimClass(self._alloc_handle(), name, superclass)
+        with self._lock:
+            self.classes[cls.handle] = cls
+            self._classes_by_name[name] = cls
+        return cls
+
+    def new_object(self, cls: Union[bytes, SimClass], value: Any = None, *, autorelease: bool = False) -> SimObject:
+        if isinstance(cls, bytes):
+            cls = self._classes_by_name[cls]
+        obj = SimObject(self._alloc_handle(), cls, value)
+        with self._lock:
+            self.objects[obj.handle] = obj
+            if autorelease:
+                self._autoreleased.append(obj.handle)
+        return obj
+
+    def singleton(self, cls: bytes) -> int:
+        with self._lock:
+            if (h := self._singletons.get(cls)) is None:
+                obj = self.new_object(cls)
+                obj.refs = -1  # never freed
+                h = self._singletons[cls] = obj.handle
+            return h
+
+    def retain(self, h: Optional[int]) -> None:
+        if h and (obj := self.objects.get(h)) is not None and obj.refs > 0:
+            obj.refs += 1
+
+    def release(self, h: Optional[int]) -> None:
+        if not h:
+            return
+        with self._lock:
+            obj = self.objects.get(h)
+            if obj is None:
+                if h in self.classes:
+                    return
+                raise RuntimeError(f'sim: released a freed object {h:#x}')
+            if obj.refs < 0:
+                return
+            obj.refs -= 1
+            if obj.refs:
+                return
+            del self.objects[h]
+        if (dealloc := obj.cls.lookup(b'dealloc')) is not None:
+            dealloc(self, obj)
+        for owned in obj.owned:
+            self.release(owned)
+
+    def drain_autoreleased(self) -> None:
+        with self._lock:
+            pool, self._autoreleased = self._autoreleased, []
+        for h in pool:
+            self.release(h)
+
+    def live_objects(self) -> int:
+        with self._lock:
+            return sum(1 for obj in self.objects.values() if obj.refs > 0) + len(self._heap)
+
+    def call_imp(self, h_obj: int, sel: bytes, *args: Any) -> Any:
+        return self._msgsend(h_obj, self.sel(sel), *args)
+
+    def sel(self, name: bytes) -> int:
+        with self._lock:
+            if (h := self.selectors.get(name)) is None:
+                h = self.selectors[name] = self._alloc_handle()
+                self._sel_names[h] = name
+            return h
+
+    def ns_from_py(self, v: PyResultType, *, top: bool = True) -> int:
+        """An autoreleased object graph like the one WebKit hands to the completion handler"""
+        if v is None:
+            return 0 if top else self.singleton(b'NSNull')
+        elif v is NullTag:
+            return self.singleton(b'NSNull')
+        elif isinstance(v, str):
+            return self.new_object(b'NSString', v, autorelease=True).handle
+        elif isinstance(v, bool):
+            return self.new_object(b'NSNumber', (b'c', int(v)), autorelease=True).handle
+        elif isinstance(v, int):
+            return self.new_object(b'NSNumber', (b'q', v), autorelease=True).handle
+        elif isinstance(v, float):
+            return self.new_object(b'NSNumber', (b'd', v), autorelease=True).handle
+        elif isinstance(v, dt.datetime):
+            return self.new_object(b'NSDate', v.timestamp() - _CF_EPOCH, autorelease=True).handle
+        elif isinstance(v, (list, tuple)):
+            return self.new_object(b'NSArray', [self.ns_from_py(x, top=False) for x in v], autorelease=True).handle
+        elif isinstance(v, dict):
+            return self.new_object(b'NSDictionary', [
+                (self.ns_from_py(k, top=False), self.ns_from_py(x, top=False)) for k, x in v.items()], autorelease=True).handle
+        raise TypeError(f'sim: cannot convert {type(v)} to a JS value')
+
+    def py_from_ns(self, h: int) -> PyResultType:
+        """What the JS side receives, e.g. as the reply of communicate()"""
+        if not h:
+            return None
+        obj = self.objects[h]
+        name = obj.cls.name
+        if name == b'NSNull':
+            return None
+        elif name == b'NSString':
+            return obj.value
+        elif name == b'NSNumber':
+            return bool(obj.value[1]) if obj.value[0] == b'c' else obj.value[1]
+        elif name == b'NSData':
+            return obj.value  # a Uint8Array
+        elif name == b'NSDate':
+            return dt.datetime.fromtimestamp(obj.value + _CF_EPOCH, dt.timezone.utc)
+        elif name == b'NSArray':
+            return [self.py_from_ns(x) for x in obj.value]
+        elif name == b'NSDictionary':
+            return {self.py_from_ns(k): self.py_from_ns(x) for k, x in obj.value}
+        raise TypeError(f'sim: cannot convert {name.decode()} to a JS value')
+
+    def _loop_of(self, ident: int) -> SimRunLoop:
+        with self._lock:
+            if (loop := self._loops.get(ident)) is None:
+                loop = self._loops[ident] = SimRunLoop(self._alloc_handle())
+            return loop
+
+    def _loop(self, h: int) -> SimRunLoop:
+        for loop in self._loops.values():
+            if loop.handle == h:
+                return loop
+        raise RuntimeError(f'sim: no run loop at {h:#x}')
+
+    def main_loop(self) -> SimRunLoop:
+        return self._loop_of(threading.main_thread().ident or 0)
+
+    # libobjc and CoreFoundation
+
+    def _msgsend(self, h_obj: Optional[int], sel: int, *args: Any) -> Any:
+        if not h_obj:
+            return 0  # messages to nil
+        sel_name = self._sel_names[sel]
+        if (cls := self.classes.get(h_obj)) is not None:
+            imp = cls.lookup(sel_name, meta=True)
+            if imp is None:
+                raise RuntimeError(f'sim: +[{cls.name.decode()} {sel_name.decode()}] is not simulated')
+            return imp(self, cls, *args)
+        obj = self.objects.get(h_obj)
+        if obj is None:
+            raise RuntimeError(f'sim: message {sel_name.decode()} sent to a freed object {h_obj:#x}')
+        imp = obj.cls.lookup(sel_name)
+        if imp is None:
+            raise RuntimeError(f'sim: -[{obj.cls.name.decode()} {sel_name.decode()}] is not simulated')
+        if isinstance(imp, _CFuncPtr):
+            # a method implemented in Python with a real function pointer (see PyNeApple.safe_add_meths)
+            return imp(h_obj, sel, *args)
+        return imp(self, obj, *args)
+
+    def _setup_symbols(self) -> None:
+        def unsupported(name: str):
+            def fn(*args):
+                raise NotImplementedError(f'sim: {name} is not simulated')
+            return fn
+
+        def objc_allocateClassPair(h_super: int, name: bytes, extra: int) -> int:
+            if name in self._classes_by_name:
+                return 0
+            return self.new_class(name, self.classes[h_super]).handle
+
+        def class_addMethod(h_cls: int, sel: int, imp: Any, sig: bytes) -> int:
+            methods = self.classes[h_cls].methods
+            name = self._sel_names[sel]
+            if name in methods:
+                return 0
+            methods[name] = imp
+            return 1
+
+        def class_getInstanceMethod(h_cls: int, sel: int) -> int:
+            # methods are (class, selector), encoded in the selector handle space
+            name = self._sel_names[sel]
+            if self.classes[h_cls].lookup(name) is None:
+                return 0
+            return self.sel(b'%d/' % h_cls + name)
+
+        def method_setImplementation(h_meth: int, imp: Any) -> int:
+            h_cls, _, name = self._sel_names[h_meth].partition(b'/')
+            methods = self.classes[int(h_cls)].methods
+            methods[name] = imp
+            return 1
+
+        def objc_alloc(h_cls: int) -> int:
+            return self.new_object(self.classes[h_cls]).handle
+
+        def objc_alloc_init(h_cls: int) -> int:
+            return self._msgsend(objc_alloc(h_cls), self.sel(b'init'))
+
+        def object_getClass(h_obj: int) -> int:
+            if (cls := self.classes.get(h_obj)) is not None:
+                return cls.handle  # no metaclasses
+            return self.objects[h_obj].cls.handle
+
+        def CFRunLoopRunInMode(mode: int, seconds: float, return_after_source: bool) -> int:
+            return self._loop_of(threading.get_ident()).run(self, seconds, return_after_source)
+
+        def CFRunLoopPerformBlock(h_loop: int, mode: int, p_block: Any) -> None:
+            block = _block_of(p_block)
+            self._loop(h_loop).perform(lambda: _invoke_block(block))
+
+        def CFRunLoopTimerCreateWithHandler(
+            allocator: Optional[int], fire_date: float, interval: float, flags: int, order: int, p_block: Any,
+        ) -> int:
+            # one-shot only; the value is the block, until the timer fires or is invalidated
+            timer = self.new_object(b'CFRunLoopTimer', _block_of(p_block))
+            timer.attrs['fire_date'] = fire_date
+            return timer.handle
+
+        def CFRunLoopAddTimer(h_loop: int, h_timer: int, mode: int) -> None:
+            timer = self.objects[h_timer]
+
+            def fire():
+                if (block := timer.value) is not None:
+                    timer.value = None
+                    _invoke_block(block, h_timer)
+            delay = timer.attrs['fire_date'] - (time.time() - _CF_EPOCH)
+            self._loop(h_loop).after(time.monotonic() + delay, fire)
+
+        def CFRunLoopTimerInvalidate(h_timer: int) -> None:
+            self.objects[h_timer].value = None
+
+        def CFNumberGetValue(h_num: int, typ: int, p_out: Any) -> bool:
+            p_out._obj.value = self.objects[h_num].value[1]
+            return True
+
+        def CFDictionaryApplyFunction(h_dict: int, fn: Callable, ctx: Optional[int]) -> None:
+            for k, v in list(self.objects[h_dict].value):
+                fn(k, v, ctx)
+
+        def malloc(size: int) -> int:
+            buf = create_string_buffer(size)
+            with self._lock:
+                self._heap[addressof(buf)] = buf
+            return addressof(buf)
+
+        def free(p: Optional[int]) -> None:
+            if not p:
+                return
+            with self._lock:
+                if self._heap.pop(p, None) is None:
+                    raise RuntimeError(f'sim: freed {p:#x}, which was not allocated or already freed')
+
+        def proc_pid_rusage(pid: int, flavor: int, p_info: Any) -> int:
+            # every webview is its own WebContent process, whose pid is the handle of the webview
+            obj = self.objects.get(pid)
+            if obj is None or not isinstance(obj.value, SimObjCWebview):
+                return -1
+            p_info._obj[9] = obj.value.footprint()  # ri_phys_footprint
+            return 0
+
+        self._symbols = {
+            b'objc_msgSend': self._msgsend,
+            b'objc_msgSendSuper': unsupported('objc_msgSendSuper'),
+            b'objc_msgSendSuper2': unsupported('objc_msgSendSuper2'),
+            b'objc_getClass': lambda name: (c.handle if (c := self._classes_by_name.get(name)) else 0),
+            b'objc_alloc': objc_alloc,
+            b'objc_alloc_init': objc_alloc_init,
+            b'objc_release': self.release,
+            b'objc_allocateClassPair': objc_allocateClassPair,
+            b'objc_registerClassPair': lambda h_cls: None,
+            b'objc_disposeClassPair': lambda h_cls: self._classes_by_name.pop(self.classes.pop(h_cls).name),
+            b'objc_getProtocol': unsupported('objc_getProtocol'),
+            b'class_addProtocol': unsupported('class_addProtocol'),
+            b'class_conformsToProtocol': unsupported('class_conformsToProtocol'),
+            b'class_addMethod': class_addMethod,
+            b'class_addIvar': unsupported('class_addIvar'),
+            b'class_getInstanceMethod': class_getInstanceMethod,
+            b'class_getInstanceVariable': unsupported('class_getInstanceVariable'),
+            b'class_getName': lambda h_cls: self.classes[h_cls].name,
+            b'method_setImplementation': method_setImplementation,
+            b'object_getClass': object_getClass,
+            b'object_getInstanceVariable': unsupported('object_getInstanceVariable'),
+            b'object_setInstanceVariable': unsupported('object_setInstanceVariable'),
+            b'object_getIvar': unsupported('object_getIvar'),
+            b'object_setIvar': unsupported('object_setIvar'),
+            b'sel_registerName': self.sel,
+            b'sel_getName': self._sel_names.get,
+            b'CFRunLoopGetMain': lambda: self.main_loop().handle,
+            b'CFRunLoopGetCurrent': lambda: self._loop_of(threading.get_ident()).handle,
+            b'CFRunLoopRun': lambda: self._loop_of(threading.get_ident()).run(self) and None,
+            b'CFRunLoopRunInMode': CFRunLoopRunInMode,
+            b'CFRunLoopStop': lambda h_loop: self._loop(h_loop).stop(),
+            b'CFRunLoopWakeUp': lambda h_loop: self._loop(h_loop).wake_up(),
+            b'CFRunLoopPerformBlock': CFRunLoopPerformBlock,
+            b'CFDateGetAbsoluteTime': lambda h_date: self.objects[h_date].value,
+            b'CFAbsoluteTimeGetCurrent': lambda: time.time() - _CF_EPOCH,
+            b'CFRunLoopTimerCreateWithHandler': CFRunLoopTimerCreateWithHandler,
+            b'CFRunLoopAddTimer': CFRunLoopAddTimer,
+            b'CFRunLoopTimerInvalidate': CFRunLoopTimerInvalidate,
+            b'CFRelease': self.release,
+            b'CFNumberGetValue': CFNumberGetValue,
+            b'CFDictionaryApplyFunction': CFDictionaryApplyFunction,
+            b'CFArrayGetCount': lambda h_arr: len(self.objects[h_arr].value),
+            b'CFArrayGetValueAtIndex': lambda h_arr, i: self.objects[h_arr].value[i],
+            b'proc_pid_rusage': proc_pid_rusage,
+            b'malloc': malloc,
+            b'free': free,
+        }
+        self._data_symbol(b'kCFRunLoopDefaultMode', self._alloc_handle())
+
+    def _setup_classes(self) -> None:
+        NSObject = self.new_class(b'NSObject', None)
+        for name in (
+            b'NSString', b'NSNumber', b'NSNull', b'NSDate', b'NSDictionary', b'NSArray', b'NSData', b'NSURL', b'NSError',
+            b'WKWebView', b'WKWebViewConfiguration', b'WKPreferences', b'WKUserContentController',
+            b'WKContentWorld', b'WKScriptMessage', b'WKNavigation', b'WKUserScript', b'CFRunLoopTimer',
+        ):
+            self.new_class(name, NSObject)
+        for value in (True, False):
+            boolean = self.new_object(b'NSNumber', (b'c', int(value)))
+            boolean.refs = -1
+            self._data_symbol(b'kCFBooleanTrue' if value else b'kCFBooleanFalse', boolean.handle)
+        c = self._classes_by_name
+
+        def str_obj(h: int) -> str:
+            return self.objects[h].value
+
+        def new_str(s: str) -> int:
+            return self.new_object(b'NSString', s, autorelease=True).handle
+
+        def init_with(value_of: Callable[..., Any]) -> Callable:
+            def init(b, obj: SimObject, *args):
+                obj.value = value_of(*args)
+                return obj.handle
+            return init
+
+        NSObject.methods.update({
+            b'init': lambda b, obj: obj.handle,
+            b'isKindOfClass:': lambda b, obj, h_cls: obj.cls.is_subclass_of(self.classes[h_cls]),
+            b'description': lambda b, obj: new_str(obj.attrs.get('description', f'<{obj.cls.name.decode()}: {obj.handle:#x}>')),
+            b'setValue:forKey:': lambda b, obj, h_val, h_key: obj.attrs.__setitem__(str_obj(h_key), h_val),
+        })
+        NSObject.cmethods.update({
+            b'instancesRespondToSelector:': lambda b, cls, sel: cls.lookup(self._sel_names[sel]) is not None,
+        })
+
+        def utf8(b, obj: SimObject) -> int:
+            # the buffer lives as long as the string, like an interior pointer
+            if (buf := obj.attrs.get('utf8')) is None:
+                buf = obj.attrs['utf8'] = create_string_buffer(obj.value.encode())
+            return addressof(buf)
+
+        def init_nocopy(b, obj: SimObject, p: int, n: int, enc: int, free_when_done: int) -> int:
+            try:
+                obj.value = string_at(p, n).decode()
+            except UnicodeDecodeError:
+                # the bytes stay with the caller
+                self.release(obj.handle)
+                return 0
+            if free_when_done:
+                obj.attrs['nocopy'] = p
+            return obj.handle
+
+        def dealloc_str(b, obj: SimObject) -> None:
+            if (p := obj.attrs.get('nocopy')) is not None:
+                self._symbols[b'free'](p)
+        c[b'NSString'].methods.update({
+            b'initWithBytes:length:encoding:': init_with(lambda data, n, enc: data[:n].decode()),
+            b'initWithBytesNoCopy:length:encoding:freeWhenDone:': init_nocopy,
+            b'dealloc': dealloc_str,
+            b'initWithUTF8String:': init_with(lambda data: data.decode()),
+            b'lengthOfBytesUsingEncoding:': lambda b, obj, enc: len(obj.value.encode()),
+            b'canBeConvertedToEncoding:': lambda b, obj, enc: True,
+            b'UTF8String': utf8,
+            b'description': lambda b, obj: obj.handle,
+        })
+        c[b'NSNumber'].methods.update({
+            b'initWithUnsignedLongLong:': init_with(lambda v: (b'Q', v)),
+            b'initWithLongLong:': init_with(lambda v: (b'q', v)),
+            b'initWithDouble:': init_with(lambda v: (b'd', v)),
+            b'objCType': lambda b, obj: obj.value[0],
+            b'stringValue': lambda b, obj: new_str(str(obj.value[1])),
+        })
+        c[b'NSNull'].cmethods[b'null'] = lambda b, cls: self.singleton(b'NSNull')
+        c[b'NSDate'].methods[b'initWithTimeIntervalSince1970:'] = init_with(lambda t: t - _CF_EPOCH)
+        c[b'NSDictionary'].methods[b'init'] = init_with(list)
+        c[b'NSArray'].methods[b'init'] = init_with(list)
+
+        def owning(obj: SimObject, *handles: int) -> None:
+            for h in handles:
+                self.retain(h)
+                obj.owned.append(h)
+
+        def init_arr(b, obj: SimObject, p_items: Any, n: int) -> int:
+            obj.value = [p_items[i] or 0 for i in range(n)]
+            owning(obj, *obj.value)
+            return obj.handle
+
+        def init_dict(b, obj: SimObject, p_vals: Any, p_keys: Any, n: int) -> int:
+            obj.value = [(p_keys[i] or 0, p_vals[i] or 0) for i in range(n)]
+            owning(obj, *(h for kv in obj.value for h in kv))
+            return obj.handle
+        c[b'NSArray'].methods[b'initWithObjects:count:'] = init_arr
+        c[b'NSDictionary'].methods[b'initWithObjects:forKeys:count:'] = init_dict
+        c[b'NSData'].methods[b'initWithBytes:length:'] = init_with(lambda data, n: bytes(data[:n]))
+        c[b'NSURL'].methods[b'initWithString:'] = init_with(str_obj)
+        c[b'NSError'].methods.update({
+            b'code': lambda b, obj: obj.value[0],
+            b'domain': lambda b, obj: new_str(obj.value[1]),
+            b'userInfo': lambda b, obj: obj.attrs['userInfo'],
+        })
+        c[b'WKContentWorld'].cmethods[b'pageWorld'] = lambda b, cls: self.singleton(b'WKContentWorld')
+        c[b'WKScriptMessage'].methods[b'body'] = lambda b, obj: obj.attrs['body']
+        c[b'WKPreferences'].methods[b'setJavaScriptCanOpenWindowsAutomatically:'] = lambda b, obj, v: None
+
+        def cfg_init(b, obj: SimObject) -> int:
+            obj.attrs['preferences'] = pref = self.new_object(b'WKPreferences').handle
+            obj.owned.append(pref)
+            return obj.handle
+
+        def set_ucc(b, obj: SimObject, h_ucc: int) -> None:
+            self.retain(h_ucc)
+            obj.owned.append(h_ucc)
+            obj.attrs['ucc'] = h_ucc
+        c[b'WKWebViewConfiguration'].methods.update({
+            b'init': cfg_init,
+            b'preferences': lambda b, obj: obj.attrs['preferences'],
+            b'setUserContentController:': set_ucc,
+        })
+
+        def ucc_init(b, obj: SimObject) -> int:
+            obj.attrs['handlers'] = {}
+            obj.attrs['user_scripts'] = []
+            return obj.handle
+
+        def add_user_script(b, obj: SimObject, h_script: int) -> None:
+            self.retain(h_script)
+            obj.owned.append(h_script)
+            obj.attrs['user_scripts'].append(self.objects[h_script].value)
+
+        def add_handler(obj: SimObject, h_handler: int, h_name: int, with_reply: bool) -> None:
+            name = str_obj(h_name)
+            if name in obj.attrs['handlers']:
+                raise RuntimeError(f'sim: a script message handler named {name} already exists')
+            self.retain(h_handler)
+            obj.owned.append(h_handler)
+            obj.attrs['handlers'][name] = h_handler, with_reply
+        c[b'WKUserContentController'].methods.update({
+            b'init': ucc_init,
+            b'addScriptMessageHandler:name:': lambda b, obj, h, h_name: add_handler(obj, h, h_name, False),
+            b'addScriptMessageHandlerWithReply:contentWorld:name:': lambda b, obj, h, h_world, h_name: add_handler(obj, h, h_name, True),
+            b'addUserScript:': add_user_script,
+        })
+        # injected at the start of every document, which is all the simulated engine needs to know
+        c[b'WKUserScript'].methods[b'initWithSource:injectionTime:forMainFrameOnly:'] = init_with(
+            lambda h_source, injection_time, main_frame_only: str_obj(h_source))
+        self._setup_webview(c[b'WKWebView'])
+
+    def _setup_webview(self, wkwebview: SimClass) -> None:
+        def init(b, obj: SimObject, rect: Any, h_cfg: int) -> int:
+            self.retain(h_cfg)
+            obj.owned.append(h_cfg)
+            obj.value = SimObjCWebview(self, obj.handle, self.objects[h_cfg].attrs['ucc'])
+            return obj.handle
+
+        def load_html(b, obj: SimObject, h_html: int, h_url: int) -> int:
+            wv: SimObjCWebview = obj.value
+            wv.html, wv.host = self.objects[h_html].value, self.objects[h_url].value if h_url else None
+            # retained by the webview until the navigation finishes
+            navi = self.new_object(b'WKNavigation', autorelease=True)
+            self.retain(navi.handle)
+
+            def finish():
+                # a new document, with only what the user scripts set up
+                wv.prelude = next(filter(lambda n: n is not None, map(_prelude_log_batch, wv._user_scripts())), None)
+                if obj.handle in self.objects and (h_delegate := obj.attrs.get('delegate')):
+                    self.call_imp(h_delegate, b'webView:didFinishNavigation:', obj.handle, navi.handle)
+                self.release(navi.handle)
+            self.main_loop().after(wv.occupy(self.latency), finish)
+            return navi.handle
+
+        def call_async_js(b, obj: SimObject, h_script: int, h_args: int, h_frame: Optional[int], h_world: int, p_block: Any) -> None:
+            wv: SimObjCWebview = obj.value
+            source = self.objects[h_script].value
+            script, json_result = _untemplate(source)
+            block = _block_of(p_block)
+
+            def run_js():
+                if obj.handle not in self.objects:
+                    err = self._new_error(3, 'WKErrorDomain', 'The webview was freed before the script finished')
+                    _invoke_block(block, None, err)
+                    return
+                if (log_batch := _prelude_log_batch(source)) is not None:
+                    if wv.prelude is None:
+                        wv.prelude = log_batch
+                    _invoke_block(block, None, None)
+                    return
+                if wv.prelude is None:
+                    _invoke_block(block, None, self._new_error(4, 'WKErrorDomain', 'Error: No message handlers set up'))
+                    return
+                try:
+                    res = wv.run(self.engine, script)
+                except WKJS_UncaughtException as e:
+                    _invoke_block(block, None, self._new_error(e.code, e.domain, e.user_info))
+                    return
+                if json_result:
+                    s_res = None if res is None else json.dumps(
+                        res, default=lambda o: o.isoformat() if isinstance(o, dt.datetime) else None)
+                    _invoke_block(block, None if s_res is None else self.ns_from_py(s_res), None)
+                else:
+                    _invoke_block(block, self.ns_from_py(res) or None, None)
+            self.main_loop().after(wv.occupy(self.latency), run_js)
+
+        wkwebview.methods.update({
+            b'initWithFrame:configuration:': init,
+            b'setNavigationDelegate:': lambda b, obj, h: obj.attrs.__setitem__('delegate', h),  # weak
+            b'loadHTMLString:baseURL:': load_html,
+            b'callAsyncJavaScript:arguments:inFrame:inContentWorld:completionHandler:': call_async_js,
+            b'_webProcessIdentifier': lambda b, obj: obj.handle,
+        })
+
+    def _new_error(self, code: int, domain: Optional[str], user_info: Optional[str]) -> int:
+        err = self.new_object(b'NSError', (code, domain or 'WKErrorDomain'), autorelease=True)
+        uinfo = self.new_object(b'NSDictionary', [], autorelease=True)
+        uinfo.attrs['description'] = user_info or ''
+        err.attrs['userInfo'] = uinfo.handle
+        return err.handle
+
+
+def get_sim_objc_gen(
+    _logger: AbstractLogger,
+    *,
+    engine: SIM_ENGINE_TYPE = _default_engine,
+    latency: float = 0.0,
+    **kwargs,
+) -> Generator[SENDMSG_CBTYPE, None, None]:
+    """`api.get_gen` on a fresh SimObjCBackend, the rest of the arguments are passed to get_gen"""
+    return get_gen(_logger, backend=SimObjCBackend(engine=engine, latency=latency), **kwargs)
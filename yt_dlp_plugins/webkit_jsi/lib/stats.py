@@ -0,0 +1,134 @@
+"""
+Per-phase latencies of the tasks, collected when a WKJS_Stats is passed to get_gen (see WKJSE_Factory)
+"""
+
+import sys
+import time
+
+from threading import Lock
+from typing import Optional
+
+
+class LatencyHistogram:
+    """Keeps the latest `capacity` samples, which is enough for stable percentiles of a run"""
+    __slots__ = '_samples', '_next', 'count', 'total', 'capacity'
+
+    def __init__(self, capacity: int = 4096):
+        self._samples: list[float] = []
+        self._next = 0
+        self.count = 0
+        self.total = 0.0
+        self.capacity = capacity
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if len(self._samples) < self.capacity:
+            self._samples.append(seconds)
+        else:
+            self._samples[self._next] = seconds
+            self._next = (self._next + 1) % self.capacity
+
+    def percentiles(self, *ps: float) -> tuple[float, ...]:
+        if not self._samples:
+            return tuple(0.0 for _ in ps)
+        ordered = sorted(self._samples)
+        last = len(ordered) - 1
+        return tuple(ordered[min(last, int(p / 100 * len(ordered)))] for p in ps)
+
+    def summary(self) -> dict[str, float]:
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': p50,
+            'p95': p95,
+            'p99': p99,
+            'max': max(self._samples, default=0.0),
+        }
+
+
+class WKJS_PhaseTimer:
+    """Times consecutive phases of one task, each mark() ends the phase that started at the previous one"""
+    __slots__ = '_stats', '_task', '_start', '_last'
+
+    def __init__(self, stats: 'WKJS_Stats', task: str):
+        self._stats = stats
+        self._task = task
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self._stats.record(self._task, phase, now - self._last)
+        self._last = now
+
+    def done(self) -> None:
+        self._stats.record(self._task, 'total', time.perf_counter() - self._start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def mark(self, phase: str) -> None:
+        pass
+
+    def done(self) -> None:
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class WKJS_Stats:
+    __slots__ = '_lock', '_hists'
+
+    def __init__(self):
+        self._lock = Lock()
+        self._hists: dict[str, dict[str, LatencyHistogram]] = {}
+
+    def timer(self, task: str) -> WKJS_PhaseTimer:
+        return WKJS_PhaseTimer(self, task)
+
+    def record(self, task: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            phases = self._hists.get(task)
+            if phases is None:
+                phases = self._hists[task] = {}
+            hist = phases.get(phase)
+            if hist is None:
+                hist = phases[phase] = LatencyHistogram()
+            hist.add(seconds)
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """{task: {phase: {count, mean, p50, p95, p99, max}}}, in seconds"""
+        with self._lock:
+            return {task: {phase: hist.summary() for phase, hist in phases.items()} for task, phases in self._hists.items()}
+
+    def format(self) -> str:
+        lines = []
+        for task, phases in self.summary().items():
+            lines.append(f'{task}:')
+            for phase, s in phases.items():
+                lines.append(
+                    f'  {phase:>10}: n={s["count"]:<6} p50={s["p50"] * 1e3:8.3f}ms p95={s["p95"] * 1e3:8.3f}ms '
+                    f'p99={s["p99"] * 1e3:8.3f}ms max={s["max"] * 1e3:8.3f}ms')
+        return '\n'.join(lines)
+
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss() -> int:
+    """Bytes, the most this process has used so far, 0 if unknown"""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return rss if sys.platform == 'darwin' else rss << 10
+
+
+def timer_of(stats: Optional[WKJS_Stats], task: str):
+    return NULL_TIMER if stats is None else stats.timer(task)